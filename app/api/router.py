@@ -21,5 +21,5 @@ api_router.include_router(retrieval_route.router, tags=["retrieval"])
 api_router.include_router(operator_route.router, tags=["operator"])
 api_router.include_router(questions_answers_route.router, tags=["qa"])
 
-# 索引构建接口 /api/v1/index/build
+# 索引构建接口 /api/v1/index/build_*，异步索引任务 /api/v1/index/jobs/*
 api_router.include_router(index_route.router, tags=["index"])
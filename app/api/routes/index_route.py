@@ -1,14 +1,84 @@
 """索引构建 API 路由。"""
 
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile
 
-from app.service import index_service, operator_service
+from app.service import index_jobs, index_service, upload_spool
 
 router = APIRouter()
 
+_DOCUMENT_SUFFIXES = {
+    ".pdf",
+    ".doc",
+    ".docx",
+    ".ppt",
+    ".pptx",
+    ".txt",
+    ".html",
+    ".htm",
+    ".md",
+    ".markdown",
+}
+
+
+async def _spool(spool: upload_spool.UploadSpool, f: UploadFile, default_name: str) -> upload_spool.SpooledUpload:
+    try:
+        return await spool.add(f, default_name)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=400,
+            detail=f"读取文件失败: {f.filename or default_name}: {exc}",
+        ) from exc
+
+
+async def _spool_json_items(
+    files: List[UploadFile], spool: upload_spool.UploadSpool
+) -> List[Tuple[str, upload_spool.SpooledUpload]]:
+    items: List[Tuple[str, upload_spool.SpooledUpload]] = []
+    for f in files:
+        upload = await _spool(spool, f, "unknown.json")
+        items.append((upload.filename, upload))
+    return items
+
+
+async def _spool_markdown_items(
+    files: List[UploadFile], spool: upload_spool.UploadSpool
+) -> Tuple[List[Tuple[str, upload_spool.SpooledUpload]], List[str]]:
+    items: List[Tuple[str, upload_spool.SpooledUpload]] = []
+    skipped_files: List[str] = []
+    for f in files:
+        filename = f.filename or "unknown.md"
+        lower_name = filename.lower()
+        if not (lower_name.endswith(".md") or lower_name.endswith(".markdown")):
+            skipped_files.append(filename)
+            continue
+        items.append((filename, await _spool(spool, f, filename)))
+    return items, skipped_files
+
+
+async def _spool_document_items(
+    files: List[UploadFile], spool: upload_spool.UploadSpool
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """文档只落盘不解析：解析放到入库流水线的解析阶段，解析失败的文件记入 skipped_files。"""
+    items: List[Dict[str, Any]] = []
+    skipped_files: List[str] = []
+    for f in files:
+        filename = f.filename or "unknown.bin"
+        suffix = Path(filename).suffix.lower()
+        if suffix not in _DOCUMENT_SUFFIXES:
+            skipped_files.append(filename)
+            continue
+        items.append(
+            {
+                "filename": filename,
+                "file_type": suffix.lstrip(".") or "bin",
+                "upload": await _spool(spool, f, filename),
+            }
+        )
+    return items, skipped_files
+
 
 @router.post("/index/build_json")
 async def build_index(
@@ -19,25 +89,15 @@ async def build_index(
     if not files:
         raise HTTPException(status_code=400, detail="至少需要上传一个 JSON 文件")
 
-    items: List[tuple[str, str]] = []
-    for f in files:
+    with upload_spool.UploadSpool() as spool:
+        items = await _spool_json_items(files, spool)
         try:
-            raw = await f.read()
-            text = raw.decode("utf-8")
+            result = await index_service.build_index_from_json_contents(
+                kb_id=kb_id,
+                items=items,
+            )
         except Exception as exc:
-            raise HTTPException(
-                status_code=400,
-                detail=f"读取文件失败: {f.filename}: {exc}",
-            ) from exc
-        items.append((f.filename or "unknown.json", text))
-
-    try:
-        result = await index_service.build_index_from_json_contents(
-            kb_id=kb_id,
-            items=items,
-        )
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
 
     return result
 
@@ -51,40 +111,25 @@ async def build_markdown_index(
     if not files:
         raise HTTPException(status_code=400, detail="至少需要上传一个 Markdown 文件")
 
-    items: List[tuple[str, str]] = []
-    skipped_files: List[str] = []
-    for f in files:
-        filename = f.filename or "unknown.md"
-        lower_name = filename.lower()
-        if not (lower_name.endswith(".md") or lower_name.endswith(".markdown")):
-            skipped_files.append(filename)
-            continue
-        try:
-            raw = await f.read()
-            text = raw.decode("utf-8")
-        except Exception as exc:
-            raise HTTPException(
-                status_code=400,
-                detail=f"读取文件失败: {filename}: {exc}",
-            ) from exc
-        items.append((filename, text))
+    with upload_spool.UploadSpool() as spool:
+        items, skipped_files = await _spool_markdown_items(files, spool)
 
-    if not items:
-        return {
-            "kb_id": kb_id,
-            "total_documents": 0,
-            "total_chunks": 0,
-            "milvus_records": 0,
-            "skipped_files": skipped_files,
-        }
+        if not items:
+            return {
+                "kb_id": kb_id,
+                "total_documents": 0,
+                "total_chunks": 0,
+                "milvus_records": 0,
+                "skipped_files": skipped_files,
+            }
 
-    try:
-        result = await index_service.build_index_from_markdown_contents(
-            kb_id=kb_id,
-            items=items,
-        )
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
+        try:
+            result = await index_service.build_index_from_markdown_contents(
+                kb_id=kb_id,
+                items=items,
+            )
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
 
     if skipped_files:
         result["skipped_files"] = list(result.get("skipped_files", [])) + skipped_files
@@ -96,76 +141,112 @@ async def build_documents_index(
     kb_id: int = Form(..., description="知识库 ID"),
     files: List[UploadFile] = File(..., description="文档文件列表（PDF/Word/PPT/HTML/TXT 等）"),
 ):
-    """批量上传文档文件，先解析内容，再为指定知识库构建索引。"""
+    """批量上传文档文件并为指定知识库构建索引（文档在入库流水线的解析阶段逐个解析）。"""
     if not files:
         raise HTTPException(status_code=400, detail="至少需要上传一个文档文件")
 
-    allowed_suffixes = {
-        ".pdf",
-        ".doc",
-        ".docx",
-        ".ppt",
-        ".pptx",
-        ".txt",
-        ".html",
-        ".htm",
-        ".md",
-        ".markdown",
-    }
-
-    parsed_items: List[Dict[str, Any]] = []
-    skipped_files: List[str] = []
+    with upload_spool.UploadSpool() as spool:
+        document_items, skipped_files = await _spool_document_items(files, spool)
 
-    for f in files:
-        filename = f.filename or "unknown.bin"
-        suffix = Path(filename).suffix.lower()
-        if suffix not in allowed_suffixes:
-            skipped_files.append(filename)
-            continue
+        if not document_items:
+            return {
+                "kb_id": kb_id,
+                "total_documents": 0,
+                "total_chunks": 0,
+                "milvus_records": 0,
+                "skipped_files": skipped_files,
+            }
 
         try:
-            raw = await f.read()
+            result = await index_service.build_index_from_parsed_document_contents(
+                kb_id=kb_id,
+                items=document_items,
+            )
         except Exception as exc:
-            raise HTTPException(
-                status_code=400,
-                detail=f"读取文件失败: {filename}: {exc}",
-            ) from exc
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
 
-        try:
-            parsed = operator_service.parse_uploaded_file(raw, filename)
-        except Exception as exc:
-            skipped_files.append(filename)
-            continue
+    if skipped_files:
+        result["skipped_files"] = list(result.get("skipped_files", [])) + skipped_files
+    return result
 
-        metadata = parsed.get("metadata", {}) if isinstance(parsed, dict) else {}
-        title = metadata.get("title", "") if isinstance(metadata, dict) else ""
-        parsed_items.append(
-            {
-                "filename": filename,
-                "file_type": suffix.lstrip(".") or "bin",
-                "title": title,
-                "content": parsed.get("content", "") if isinstance(parsed, dict) else "",
-            }
-        )
 
-    if not parsed_items:
-        return {
-            "kb_id": kb_id,
-            "total_documents": 0,
-            "total_chunks": 0,
-            "milvus_records": 0,
-            "skipped_files": skipped_files,
-        }
+# ===========================
+# 异步索引任务：提交后立即返回 job_id，后台执行
+# ===========================
 
+
+async def _submit_job(kind: str, kb_id: int, items: List[Any], skipped_files: List[str]) -> Dict[str, Any]:
+    """提交任务；落盘暂存的上传文件由任务移入自己的目录，请求结束后仍可用于执行与 resume。"""
+    if not items:
+        raise HTTPException(status_code=400, detail=f"没有可入库的文件，跳过的文件: {skipped_files}")
+    job = await index_jobs.get_manager().submit(kind, kb_id, items, skipped_files=skipped_files)
+    return job.to_dict()
+
+
+@router.post("/index/jobs/build_json")
+async def submit_build_json_job(
+    kb_id: int = Form(..., description="知识库 ID"),
+    files: List[UploadFile] = File(..., description="包含论文 JSON 的文件列表"),
+):
+    """提交 JSON 批量入库任务，返回 job_id。"""
+    with upload_spool.UploadSpool() as spool:
+        return await _submit_job("json", kb_id, await _spool_json_items(files, spool), [])
+
+
+@router.post("/index/jobs/build_markdown")
+async def submit_build_markdown_job(
+    kb_id: int = Form(..., description="知识库 ID"),
+    files: List[UploadFile] = File(..., description="Markdown 文件列表"),
+):
+    """提交 Markdown 批量入库任务，返回 job_id。"""
+    with upload_spool.UploadSpool() as spool:
+        items, skipped_files = await _spool_markdown_items(files, spool)
+        return await _submit_job("markdown", kb_id, items, skipped_files)
+
+
+@router.post("/index/jobs/build_documents")
+async def submit_build_documents_job(
+    kb_id: int = Form(..., description="知识库 ID"),
+    files: List[UploadFile] = File(..., description="文档文件列表（PDF/Word/PPT/HTML/TXT 等）"),
+):
+    """提交文档批量入库任务（文档在任务执行时解析），返回 job_id。"""
+    with upload_spool.UploadSpool() as spool:
+        document_items, skipped_files = await _spool_document_items(files, spool)
+        return await _submit_job("documents", kb_id, document_items, skipped_files)
+
+
+@router.get("/index/jobs")
+async def list_index_jobs():
+    """列出索引任务（按提交时间倒序）。"""
+    return [job.to_dict() for job in index_jobs.get_manager().list_jobs()]
+
+
+@router.get("/index/jobs/{job_id}")
+async def get_index_job(job_id: str):
+    """查询任务状态与进度（已完成文档 / chunk 数、吞吐、预计剩余秒数）。"""
     try:
-        result = await index_service.build_index_from_parsed_document_contents(
-            kb_id=kb_id,
-            items=parsed_items,
-        )
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
+        return index_jobs.get_manager().get(job_id).to_dict()
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}") from exc
+
+
+@router.post("/index/jobs/{job_id}/cancel")
+async def cancel_index_job(job_id: str):
+    """取消任务：运行中的任务处理完在途文件后停止，已完成的文件保留 checkpoint。"""
+    try:
+        return index_jobs.get_manager().cancel(job_id).to_dict()
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}") from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
 
-    if skipped_files:
-        result["skipped_files"] = list(result.get("skipped_files", [])) + skipped_files
-    return result
 
+@router.post("/index/jobs/{job_id}/resume")
+async def resume_index_job(job_id: str):
+    """恢复失败或已取消的任务，跳过 checkpoint 中已完成的文件。"""
+    try:
+        return index_jobs.get_manager().resume(job_id).to_dict()
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}") from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
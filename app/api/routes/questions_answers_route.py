@@ -1,17 +1,14 @@
 
 from fastapi import APIRouter
 import logging
-from app.service.rag.RAG_flow import DeepSeekClient, RAGFlow
-from app.service import retrieval_service
+from app.service.rag import latency_budget
+from app.service.rag.RAG_flow import get_rag_engine
+from app.service import instrumentation, llm_scheduler, retrieval_service
 from app.api.schemas.retrieval import (
     QaRequest,
 )
 logger = logging.getLogger(__name__)
 router = APIRouter()
-API_KEY = "sk-9e728482e15f4cecba9ead88ff7e9cc8"
-BASE_URL = "https://api.deepseek.com"
-MODEL = "deepseek-chat"
-deepSeekClient = DeepSeekClient(API_KEY,BASE_URL,MODEL)
 
 
 @router.post("/process/stream")
@@ -75,10 +72,26 @@ def process_text_stream_api(req: QaRequest):
                 "content": prompt
             }
         ]
-        return deepSeekClient.chat_completion(messages)
+        budget = latency_budget.LatencyBudget(deadline_ms=req.deadline_ms, latency_tier=req.latency_tier)
+        with latency_budget.activate(budget):
+            return get_rag_engine().deepseek.chat_completion(messages, stage="generation")
     else:
-        rag = RAGFlow()
-        return rag.run(text,doc_id=doc_id,kb_id=kb_id,security_level=security_level)
+        return get_rag_engine().run(
+            text,
+            doc_id=doc_id,
+            kb_id=kb_id,
+            security_level=security_level,
+            deadline_ms=req.deadline_ms,
+            latency_tier=req.latency_tier,
+        )
+
+
+@router.get("/process/metrics")
+def process_metrics_api():
+    """RAG 流程各阶段耗时、LLM 调用 token/缓存命中/排队耗时的进程内聚合直方图，以及 LLM 调度器当前状态。"""
+    snapshot = instrumentation.metrics.snapshot()
+    snapshot["llm_scheduler"] = llm_scheduler.get_scheduler().stats()
+    return snapshot
 
 
 
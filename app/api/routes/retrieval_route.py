@@ -47,6 +47,30 @@ async def _result_to_dict(
     }
 
 
+async def _build_response(results, req) -> dict:
+    """按 result_mode 组装响应：chunk 级逐条返回，parent 级按父块聚合（每个父块只查询一次）。"""
+    if req.result_mode == "parent":
+        parents = await retrieval_service.aggregate_results_by_parent(results, scoring=req.parent_scoring)
+        if req.return_original_text is True:
+            original_texts: dict = {}
+            for p in parents:
+                doc_id = p.get("doc_id")
+                if isinstance(doc_id, int) and doc_id not in original_texts:
+                    original_texts[doc_id] = await retrieval_service.get_original_text_by_doc_id(doc_id)
+                p["original_text"] = original_texts.get(doc_id, "")
+        return {"results": parents}
+
+    result_dicts = []
+    for r in results:
+        d = await _result_to_dict(
+            r,
+            return_original_text=req.return_original_text is True,
+            return_parent_chunk=req.return_parent_chunk is True,
+        )
+        result_dicts.append(d)
+    return {"results": result_dicts}
+
+
 @router.post("/semantic")
 async def semantic_search(req: SemanticSearchRequest):
     """语义检索。"""
@@ -62,16 +86,13 @@ async def semantic_search(req: SemanticSearchRequest):
             doc_id=req.doc_id,
             kb_id=req.kb_id,
             security_level=req.security_level,
+            min_structure_scores=req.min_structure_scores,
+            group_by_doc=req.group_by_doc,
+            group_size=req.group_size,
+            coarse_to_fine=req.coarse_to_fine,
+            coarse_top_n=req.coarse_top_n,
         )
-        result_dicts = []
-        for r in results:
-            d = await _result_to_dict(
-                r,
-                return_original_text=req.return_original_text is True,
-                return_parent_chunk=req.return_parent_chunk is True,
-            )
-            result_dicts.append(d)
-        return {"results": result_dicts}
+        return await _build_response(results, req)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -90,16 +111,9 @@ async def keyword_search(req: KeywordSearchRequest):
             doc_id=req.doc_id,
             kb_id=req.kb_id,
             security_level=req.security_level,
+            min_structure_scores=req.min_structure_scores,
         )
-        result_dicts = []
-        for r in results:
-            d = await _result_to_dict(
-                r,
-                return_original_text=req.return_original_text is True,
-                return_parent_chunk=req.return_parent_chunk is True,
-            )
-            result_dicts.append(d)
-        return {"results": result_dicts}
+        return await _build_response(results, req)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -121,16 +135,13 @@ async def hybrid_search(req: HybridSearchRequest):
             doc_id=req.doc_id,
             kb_id=req.kb_id,
             security_level=req.security_level,
+            min_structure_scores=req.min_structure_scores,
+            group_by_doc=req.group_by_doc,
+            group_size=req.group_size,
+            coarse_to_fine=req.coarse_to_fine,
+            coarse_top_n=req.coarse_top_n,
         )
-        result_dicts = []
-        for r in results:
-            d = await _result_to_dict(
-                r,
-                return_original_text=req.return_original_text is True,
-                return_parent_chunk=req.return_parent_chunk is True,
-            )
-            result_dicts.append(d)
-        return {"results": result_dicts}
+        return await _build_response(results, req)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -150,16 +161,9 @@ async def fulltext_search(req: FulltextSearchRequest):
             doc_id=req.doc_id,
             kb_id=req.kb_id,
             security_level=req.security_level,
+            min_structure_scores=req.min_structure_scores,
         )
-        result_dicts = []
-        for r in results:
-            d = await _result_to_dict(
-                r,
-                return_original_text=req.return_original_text is True,
-                return_parent_chunk=req.return_parent_chunk is True,
-            )
-            result_dicts.append(d)
-        return {"results": result_dicts}
+        return await _build_response(results, req)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -179,16 +183,9 @@ async def text_match_search(req: TextMatchSearchRequest):
             doc_id=req.doc_id,
             kb_id=req.kb_id,
             security_level=req.security_level,
+            min_structure_scores=req.min_structure_scores,
         )
-        result_dicts = []
-        for r in results:
-            d = await _result_to_dict(
-                r,
-                return_original_text=req.return_original_text is True,
-                return_parent_chunk=req.return_parent_chunk is True,
-            )
-            result_dicts.append(d)
-        return {"results": result_dicts}
+        return await _build_response(results, req)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -208,15 +205,8 @@ async def phrase_match_search(req: PhraseMatchSearchRequest):
             doc_id=req.doc_id,
             kb_id=req.kb_id,
             security_level=req.security_level,
+            min_structure_scores=req.min_structure_scores,
         )
-        result_dicts = []
-        for r in results:
-            d = await _result_to_dict(
-                r,
-                return_original_text=req.return_original_text is True,
-                return_parent_chunk=req.return_parent_chunk is True,
-            )
-            result_dicts.append(d)
-        return {"results": result_dicts}
+        return await _build_response(results, req)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,6 @@
 """检索 API 请求/响应模型。"""
 
-from typing import Any, List, Union
+from typing import Any, Dict, List, Literal, Union
 
 from pydantic import BaseModel, Field
 
@@ -17,6 +17,43 @@ def _security_level_field() -> Any:
     return Field(None, description="密级过滤，支持单值或数组")
 
 
+def _min_structure_scores_field() -> Any:
+    return Field(
+        None,
+        description="结构特征得分下限过滤，如 {\"table_score\": 0.5}；可用字段 table_score / citation_score / formula_score",
+    )
+
+
+def _group_by_doc_field() -> Any:
+    return Field(False, description="按文档分组返回：top_k 视为文档数，每篇文档最多返回 group_size 个 chunk")
+
+
+def _group_size_field() -> Any:
+    return Field(None, ge=1, le=20, description="按文档分组时每篇文档返回的 chunk 数，默认 3")
+
+
+def _coarse_to_fine_field() -> Any:
+    return Field(
+        None,
+        description="两阶段检索：先在文档级向量上选出 coarse_top_n 篇候选文档，再只在这些文档内检索 chunk；默认读取 RETRIEVAL_COARSE_TO_FINE",
+    )
+
+
+def _coarse_top_n_field() -> Any:
+    return Field(None, ge=1, le=1000, description="两阶段检索第一阶段的候选文档数，默认读取 RETRIEVAL_COARSE_TOP_N")
+
+
+def _result_mode_field() -> Any:
+    return Field(
+        "chunk",
+        description="结果粒度：chunk 逐条返回命中块；parent 按父块聚合同一父块下的子块，父块只查询一次并高亮命中子块",
+    )
+
+
+def _parent_scoring_field() -> Any:
+    return Field("max", description="parent 模式下父块得分：max 取子块最高分，sum 累加子块得分")
+
+
 class SemanticSearchRequest(BaseModel):
     """语义检索请求。"""
 
@@ -30,8 +67,15 @@ class SemanticSearchRequest(BaseModel):
     doc_id: Union[int, List[int], None] = _doc_id_field()
     kb_id: Union[int, List[int], None] = _kb_id_field()
     security_level: Union[int, List[int], None] = _security_level_field()
+    min_structure_scores: Dict[str, float] | None = _min_structure_scores_field()
+    group_by_doc: bool = _group_by_doc_field()
+    group_size: int | None = _group_size_field()
+    coarse_to_fine: bool | None = _coarse_to_fine_field()
+    coarse_top_n: int | None = _coarse_top_n_field()
     return_original_text: bool | None = Field(None, description="是否返回全文")
     return_parent_chunk: bool | None = Field(None, description="是否返回父 chunk")
+    result_mode: Literal["chunk", "parent"] = _result_mode_field()
+    parent_scoring: Literal["max", "sum"] = _parent_scoring_field()
 
 
 class KeywordSearchRequest(BaseModel):
@@ -45,9 +89,12 @@ class KeywordSearchRequest(BaseModel):
     doc_id: Union[int, List[int], None] = _doc_id_field()
     kb_id: Union[int, List[int], None] = _kb_id_field()
     security_level: Union[int, List[int], None] = _security_level_field()
+    min_structure_scores: Dict[str, float] | None = _min_structure_scores_field()
     min_match_count: int | None = Field(None, ge=0, description="最少匹配关键词数量，少于此值返回分数0")
     return_original_text: bool | None = Field(None, description="是否返回全文")
     return_parent_chunk: bool | None = Field(None, description="是否返回父 chunk")
+    result_mode: Literal["chunk", "parent"] = _result_mode_field()
+    parent_scoring: Literal["max", "sum"] = _parent_scoring_field()
 
 
 class HybridSearchRequest(BaseModel):
@@ -63,10 +110,17 @@ class HybridSearchRequest(BaseModel):
     doc_id: Union[int, List[int], None] = _doc_id_field()
     kb_id: Union[int, List[int], None] = _kb_id_field()
     security_level: Union[int, List[int], None] = _security_level_field()
+    min_structure_scores: Dict[str, float] | None = _min_structure_scores_field()
+    group_by_doc: bool = _group_by_doc_field()
+    group_size: int | None = _group_size_field()
+    coarse_to_fine: bool | None = _coarse_to_fine_field()
+    coarse_top_n: int | None = _coarse_top_n_field()
     semantic_weight: float | None = Field(None, ge=0, le=1, description="语义检索权重，建议与keyword_weight和为1.0")
     keyword_weight: float | None = Field(None, ge=0, le=1, description="关键词检索权重")
     return_original_text: bool | None = Field(None, description="是否返回全文")
     return_parent_chunk: bool | None = Field(None, description="是否返回父 chunk")
+    result_mode: Literal["chunk", "parent"] = _result_mode_field()
+    parent_scoring: Literal["max", "sum"] = _parent_scoring_field()
 
 
 class FulltextSearchRequest(BaseModel):
@@ -80,10 +134,13 @@ class FulltextSearchRequest(BaseModel):
     doc_id: Union[int, List[int], None] = _doc_id_field()
     kb_id: Union[int, List[int], None] = _kb_id_field()
     security_level: Union[int, List[int], None] = _security_level_field()
+    min_structure_scores: Dict[str, float] | None = _min_structure_scores_field()
     min_match_count: int | None = Field(None, ge=0, description="最少匹配关键词数量")
     match_mode: str | None = Field(None, description="匹配模式：or(任一匹配)/and(全部匹配)")
     return_original_text: bool | None = Field(None, description="是否返回全文")
     return_parent_chunk: bool | None = Field(None, description="是否返回父 chunk")
+    result_mode: Literal["chunk", "parent"] = _result_mode_field()
+    parent_scoring: Literal["max", "sum"] = _parent_scoring_field()
 
 
 class TextMatchSearchRequest(BaseModel):
@@ -97,10 +154,13 @@ class TextMatchSearchRequest(BaseModel):
     doc_id: Union[int, List[int], None] = _doc_id_field()
     kb_id: Union[int, List[int], None] = _kb_id_field()
     security_level: Union[int, List[int], None] = _security_level_field()
+    min_structure_scores: Dict[str, float] | None = _min_structure_scores_field()
     match_type: str | None = Field(None, description="匹配类型：exact(精确)/fuzzy(模糊)")
     case_sensitive: bool | None = Field(None, description="是否区分大小写")
     return_original_text: bool | None = Field(None, description="是否返回全文")
     return_parent_chunk: bool | None = Field(None, description="是否返回父 chunk")
+    result_mode: Literal["chunk", "parent"] = _result_mode_field()
+    parent_scoring: Literal["max", "sum"] = _parent_scoring_field()
 
 
 class PhraseMatchSearchRequest(BaseModel):
@@ -114,10 +174,13 @@ class PhraseMatchSearchRequest(BaseModel):
     doc_id: Union[int, List[int], None] = _doc_id_field()
     kb_id: Union[int, List[int], None] = _kb_id_field()
     security_level: Union[int, List[int], None] = _security_level_field()
+    min_structure_scores: Dict[str, float] | None = _min_structure_scores_field()
     case_sensitive: bool | None = Field(None, description="是否区分大小写")
     allow_partial: bool | None = Field(None, description="是否允许部分匹配")
     return_original_text: bool | None = Field(None, description="是否返回全文")
     return_parent_chunk: bool | None = Field(None, description="是否返回父 chunk")
+    result_mode: Literal["chunk", "parent"] = _result_mode_field()
+    parent_scoring: Literal["max", "sum"] = _parent_scoring_field()
 
 
 class QaRequest(BaseModel):
@@ -126,4 +189,8 @@ class QaRequest(BaseModel):
     rag_type: int = Field(..., description="RAG实现方式，1旧版本，2新版本")
     doc_id: Union[int, List[int], None] = _doc_id_field()
     kb_id: Union[int, List[int], None] = _kb_id_field()
-    security_level: Union[int, List[int], None] = _security_level_field()
\ No newline at end of file
+    security_level: Union[int, List[int], None] = _security_level_field()
+    deadline_ms: int | None = Field(None, ge=100, description="延迟预算（毫秒），据此裁剪迭代轮数、证据数量与融合/判定阶段")
+    latency_tier: Literal["interactive", "standard", "thorough"] | None = Field(
+        None, description="延迟档位：interactive(交互，单轮)/standard(最多两轮)/thorough(完整流程)"
+    )
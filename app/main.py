@@ -4,11 +4,28 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from app.api import api_router
+from app.service.env_utils import is_truthy_env
+from app.service.rag.RAG_flow import get_rag_engine, set_console_echo
+
+# 服务模式下关闭 RAG 流程的终端逐步输出（结构化 trace 仍写入 rag_flow.log），需要时设置 RAG_CONSOLE_ECHO=true
+set_console_echo(is_truthy_env("RAG_CONSOLE_ECHO", False))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时构建共享 RAG 引擎并预热模型，所有请求复用。"""
+    get_rag_engine().warm_up()
+    yield
+
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Agentic RAG Server",
     description="RAG 能力的 API 服务，提供检索增强生成接口",
     version="0.1.0",
@@ -20,7 +37,6 @@ app.include_router(api_router, prefix="/api/v1")
 
 def run():
     """命令行启动入口。"""
-    import os
     import uvicorn
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "5010"))
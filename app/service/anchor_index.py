@@ -0,0 +1,263 @@
+"""锚点 / 关键事实倒排索引。
+
+入库时对每个 chunk 抽取：
+- 锚点：拉丁字母开头、形如方法名/缩写/符号的 token（ACAttack、ISSU-Train、SAM2.1、L_st）
+- 关键事实：等式型事实（s = 5）以及同时包含锚点与数值/等式的句子
+写入本地 SQLite（锚点 -> chunk_id 倒排表 + chunk 事实表），按集合、kb_id、security_level、doc_id 过滤。
+RAG 流程据此直接取回命中锚点的 chunk 事实作为证据，无需 LLM 证据抽取即可让规则 Judge 判定。
+文档删除 / 更新时按 doc_id 清理。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+from app.service.env_utils import is_truthy_env
+
+logger = logging.getLogger(__name__)
+
+# 与 RAGFlow._extract_anchors / _rule_based_sufficiency 共用的模式
+ANCHOR_RE = re.compile(r"[A-Za-z][A-Za-z0-9_.\-]{1,}")
+NUMBER_OR_EQ_RE = re.compile(r"(\b\d+(\.\d+)?\b|=|×|x|帧|epoch|mAP|EAO|IoU)")
+# 入库抽取事实句只看数值 / 等式本身（NUMBER_OR_EQ_RE 中的 x、指标名等仅在判定时作为辅助信号）
+NUMERIC_FACT_RE = re.compile(r"(\b\d+(\.\d+)?\b|=|×)")
+# 等式型事实：变量 = 数值（如 s = 5、L_st=0.3、\lambda = 1e-4）
+EQUATION_FACT_RE = re.compile(r"(\\?[A-Za-z][A-Za-z0-9_{}\\]{0,15})\s*=\s*(-?\d+(?:\.\d+)?(?:[eE]-?\d+)?%?)")
+# 中文句末标点后直接断句；英文句末标点后须有空白才断句，避免把 85.3、SAM2.1 之类的小数 / 版本号拆开
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[。！？；])\s*|(?<=[.!?;])\s+|\n+")
+
+_MAX_FACT_SENTENCES = 6
+_MAX_SENTENCE_CHARS = 240
+_MAX_KEY_FACTS = 8
+
+_DEFAULT_DB_PATH = Path(__file__).resolve().parents[2] / "data" / "anchor_index.db"
+
+
+def is_anchor_token(token: str) -> bool:
+    """
+    只把“像锚点”的 token 写入索引：首字母之后含大写、数字或 _ . - 的 token（缩写、方法名、符号），
+    普通英文单词（the、Model）不入索引，保持倒排表紧凑。
+    """
+    if len(token) < 2:
+        return False
+    rest = token[1:]
+    return any(ch.isupper() or ch.isdigit() or ch in "_.-" for ch in rest)
+
+
+def extract_anchor_tokens(text: str) -> List[str]:
+    """按出现顺序去重返回文本中的锚点 token（去掉句末标点）。"""
+    out: List[str] = []
+    seen = set()
+    for tok in ANCHOR_RE.findall(text or ""):
+        tok = tok.rstrip(".-")
+        if tok not in seen and is_anchor_token(tok):
+            seen.add(tok)
+            out.append(tok)
+    return out
+
+
+def extract_chunk_facts(content: str) -> Dict[str, Any]:
+    """
+    抽取单个 chunk 的锚点与关键事实。
+    Returns:
+        {"anchors": [...], "key_facts": ["s = 5", ...], "sentences": [含锚点且含数值/等式的句子]}
+    """
+    text = (content or "").strip()
+    if not text:
+        return {"anchors": [], "key_facts": [], "sentences": []}
+
+    anchors = extract_anchor_tokens(text)
+    key_facts: List[str] = []
+    for m in EQUATION_FACT_RE.finditer(text):
+        fact = f"{m.group(1)} = {m.group(2)}"
+        if fact not in key_facts:
+            key_facts.append(fact)
+        if len(key_facts) >= _MAX_KEY_FACTS:
+            break
+
+    sentences: List[str] = []
+    if anchors:
+        anchor_set = set(anchors)
+        for sent in _SENTENCE_SPLIT_RE.split(text):
+            sent = sent.strip()
+            if not sent or not NUMERIC_FACT_RE.search(sent):
+                continue
+            if not anchor_set.intersection(extract_anchor_tokens(sent)):
+                continue
+            sentences.append(sent[:_MAX_SENTENCE_CHARS])
+            if len(sentences) >= _MAX_FACT_SENTENCES:
+                break
+    return {"anchors": anchors, "key_facts": key_facts, "sentences": sentences}
+
+
+def _to_id_list(val: Union[int, Sequence[int], None]) -> Optional[List[int]]:
+    if val is None:
+        return None
+    if isinstance(val, (list, tuple, set)):
+        ids = [int(x) for x in val if x is not None]
+        return ids or None
+    return [int(val)]
+
+
+class AnchorIndex:
+    """SQLite 存储的锚点倒排索引（单连接 + 锁，读写均很轻量）。"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS anchor_postings (
+                collection TEXT NOT NULL,
+                anchor TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                doc_id INTEGER,
+                kb_id INTEGER,
+                security_level INTEGER,
+                PRIMARY KEY (collection, anchor, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_anchor_postings_doc ON anchor_postings (collection, doc_id);
+            CREATE TABLE IF NOT EXISTS chunk_facts (
+                collection TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                doc_id INTEGER,
+                doc_title TEXT,
+                key_facts TEXT,
+                sentences TEXT,
+                PRIMARY KEY (collection, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunk_facts_doc ON chunk_facts (collection, doc_id);
+            """
+        )
+        self._conn.commit()
+
+    def add_records(self, collection: str, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        写入一批 Milvus 记录（需包含最终的 id、doc_id、kb_id、security_level、content、title）。
+        只有含事实句（锚点 + 数值/等式）的 chunk 才写入；返回写入的倒排条目数。
+        """
+        postings: List[tuple] = []
+        facts_rows: List[tuple] = []
+        for rec in records:
+            chunk_id = rec.get("id")
+            if chunk_id is None:
+                continue
+            facts = extract_chunk_facts(rec.get("content") or "")
+            # 查询只返回带事实句的 chunk，没有事实句的 chunk 不必写倒排
+            if not facts["anchors"] or not facts["sentences"]:
+                continue
+            doc_id = rec.get("doc_id")
+            for anchor in facts["anchors"]:
+                postings.append((collection, anchor, int(chunk_id), doc_id, rec.get("kb_id"), rec.get("security_level")))
+            facts_rows.append(
+                (
+                    collection,
+                    int(chunk_id),
+                    doc_id,
+                    rec.get("title") or "",
+                    json.dumps(facts["key_facts"], ensure_ascii=False),
+                    json.dumps(facts["sentences"], ensure_ascii=False),
+                )
+            )
+        if not postings:
+            return 0
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO anchor_postings VALUES (?, ?, ?, ?, ?, ?)", postings)
+            self._conn.executemany("INSERT OR REPLACE INTO chunk_facts VALUES (?, ?, ?, ?, ?, ?)", facts_rows)
+            self._conn.commit()
+        return len(postings)
+
+    def delete_doc(self, collection: str, doc_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM anchor_postings WHERE collection = ? AND doc_id = ?", (collection, doc_id))
+            self._conn.execute("DELETE FROM chunk_facts WHERE collection = ? AND doc_id = ?", (collection, doc_id))
+            self._conn.commit()
+
+    def lookup(
+        self,
+        collection: str,
+        anchors: Sequence[str],
+        doc_id: Union[int, Sequence[int], None] = None,
+        kb_id: Union[int, Sequence[int], None] = None,
+        security_level: Union[int, Sequence[int], None] = None,
+        limit: int = 5,
+    ) -> List[Dict[str, Any]]:
+        """
+        按锚点查找带事实的 chunk：命中锚点数多者优先，并只保留包含查询锚点的事实句。
+        Returns:
+            [{"chunk_id", "doc_id", "doc_title", "matched_anchors", "key_facts", "sentences"}, ...]
+        """
+        anchors = [a for a in dict.fromkeys(anchors) if is_anchor_token(a)]
+        if not anchors:
+            return []
+        sql = [
+            "SELECT p.chunk_id, p.doc_id, f.doc_title, f.key_facts, f.sentences, GROUP_CONCAT(p.anchor, char(31))",
+            "FROM anchor_postings p JOIN chunk_facts f ON f.collection = p.collection AND f.chunk_id = p.chunk_id",
+            f"WHERE p.collection = ? AND p.anchor IN ({', '.join('?' * len(anchors))})",
+        ]
+        params: List[Any] = [collection, *anchors]
+        for field, val in (("doc_id", doc_id), ("kb_id", kb_id), ("security_level", security_level)):
+            ids = _to_id_list(val)
+            if ids is not None:
+                sql.append(f"AND p.{field} IN ({', '.join('?' * len(ids))})")
+                params.extend(ids)
+        sql.append("GROUP BY p.chunk_id ORDER BY COUNT(*) DESC, p.chunk_id LIMIT ?")
+        params.append(max(1, int(limit)) * 4)
+        with self._lock:
+            rows = self._conn.execute(" ".join(sql), params).fetchall()
+
+        hits: List[Dict[str, Any]] = []
+        for chunk_id, hit_doc_id, doc_title, key_facts_json, sentences_json, matched in rows:
+            matched_anchors = matched.split(chr(31)) if matched else []
+            sentences = [s for s in json.loads(sentences_json or "[]") if any(a in s for a in matched_anchors)]
+            if not sentences:
+                continue
+            # 只保留出现在命中句中的等式事实，避免无关事实触发规则判定
+            key_facts = [
+                kf
+                for kf in json.loads(key_facts_json or "[]")
+                if any(all(part in s for part in kf.split(" = ")) for s in sentences)
+            ]
+            hits.append(
+                {
+                    "chunk_id": chunk_id,
+                    "doc_id": hit_doc_id,
+                    "doc_title": doc_title or "",
+                    "matched_anchors": matched_anchors,
+                    "key_facts": key_facts,
+                    "sentences": sentences,
+                }
+            )
+            if len(hits) >= limit:
+                break
+        return hits
+
+
+_index_lock = threading.Lock()
+_index: Optional[AnchorIndex] = None
+
+
+def is_enabled() -> bool:
+    return is_truthy_env("RAG_ANCHOR_INDEX", True)
+
+
+def get_anchor_index() -> AnchorIndex:
+    """获取进程级锚点索引（路径由 ANCHOR_INDEX_PATH 指定，默认 data/anchor_index.db）。"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = os.getenv("ANCHOR_INDEX_PATH", "").strip() or _DEFAULT_DB_PATH
+                _index = AnchorIndex(path)
+    return _index
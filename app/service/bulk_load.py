@@ -0,0 +1,247 @@
+"""离线批量入库的列式分片与断点续传清单。
+
+初次灌库（数千篇论文、百万级 chunk）不走 HTTP 上传 + 逐条写入，而是分两步：
+1. 导出：本地切片、编码，记录按 BULK_SHARD_RECORDS 条切成分片流式写出，每个分片一个目录，按字段列式存储：
+   向量为 float32 二维数组（{字段}.npy），数值为 int64 / float32 / bool 数组，字符串变长存储
+   （{字段}.utf8.npy 为 UTF-8 字节、{字段}.offsets.npy 为各值的起止偏移），列类型记在 columns.json。
+   chunk 记录（chunks/）不存标题、摘要等文档级字段，这些字段每篇文档只在 docs/ 中存一份，
+   加载时目标集合含这些字段（非规范化布局）再按 doc_id 回填
+2. 导入：逐个分片本地大批量写入，或在加载前把分片转为 Milvus 行式 JSON 后经 Milvus bulk import 导入
+
+manifest.json 记录导出参数、已写入分片的文件、各分片的加载状态；导出 / 导入中断后重跑会跳过已完成的部分。
+chunk 与文档 id 均由文件名与内容确定性生成，重跑得到相同的 id，半途失败的分片可按 doc_id 先删后重写。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+CHUNK_PART = "chunks"
+DOC_PART = "docs"
+COLUMNS_NAME = "columns.json"
+
+# 分片加载状态
+SHARD_PENDING = "pending"
+SHARD_LOADING = "loading"
+SHARD_LOADED = "loaded"
+
+
+def _column_kind(values: Sequence[Any]) -> str:
+    """按首个非空值判断列类型：vector / bool / int / float / str / json。"""
+    first = next((v for v in values if v is not None), "")
+    if isinstance(first, np.ndarray) or (
+        isinstance(first, (list, tuple)) and all(isinstance(x, (int, float)) for x in first)
+    ):
+        return "vector"
+    if isinstance(first, bool):
+        return "bool"
+    if isinstance(first, int):
+        return "int"
+    if isinstance(first, float):
+        return "float"
+    if isinstance(first, str):
+        return "str"
+    return "json"
+
+
+_NUMERIC_DTYPES = {"bool": np.bool_, "int": np.int64, "float": np.float32}
+
+
+def _write_column(part_dir: Path, field: str, kind: str, values: Sequence[Any]) -> None:
+    if kind == "vector":
+        np.save(part_dir / f"{field}.npy", np.asarray(values, dtype=np.float32), allow_pickle=False)
+        return
+    if kind in _NUMERIC_DTYPES:
+        np.save(part_dir / f"{field}.npy", np.asarray(values, dtype=_NUMERIC_DTYPES[kind]), allow_pickle=False)
+        return
+    # 字符串按变长存储：全部 UTF-8 字节拼接为一个 uint8 数组，另存 n+1 个 int64 偏移量；
+    # 定长 unicode 数组会把每个值补齐到最长值（UTF-32），长正文列的磁盘与内存占用成倍放大
+    encoded = [
+        (v if kind == "str" else json.dumps(v, ensure_ascii=False)).encode("utf-8") if v is not None else b""
+        for v in values
+    ]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(part_dir / f"{field}.utf8.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8), allow_pickle=False)
+    np.save(part_dir / f"{field}.offsets.npy", offsets, allow_pickle=False)
+
+
+def _read_column(part_dir: Path, field: str, kind: str) -> List[Any]:
+    if kind == "vector" or kind in _NUMERIC_DTYPES:
+        return np.load(part_dir / f"{field}.npy", allow_pickle=False).tolist()
+    data = np.load(part_dir / f"{field}.utf8.npy", allow_pickle=False).tobytes()
+    offsets = np.load(part_dir / f"{field}.offsets.npy", allow_pickle=False).tolist()
+    texts = [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+    return texts if kind == "str" else [json.loads(t) if t else None for t in texts]
+
+
+def _write_columns(part_dir: Path, records: List[Dict[str, Any]]) -> List[str]:
+    """按列写出记录，列类型记在 columns.json（读回时据此还原字符串 / JSON / 数值 / 向量）。"""
+    part_dir.mkdir(parents=True, exist_ok=True)
+    kinds: Dict[str, str] = {}
+    for field in records[0].keys():
+        values = [r.get(field) for r in records]
+        kinds[field] = _column_kind(values)
+        _write_column(part_dir, field, kinds[field], values)
+    (part_dir / COLUMNS_NAME).write_text(
+        json.dumps({"count": len(records), "columns": kinds}, ensure_ascii=False), encoding="utf-8"
+    )
+    return list(kinds)
+
+
+def read_shard_records(shard_dir: Path, part: str = CHUNK_PART) -> List[Dict[str, Any]]:
+    """读回分片中的记录（向量还原为 list[float]，标量还原为 Python 类型）。"""
+    part_dir = Path(shard_dir) / part
+    columns_path = part_dir / COLUMNS_NAME
+    if not columns_path.exists():
+        return []
+    meta = json.loads(columns_path.read_text(encoding="utf-8"))
+    records: List[Dict[str, Any]] = [{} for _ in range(int(meta["count"]))]
+    for field, kind in meta["columns"].items():
+        for record, value in zip(records, _read_column(part_dir, field, kind)):
+            record[field] = value
+    return records
+
+
+def attach_doc_fields(
+    records: List[Dict[str, Any]], doc_records: Sequence[Dict[str, Any]], fields: Sequence[str]
+) -> List[Dict[str, Any]]:
+    """按 doc_id 把文档级记录中的 fields 回填到 chunk 记录（chunk 分片不存文档级字段）。"""
+    by_id = {rec["id"]: rec for rec in doc_records}
+    for record in records:
+        doc = by_id.get(record.get("doc_id"))
+        if doc is not None:
+            for field in fields:
+                record.setdefault(field, doc.get(field) or "")
+    return records
+
+
+def write_rows_json(path: Path, records: Iterable[Dict[str, Any]], fields: Collection[str]) -> int:
+    """
+    流式写出 Milvus bulk import 的行式 JSON（{"rows": [...]}），只保留 fields 中的字段，返回行数。
+    先写临时文件再改名，避免导入读到半个文件。
+    """
+    tmp = path.with_name(f".{path.name}.tmp")
+    count = 0
+    with tmp.open("w", encoding="utf-8") as fh:
+        fh.write('{"rows": [')
+        for record in records:
+            row = {k: v for k, v in record.items() if k in fields}
+            fh.write(("," if count else "") + "\n" + json.dumps(row, ensure_ascii=False))
+            count += 1
+        fh.write("\n]}\n")
+    os.replace(tmp, path)
+    return count
+
+
+def remote_file_path(shard_dir: Path, filename: str, prefix: str = "") -> str:
+    """分片内文件在 Milvus 存储中的路径：prefix 为输出目录在存储中的根路径，为空时用本地路径。"""
+    if not prefix:
+        return str(Path(shard_dir) / filename)
+    return f"{prefix.rstrip('/')}/{Path(shard_dir).name}/{filename}"
+
+
+class BulkManifest:
+    """导出目录下的 manifest.json：导出参数、已写入分片的文件、跳过的文件与分片加载状态。"""
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / MANIFEST_NAME
+        if self.path.exists():
+            self.data: Dict[str, Any] = json.loads(self.path.read_text(encoding="utf-8"))
+        else:
+            self.data = {"params": {}, "files_done": {}, "skipped": {}, "shards": []}
+
+    def check_params(self, **params: Any) -> None:
+        """首次导出时记录参数；续传时参数必须一致，否则 id 与向量会和已导出分片不一致。"""
+        saved = self.data["params"]
+        if not saved:
+            saved.update(params)
+            return
+        changed = {k: (saved.get(k), v) for k, v in params.items() if saved.get(k) != v}
+        if changed:
+            raise ValueError(f"导出参数与 {self.path} 中记录的不一致，无法续传: {changed}")
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return self.data["params"]
+
+    def is_file_done(self, filename: str) -> bool:
+        return filename in self.data["files_done"] or filename in self.data["skipped"]
+
+    def note_skipped(self, filename: str, reason: str) -> None:
+        self.data["skipped"][filename] = reason
+
+    def next_shard_name(self) -> str:
+        return f"shard_{len(self.data['shards']):05d}"
+
+    def add_shard(self, name: str, filenames: Sequence[str], records: int, docs: int) -> None:
+        self.data["shards"].append({"name": name, "records": records, "docs": docs, "state": SHARD_PENDING})
+        for filename in filenames:
+            self.data["files_done"][filename] = name
+        self.save()
+
+    def shards(self, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [s for s in self.data["shards"] if state is None or s.get("state") == state]
+
+    def set_shard_state(self, name: str, state: str, **info: Any) -> None:
+        for shard in self.data["shards"]:
+            if shard["name"] == name:
+                shard["state"] = state
+                shard.update(info)
+        self.save()
+
+    def save(self) -> None:
+        """先写临时文件再原子替换，进程中断时 manifest 不会被写坏。"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.data, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+class ShardWriter:
+    """
+    流式分片写出：按文档累积记录，达到 max_records 条时写出一个分片并登记到 manifest，
+    内存中最多滞留一个分片的数据。分片先写到临时目录再改名，中断时不会留下半个分片。
+    """
+
+    def __init__(self, manifest: BulkManifest, max_records: int):
+        self.manifest = manifest
+        self.max_records = max(1, max_records)
+        self._records: List[Dict[str, Any]] = []
+        self._doc_records: List[Dict[str, Any]] = []
+        self._filenames: List[str] = []
+        self.shards_written = 0
+
+    def add(self, filename: str, records: List[Dict[str, Any]], doc_record: Optional[Dict[str, Any]] = None) -> None:
+        self._records.extend(records)
+        if doc_record is not None:
+            self._doc_records.append(doc_record)
+        self._filenames.append(filename)
+        if len(self._records) >= self.max_records:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._filenames:
+            return
+        name = self.manifest.next_shard_name()
+        final_dir = self.manifest.output_dir / name
+        tmp_dir = self.manifest.output_dir / f".{name}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if self._records:
+            _write_columns(tmp_dir / CHUNK_PART, self._records)
+        if self._doc_records:
+            _write_columns(tmp_dir / DOC_PART, self._doc_records)
+        shutil.rmtree(final_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_dir, final_dir)
+        self.manifest.add_shard(name, self._filenames, len(self._records), len(self._doc_records))
+        self.shards_written += 1
+        self._records, self._doc_records, self._filenames = [], [], []
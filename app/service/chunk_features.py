@@ -0,0 +1,89 @@
+"""chunk 结构特征：表格 / 引用 / 公式得分。
+
+入库时对每个 chunk 计算一次并写入 Milvus 标量字段（table_score / citation_score / formula_score），
+检索结果直接读取，无需在查询时重复做正则分析；旧集合缺少这些字段时由 RAG 流程回退为现场计算。
+"""
+
+import re
+from typing import Any, Dict, Optional
+
+STRUCTURE_SCORE_FIELDS = ("table_score", "citation_score", "formula_score")
+
+# 预编译的结构特征模式
+_DIGIT_RE = re.compile(r"\d")
+_CITATION_RE = re.compile(r"\[[0-9,\s\-]{1,6}\]")
+_DIMENSION_RE = re.compile(r"\b\d+(\.\d+)?\s*(×|x)\s*\d+(\.\d+)?\b")
+_FORMULA_SYMBOLS = ("=", "+", "-", "*", "/", "^", "_")
+_LATEX_COMMANDS = ("\\frac", "\\sum", "\\int", "\\log", "\\exp")
+
+
+def empty_structure_scores() -> Dict[str, float]:
+    return {name: 0.0 for name in STRUCTURE_SCORE_FIELDS}
+
+
+def analyze_chunk_structure(content: str) -> Dict[str, float]:
+    """
+    对 chunk 文本做简单结构分析，识别表格 / 引用 / 公式等特征。
+    返回 0~1 之间的启发式得分，用于轻微调整排序与证据权重。
+    """
+    text = (content or "").strip()
+    if not text:
+        return empty_structure_scores()
+
+    # 表格特征：多行、包含 | 或 , 或制表符，且数字密集
+    lines = text.splitlines()
+    num_lines = len(lines)
+    table_like_lines = 0
+    digit_lines = 0
+    for line in lines:
+        line_strip = line.strip()
+        if not line_strip:
+            continue
+        if "|" in line_strip or "\t" in line_strip or ("," in line_strip and _DIGIT_RE.search(line_strip)):
+            table_like_lines += 1
+        if len(_DIGIT_RE.findall(line_strip)) >= 3:
+            digit_lines += 1
+
+    table_score = 0.0
+    if num_lines >= 2:
+        ratio_table = table_like_lines / num_lines
+        ratio_digit = digit_lines / num_lines
+        table_score = min(1.0, 0.6 * ratio_table + 0.4 * ratio_digit)
+
+    # 引用特征：出现 [1]、[12]、[3,4] 等模式
+    citation_matches = _CITATION_RE.findall(text)
+    citation_score = 0.0
+    if citation_matches:
+        citation_score = min(1.0, len(citation_matches) / 4.0)
+
+    # 公式特征：等号、^、_、LaTeX 命令等
+    formula_score = 0.0
+    if any(sym in text for sym in _FORMULA_SYMBOLS):
+        formula_score += 0.3
+    if any(kw in text for kw in _LATEX_COMMANDS):
+        formula_score += 0.4
+    if _DIMENSION_RE.search(text):
+        formula_score += 0.3
+    formula_score = min(1.0, formula_score)
+
+    return {
+        "table_score": round(table_score, 3),
+        "citation_score": round(citation_score, 3),
+        "formula_score": round(formula_score, 3),
+    }
+
+
+def structure_scores_from_metadata(metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, float]]:
+    """从检索结果 metadata 读取入库时预计算的结构得分；字段不全（旧集合）时返回 None。"""
+    if not isinstance(metadata, dict):
+        return None
+    scores: Dict[str, float] = {}
+    for name in STRUCTURE_SCORE_FIELDS:
+        value = metadata.get(name)
+        if value is None:
+            return None
+        try:
+            scores[name] = round(float(value), 3)
+        except (TypeError, ValueError):
+            return None
+    return scores
@@ -0,0 +1,181 @@
+"""文档级元数据：规范化存储布局与检索结果回填。
+
+MILVUS_CHUNK_LAYOUT=normalized 时，标题、摘要、总结、关键词、作者、机构等文档级字段只在
+文档级伴随集合（{集合名}_docs，每篇论文一条，主键即 doc_id）中存一份，chunk 集合只保留
+doc_id / kb_id / security_level 等键与过滤字段；检索结果在返回前按 doc_id 批量回填这些字段，
+回填走进程内 LRU 缓存，缓存未命中的 doc_id 合并为一次 Milvus 查询。
+denormalized（默认）保持旧布局：每个 chunk 记录携带完整的文档级字段。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from app.service.env_utils import get_env_float, get_env_int
+
+DOC_COLLECTION_SUFFIX = "_docs"
+# 规范化布局下从 chunk 记录移出、只存于文档级集合的字段
+DOC_LEVEL_FIELDS = ("title", "abstract_text", "keywords_text", "summary_text", "authors", "institutions")
+
+
+def docs_collection_name(collection_name: str) -> str:
+    """文档级伴随集合名。"""
+    return f"{collection_name}{DOC_COLLECTION_SUFFIX}"
+
+
+def is_normalized_layout() -> bool:
+    return os.getenv("MILVUS_CHUNK_LAYOUT", "denormalized").strip().lower() == "normalized"
+
+
+def iter_query_rows(coll: Any, expr: str, output_fields: List[str], batch_size: int = 1000) -> Iterable[Dict[str, Any]]:
+    """
+    分页读取 query 结果：优先用 query_iterator；旧版 pymilvus 没有该接口时按 offset 翻页。
+    offset + limit 不能超过 16384，结果更多时抛出 RuntimeError，不静默截断。
+    """
+    if hasattr(coll, "query_iterator"):
+        it = coll.query_iterator(batch_size=batch_size, expr=expr, output_fields=output_fields)
+        try:
+            while True:
+                batch = it.next()
+                if not batch:
+                    break
+                yield from batch
+        finally:
+            it.close()
+        return
+    offset = 0
+    while offset < 16384:
+        limit = min(batch_size, 16384 - offset)
+        batch = coll.query(expr=expr, output_fields=output_fields, offset=offset, limit=limit)
+        yield from batch
+        if len(batch) < limit:
+            return
+        offset += limit
+    raise RuntimeError(f"query 结果超过 16384 条且 pymilvus 不支持 query_iterator，无法完整读取: expr={expr}")
+
+
+def doc_ids_missing_from_docs(chunk_coll: Any, docs_coll: Any, limit: Optional[int] = None) -> List[int]:
+    """
+    chunk 集合中有、文档级集合中没有记录的 doc_id（升序）。文档级集合是在已有数据的 chunk 集合上
+    后建的（升级前入库的论文没有文档级记录）时非空；limit 给定时找到 limit 个即停止扫描。
+    """
+    known = {int(row["id"]) for row in iter_query_rows(docs_coll, "id >= 0", ["id"])}
+    missing: set = set()
+    for row in iter_query_rows(chunk_coll, "doc_id >= 0", ["doc_id"]):
+        doc_id = int(row["doc_id"])
+        if doc_id not in known:
+            missing.add(doc_id)
+            if limit is not None and len(missing) >= limit:
+                break
+    return sorted(missing)
+
+
+class DocMetadataCache:
+    """doc_id -> 文档级字段的 LRU 缓存（线程安全，条目超过 ttl 秒后视为过期）。"""
+
+    def __init__(self, max_size: int = 10000, ttl_s: float = 600.0):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def get_many(self, collection: str, doc_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        now = time.monotonic()
+        found: Dict[int, Dict[str, Any]] = {}
+        with self._lock:
+            for doc_id in doc_ids:
+                key = (collection, doc_id)
+                item = self._items.get(key)
+                if item is None:
+                    continue
+                stored_at, fields = item
+                if now - stored_at > self.ttl_s:
+                    del self._items[key]
+                    continue
+                self._items.move_to_end(key)
+                found[doc_id] = fields
+        return found
+
+    def put_many(self, collection: str, rows: Dict[int, Dict[str, Any]]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for doc_id, fields in rows.items():
+                key = (collection, doc_id)
+                self._items[key] = (now, fields)
+                self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, collection: str, doc_id: int) -> None:
+        with self._lock:
+            self._items.pop((collection, doc_id), None)
+
+
+_cache_lock = threading.Lock()
+_cache: Optional[DocMetadataCache] = None
+
+
+def get_cache() -> DocMetadataCache:
+    """进程级缓存（大小由 DOC_METADATA_CACHE_SIZE、过期时间由 DOC_METADATA_CACHE_TTL_S 指定）。"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                size = get_env_int("DOC_METADATA_CACHE_SIZE", 10000)
+                ttl = get_env_float("DOC_METADATA_CACHE_TTL_S", 600.0)
+                _cache = DocMetadataCache(max_size=max(1, size), ttl_s=ttl)
+    return _cache
+
+
+def note_document_deleted(collection: str, doc_id: int) -> None:
+    """文档删除 / 更新后清理缓存条目。"""
+    if _cache is not None:
+        _cache.invalidate(collection, int(doc_id))
+
+
+def _metadata_of(result: Any) -> Optional[Dict[str, Any]]:
+    metadata = getattr(result, "metadata", None)
+    return metadata if isinstance(metadata, dict) else None
+
+
+def hydrate_results(
+    results: Sequence[Any],
+    collection: str,
+    fetcher: Callable[[List[int]], Dict[int, Dict[str, Any]]],
+    doc_id_of: Callable[[Any], Any],
+) -> Sequence[Any]:
+    """
+    按 doc_id 为检索结果的 metadata 回填文档级字段（已有字段不覆盖）。
+    fetcher 接收缓存未命中的 doc_id 列表，返回 {doc_id: {字段: 值}}。
+    """
+    pending: Dict[int, List[Dict[str, Any]]] = {}
+    for r in results or []:
+        metadata = _metadata_of(r)
+        doc_id = doc_id_of(r)
+        if metadata is None or doc_id is None:
+            continue
+        if all(field in metadata for field in DOC_LEVEL_FIELDS):
+            continue
+        pending.setdefault(int(doc_id), []).append(metadata)
+    if not pending:
+        return results
+
+    cache = get_cache()
+    found = cache.get_many(collection, pending.keys())
+    missing = [doc_id for doc_id in pending if doc_id not in found]
+    if missing:
+        fetched = fetcher(missing)
+        cache.put_many(collection, fetched)
+        found.update(fetched)
+    for doc_id, metadatas in pending.items():
+        fields = found.get(doc_id)
+        if not fields:
+            continue
+        for metadata in metadatas:
+            for field in DOC_LEVEL_FIELDS:
+                metadata.setdefault(field, fields.get(field, ""))
+    return results
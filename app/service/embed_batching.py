@@ -0,0 +1,125 @@
+"""入库向量编码的批次规划。
+
+批量入库时把多篇文档的 chunk 文本汇成一个池，按估计长度从长到短排序后切成批次：
+- 同一批次内长度接近，padding 浪费小
+- 批次大小按 token 预算自适应：batch = 预算 // 批内最长序列，短文本批次大、长文本批次小
+- 预算随设备取默认值（cuda > mps > cpu），遇到显存不足时减半重试并记住新的预算
+编码结果按原顺序返回，由调用方分发回各文档。
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.service.env_utils import get_env_int
+
+logger = logging.getLogger(__name__)
+
+# 各设备默认的单批 token 预算（批大小 × 批内最长序列）
+_DEFAULT_TOKEN_BUDGETS = {"cuda": 32768, "mps": 8192, "cpu": 4096}
+_MIN_TOKEN_BUDGET = 512
+
+_budget_lock = threading.Lock()
+# 显存不足后下调的预算（按设备记录，进程内生效）
+_learned_budgets: Dict[str, int] = {}
+
+
+def estimate_tokens(text: str, max_seq_length: Optional[int] = None) -> int:
+    """粗略估计 token 数：CJK 字符按 1 个 token，其余按 4 个字符 1 个 token；超过模型最大长度时截断。"""
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    tokens = cjk + (len(text) - cjk + 3) // 4 + 2
+    if max_seq_length:
+        tokens = min(tokens, max_seq_length)
+    return max(1, tokens)
+
+
+def token_budget(device: str) -> int:
+    """单批 token 预算：EMBEDDING_TOKEN_BUDGET 优先，其次是显存不足后学到的预算，最后按设备取默认值。"""
+    configured = get_env_int("EMBEDDING_TOKEN_BUDGET")
+    if configured is not None:
+        return max(_MIN_TOKEN_BUDGET, configured)
+    with _budget_lock:
+        learned = _learned_budgets.get(device)
+    if learned is not None:
+        return learned
+    return _DEFAULT_TOKEN_BUDGETS.get(device.split(":")[0], _DEFAULT_TOKEN_BUDGETS["cpu"])
+
+
+def _shrink_budget(device: str, budget: int, batch_lengths: Sequence[int]) -> int:
+    """减半预算，并保证出错批次按新预算至少缩小一半（最低容纳该批最长的一条）。"""
+    longest = max(batch_lengths)
+    shrunk = max(longest, min(budget // 2, longest * (len(batch_lengths) // 2)))
+    with _budget_lock:
+        _learned_budgets[device] = shrunk
+    logger.warning(f"[embed_batching] {device} 编码显存不足，token 预算 {budget} -> {shrunk}")
+    return shrunk
+
+
+def plan_batches(lengths: Sequence[int], budget: int, max_batch: int) -> List[List[int]]:
+    """
+    按长度从长到短排序后贪心切批：每批大小 = min(max_batch, budget // 批内首条（最长）长度)，至少 1 条。
+    返回每批的原始下标列表。
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches: List[List[int]] = []
+    pos = 0
+    while pos < len(order):
+        longest = lengths[order[pos]]
+        size = max(1, min(max_batch, budget // max(1, longest)))
+        batches.append(order[pos:pos + size])
+        pos += size
+    return batches
+
+
+def _is_oom(exc: BaseException) -> bool:
+    return "out of memory" in str(exc).lower()
+
+
+def encode_texts(model: Any, texts: Sequence[str], device: str, **encode_kwargs: Any) -> np.ndarray:
+    """
+    按自适应批次编码 texts，返回与 texts 顺序一致的向量矩阵。
+    encode_kwargs 透传给 model.encode（如 task="retrieval"）。
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    max_seq_length = getattr(model, "max_seq_length", None)
+    lengths = [estimate_tokens(t, max_seq_length) for t in texts]
+    max_batch = max(1, get_env_int("EMBEDDING_MAX_BATCH", 256))
+
+    budget = token_budget(device)
+    out: Optional[np.ndarray] = None
+    pending = plan_batches(lengths, budget, max_batch)
+    while pending:
+        batch = pending.pop(0)
+        try:
+            vecs = np.asarray(
+                model.encode([texts[i] for i in batch], batch_size=len(batch), show_progress_bar=False, **encode_kwargs)
+            )
+        except RuntimeError as e:
+            if not _is_oom(e) or len(batch) == 1:
+                raise
+            # 显存不足：减半预算，把本批及剩余下标重新切批
+            budget = _shrink_budget(device, budget, [lengths[i] for i in batch])
+            remaining = batch + [i for b in pending for i in b]
+            pending = [[remaining[j] for j in b] for b in plan_batches([lengths[i] for i in remaining], budget, max_batch)]
+            _empty_device_cache(device)
+            continue
+        if out is None:
+            out = np.zeros((len(texts), vecs.shape[1]), dtype=vecs.dtype)
+        out[batch] = vecs
+    return out
+
+
+def _empty_device_cache(device: str) -> None:
+    if not device.startswith("cuda"):
+        return
+    try:
+        import torch
+
+        torch.cuda.empty_cache()
+    except Exception:
+        pass
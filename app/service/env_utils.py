@@ -0,0 +1,34 @@
+"""环境变量读取：缺失、空串或非法值时返回默认值，供各服务模块读取 .env 配置。"""
+
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+_TRUTHY = {"1", "true", "yes", "y", "on"}
+
+
+def get_env_float(name: str, default: float) -> float:
+    """读取浮点型环境变量，缺失或非法时返回默认值。"""
+    try:
+        v = os.getenv(name, "").strip()
+        return float(v) if v != "" else float(default)
+    except Exception:
+        return float(default)
+
+
+def get_env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    """读取整型环境变量，缺失或非法时返回默认值。"""
+    try:
+        v = os.getenv(name, "").strip()
+        return int(v) if v != "" else default
+    except Exception:
+        return default
+
+
+def is_truthy_env(name: str, default: bool = False) -> bool:
+    """读取布尔型环境变量：1/true/yes/y/on（不区分大小写）为真，未设置时返回默认值。"""
+    v = os.getenv(name)
+    if v is None:
+        return default
+    return str(v).strip().lower() in _TRUTHY
@@ -0,0 +1,410 @@
+"""异步索引任务。
+
+/index/jobs/* 接口提交后立即返回 job_id，由后台 worker（INDEX_JOB_WORKERS 个，默认 1，避免多个任务争抢
+向量模型）按提交顺序执行入库；调用方轮询任务状态即可，HTTP 连接断开不影响入库。
+
+每个任务在 INDEX_JOB_DIR/{job_id}/ 下落盘：
+- inputs.jsonl：提交的文件（每行一个；落盘暂存的上传文件移入 uploads/，这里只记路径），任务重跑时从这里读取
+- checkpoints.jsonl：文档创建后（写切片与 Milvus 之前）追加一行 created（文件下标、doc_id），
+  文件写入 Milvus 后追加一行 done（文件下标、doc_id、chunk 数）
+- job.json：任务状态与参数
+任务失败或被取消后可 resume：done 的文件直接跳过，不会重复编码；只有 created 的文件沿用原 doc_id，
+先清理上次写入的残留再重写，不会留下孤立文档或重复向量。
+服务重启时处于 queued / running 的任务标记为 failed，同样可以 resume。
+uploads/ 在任务完成后立即删除；失败 / 取消的任务保留 INDEX_JOB_UPLOAD_TTL_S 秒（默认 7 天）供 resume，
+过期后删除，此后该任务不能再恢复。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.service import index_service, upload_spool
+from app.service.env_utils import get_env_float, get_env_int
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+_FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+_CHECKPOINT_CREATED = "created"
+_CHECKPOINT_DONE = "done"
+
+# 任务类型 -> 入库函数
+_BUILDERS: Dict[str, Callable[..., Any]] = {
+    "json": index_service.build_index_from_json_contents,
+    "markdown": index_service.build_index_from_markdown_contents,
+    "documents": index_service.build_index_from_parsed_document_contents,
+}
+
+
+class IndexJob:
+    """单个索引任务的状态；checkpoints 与计数由入库线程回调更新，读写都经 _lock。"""
+
+    def __init__(self, job_dir: Path, state: Dict[str, Any]):
+        self.job_dir = job_dir
+        self.job_id: str = state["job_id"]
+        self.kind: str = state["kind"]
+        self.kb_id: int = int(state["kb_id"])
+        self.skip_base_db: bool = bool(state.get("skip_base_db", False))
+        self.total_documents: int = int(state["total_documents"])
+        self.status: str = state.get("status", JOB_QUEUED)
+        self.error: Optional[str] = state.get("error")
+        self.upload_skipped_files: List[str] = list(state.get("upload_skipped_files", []))
+        self.skipped_files: List[str] = list(state.get("skipped_files", []))
+        self.created_at: float = float(state.get("created_at", time.time()))
+        self.started_at: Optional[float] = state.get("started_at")
+        self.finished_at: Optional[float] = state.get("finished_at")
+        self.uploads_purged: bool = bool(state.get("uploads_purged", False))
+        self.cancel_requested = False
+        self._lock = threading.Lock()
+        # 文件下标 -> {filename, doc_id, chunks}（已写完）；文件下标 -> doc_id（已创建文档、尚未写完）
+        self.checkpoints: Dict[int, Dict[str, Any]] = {}
+        self.created: Dict[int, int] = {}
+        self._read_checkpoints()
+        # 本轮运行的起点，用于计算吞吐与 ETA（resume 后重新计时）
+        self._run_started: Optional[float] = None
+        self._run_done = 0
+        self._run_chunks = 0
+
+    @property
+    def inputs_path(self) -> Path:
+        return self.job_dir / "inputs.jsonl"
+
+    @property
+    def checkpoints_path(self) -> Path:
+        return self.job_dir / "checkpoints.jsonl"
+
+    @property
+    def uploads_dir(self) -> Path:
+        return self.job_dir / "uploads"
+
+    def _read_checkpoints(self) -> None:
+        if not self.checkpoints_path.exists():
+            return
+        for line in self.checkpoints_path.read_text(encoding="utf-8").splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # 进程中断时最后一行可能不完整，该文件视为未完成
+                continue
+            index = int(entry["index"])
+            if entry.get("event") == _CHECKPOINT_CREATED:
+                self.created[index] = int(entry["doc_id"])
+            else:
+                self.checkpoints[index] = entry
+
+    def _append_checkpoint(self, entry: Dict[str, Any]) -> None:
+        with self.checkpoints_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def resume_doc_ids(self) -> Dict[int, int]:
+        """已创建文档但未写完的文件：文件下标 -> doc_id。"""
+        with self._lock:
+            return {i: doc_id for i, doc_id in self.created.items() if i not in self.checkpoints}
+
+    def read_inputs(self) -> List[Any]:
+        with self.inputs_path.open(encoding="utf-8") as f:
+            return [upload_spool.from_jsonable(json.loads(line)) for line in f if line.strip()]
+
+    def note_created(self, index: int, doc_id: int) -> None:
+        with self._lock:
+            self.created[index] = doc_id
+            self._append_checkpoint({"index": index, "event": _CHECKPOINT_CREATED, "doc_id": doc_id})
+
+    def note_done(self, index: int, info: Dict[str, Any]) -> None:
+        entry = {"index": index, "event": _CHECKPOINT_DONE, **info}
+        with self._lock:
+            self.checkpoints[index] = entry
+            self._run_done += 1
+            self._run_chunks += int(info.get("chunks", 0))
+            self._append_checkpoint(entry)
+
+    def purge_uploads(self) -> None:
+        """删除任务目录下暂存的上传文件；有上传文件的任务此后不能再 resume。"""
+        if self.uploads_dir.exists():
+            shutil.rmtree(self.uploads_dir, ignore_errors=True)
+            with self._lock:
+                self.uploads_purged = True
+
+    def start_run(self) -> None:
+        with self._lock:
+            self.status = JOB_RUNNING
+            self.error = None
+            self.cancel_requested = False
+            self.started_at = self.started_at or time.time()
+            self.finished_at = None
+            self._run_started = time.monotonic()
+            self._run_done = 0
+            self._run_chunks = 0
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self._run_started = None
+
+    def save(self) -> None:
+        """先写临时文件再原子替换。"""
+        with self._lock:
+            state = {
+                "job_id": self.job_id,
+                "kind": self.kind,
+                "kb_id": self.kb_id,
+                "skip_base_db": self.skip_base_db,
+                "total_documents": self.total_documents,
+                "status": self.status,
+                "error": self.error,
+                "upload_skipped_files": self.upload_skipped_files,
+                "skipped_files": self.skipped_files,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "uploads_purged": self.uploads_purged,
+            }
+        tmp = self.job_dir / "job.json.tmp"
+        tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.job_dir / "job.json")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务状态与进度：已完成文档 / chunk 数、本轮吞吐（文档/秒、chunk/秒）与预计剩余秒数。"""
+        with self._lock:
+            done_documents = len(self.checkpoints)
+            done_chunks = sum(int(c.get("chunks", 0)) for c in self.checkpoints.values())
+            docs_per_s = chunks_per_s = eta_s = None
+            if self._run_started is not None:
+                elapsed = max(1e-6, time.monotonic() - self._run_started)
+                docs_per_s = self._run_done / elapsed
+                chunks_per_s = self._run_chunks / elapsed
+                if docs_per_s > 0:
+                    eta_s = round((self.total_documents - done_documents) / docs_per_s, 1)
+            return {
+                "job_id": self.job_id,
+                "kind": self.kind,
+                "kb_id": self.kb_id,
+                "status": self.status,
+                "error": self.error,
+                "cancel_requested": self.cancel_requested,
+                "total_documents": self.total_documents,
+                "done_documents": done_documents,
+                "done_chunks": done_chunks,
+                "docs_per_s": round(docs_per_s, 3) if docs_per_s is not None else None,
+                "chunks_per_s": round(chunks_per_s, 3) if chunks_per_s is not None else None,
+                "eta_s": eta_s,
+                "skipped_files": self.skipped_files + self.upload_skipped_files,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class IndexJobManager:
+    """任务登记、落盘与 worker 调度。worker 为事件循环中的协程，首次提交任务时启动。"""
+
+    def __init__(self, root: Path, workers: int):
+        self.root = root
+        self.workers = max(1, workers)
+        self._jobs: Dict[str, IndexJob] = {}
+        self._queue: Optional["asyncio.Queue[str]"] = None
+        self._worker_tasks: List["asyncio.Task[None]"] = []
+        self.upload_ttl_s = get_env_float("INDEX_JOB_UPLOAD_TTL_S", 7 * 24 * 3600.0)
+        self._load_existing()
+        self._purge_expired_uploads()
+
+    def _load_existing(self) -> None:
+        if not self.root.is_dir():
+            return
+        for job_file in sorted(self.root.glob("*/job.json")):
+            try:
+                job = IndexJob(job_file.parent, json.loads(job_file.read_text(encoding="utf-8")))
+            except Exception as e:
+                logger.warning(f"[index_jobs] 读取任务 {job_file} 失败: {e}")
+                continue
+            if job.status not in _FINISHED_STATES:
+                # 上次进程退出时未完成：标记失败，可通过 resume 从 checkpoint 继续
+                job.finish(JOB_FAILED, "服务重启，任务中断")
+                job.save()
+            self._jobs[job.job_id] = job
+
+    def _purge_expired_uploads(self) -> None:
+        """删除已结束超过 upload_ttl_s 秒的任务的上传文件（已完成的任务在结束时即已删除）。"""
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.status not in _FINISHED_STATES or job.uploads_purged or job.finished_at is None:
+                continue
+            if now - job.finished_at < self.upload_ttl_s or not job.uploads_dir.exists():
+                continue
+            try:
+                job.purge_uploads()
+                job.save()
+                logger.error(f"[index_jobs] 任务 {job.job_id} 的上传文件已过期删除")
+            except Exception as e:
+                logger.warning(f"[index_jobs] 删除任务 {job.job_id} 的上传文件失败: {e}")
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._worker_tasks = [t for t in self._worker_tasks if not t.done()]
+        while len(self._worker_tasks) < self.workers:
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JOB_QUEUED:
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                # _run 已兜底；这里再兜一层，保证 worker 不会因单个任务退出
+                logger.error(f"[index_jobs] 任务 {job_id} 收尾失败: {e}", exc_info=True)
+
+    async def _run(self, job: IndexJob) -> None:
+        """执行一个任务；读取输入、入库、保存状态中的任何异常都只让该任务失败。"""
+        try:
+            await self._execute(job)
+        except Exception as e:
+            logger.error(f"[index_jobs] 任务 {job.job_id} 失败: {e}", exc_info=True)
+            job.finish(JOB_FAILED, str(e))
+        if job.status == JOB_COMPLETED:
+            await asyncio.to_thread(job.purge_uploads)
+        await asyncio.to_thread(job.save)
+        logger.error(f"[index_jobs] 任务 {job.job_id} 结束: {job.to_dict()}")
+
+    async def _execute(self, job: IndexJob) -> None:
+        job.start_run()
+        items = await asyncio.to_thread(job.read_inputs)
+        pending = [i for i in range(len(items)) if i not in job.checkpoints]
+        positions = {i: pos for pos, i in enumerate(pending)}
+        resume_doc_ids = {positions[i]: doc_id for i, doc_id in job.resume_doc_ids().items() if i in positions}
+        await asyncio.to_thread(job.save)
+        logger.error(
+            f"[index_jobs] 任务 {job.job_id} 开始: 共 {len(items)} 个文件, 待处理 {len(pending)} 个, "
+            f"沿用 doc_id {len(resume_doc_ids)} 个"
+        )
+        result = await _BUILDERS[job.kind](
+            job.kb_id,
+            [items[i] for i in pending],
+            skip_base_db=job.skip_base_db,
+            # 入库函数按本轮列表下标回调，映射回任务中的原始下标
+            on_document_done=lambda pos, info: job.note_done(pending[pos], info),
+            cancelled=lambda: job.cancel_requested,
+            on_document_created=lambda pos, doc_id: job.note_created(pending[pos], doc_id),
+            resume_doc_ids=resume_doc_ids,
+        )
+        job.skipped_files = list(result.get("skipped_files", []))
+        if job.cancel_requested and len(job.checkpoints) + len(job.skipped_files) < job.total_documents:
+            job.finish(JOB_CANCELLED)
+        else:
+            job.finish(JOB_COMPLETED)
+
+    async def submit(
+        self,
+        kind: str,
+        kb_id: int,
+        items: Sequence[Any],
+        *,
+        skip_base_db: bool = False,
+        skipped_files: Optional[Sequence[str]] = None,
+    ) -> IndexJob:
+        if kind not in _BUILDERS:
+            raise ValueError(f"不支持的任务类型: {kind}")
+        job_id = uuid.uuid4().hex
+        job_dir = self.root / job_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+
+        def _write_inputs() -> None:
+            # 落盘暂存的上传文件移入任务目录，inputs.jsonl 只记录路径
+            uploads_dir = job_dir / "uploads"
+            with (job_dir / "inputs.jsonl").open("w", encoding="utf-8") as f:
+                for item in items:
+                    item = upload_spool.to_jsonable(upload_spool.adopt(item, uploads_dir))
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+        await asyncio.to_thread(_write_inputs)
+        await asyncio.to_thread(self._purge_expired_uploads)
+        job = IndexJob(
+            job_dir,
+            {
+                "job_id": job_id,
+                "kind": kind,
+                "kb_id": kb_id,
+                "skip_base_db": skip_base_db,
+                "total_documents": len(items),
+                "upload_skipped_files": list(skipped_files or []),
+                "created_at": time.time(),
+            },
+        )
+        job.save()
+        self._jobs[job_id] = job
+        self._enqueue(job)
+        return job
+
+    def _enqueue(self, job: IndexJob) -> None:
+        self._ensure_workers()
+        self._queue.put_nowait(job.job_id)
+
+    def get(self, job_id: str) -> IndexJob:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    def list_jobs(self) -> List[IndexJob]:
+        return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> IndexJob:
+        """排队中的任务直接取消；运行中的任务不再读入新文件，在途文件处理完后进入 cancelled。"""
+        job = self.get(job_id)
+        if job.status == JOB_QUEUED:
+            job.finish(JOB_CANCELLED)
+            job.save()
+        elif job.status == JOB_RUNNING:
+            job.cancel_requested = True
+        else:
+            raise ValueError(f"任务 {job_id} 已结束（{job.status}），无法取消")
+        return job
+
+    def resume(self, job_id: str) -> IndexJob:
+        """失败或已取消的任务重新排队，checkpoint 中已完成的文件跳过。"""
+        job = self.get(job_id)
+        if job.status not in (JOB_FAILED, JOB_CANCELLED):
+            raise ValueError(f"任务 {job_id} 当前状态为 {job.status}，只有 failed / cancelled 的任务可以恢复")
+        if job.uploads_purged:
+            raise ValueError(f"任务 {job_id} 的上传文件已过期删除，无法恢复，请重新提交")
+        job.status = JOB_QUEUED
+        job.save()
+        self._enqueue(job)
+        return job
+
+
+_manager_lock = threading.Lock()
+_manager: Optional[IndexJobManager] = None
+
+
+def get_manager() -> IndexJobManager:
+    """进程级任务管理器（任务目录 INDEX_JOB_DIR，默认 ./index_jobs；worker 数 INDEX_JOB_WORKERS，默认 1）。"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                workers = get_env_int("INDEX_JOB_WORKERS", 1)
+                root = Path(os.getenv("INDEX_JOB_DIR", "index_jobs").strip() or "index_jobs")
+                _manager = IndexJobManager(root, workers)
+    return _manager
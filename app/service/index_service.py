@@ -5,17 +5,22 @@
 
 from __future__ import annotations
 
+import asyncio
 import hashlib
+import itertools
 import json
 import logging
 import os
+import time
 from collections import defaultdict
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import torch
 from dotenv import load_dotenv
 from pymilvus import (
+    BulkInsertState,
     Collection,
     DataType,
     FieldSchema,
@@ -28,6 +33,19 @@ from base_db import DocumentClient, DocumentChunkClient
 from base_db.abstract.abstract_base_core import AbstractBaseCore
 from base_db.parameters.document_chunk_parameters import DocumentChunkModel
 from base_db.parameters.document_parameters import DocumentModel
+from app.service import (
+    anchor_index,
+    bulk_load,
+    doc_metadata,
+    embed_batching,
+    ingest_pipeline,
+    milvus_writer,
+    operator_service,
+    title_index,
+    upload_spool,
+)
+from app.service.chunk_features import analyze_chunk_structure
+from app.service.env_utils import get_env_int, is_truthy_env
 from milvus_service import (
     ChunkRequest,
     ChunkerService,
@@ -101,13 +119,6 @@ def _connect_milvus() -> None:
 _embedding_model: Optional[SentenceTransformer] = None
 
 
-def _is_truthy_env(name: str, default: bool = False) -> bool:
-    v = os.getenv(name)
-    if v is None:
-        return default
-    return str(v).strip().lower() in {"1", "true", "yes", "y", "on"}
-
-
 def _resolve_embedding_model_path() -> tuple[str, bool]:
     """
     将 EMBEDDING_MODEL 解析为「本地绝对路径」或「Hugging Face repo id」。
@@ -183,7 +194,7 @@ def _get_embedding_model() -> SentenceTransformer:
 
     # 你选择的是“优先本地，缺文件再尝试线上”
     # 通过环境变量允许关闭线上回退（更适合严格离线环境）
-    allow_online_fallback = _is_truthy_env("EMBEDDING_ALLOW_ONLINE_FALLBACK", default=True)
+    allow_online_fallback = is_truthy_env("EMBEDDING_ALLOW_ONLINE_FALLBACK", default=True)
 
     try:
         # 对于本地路径：强制 local_files_only，避免任何下载行为
@@ -279,6 +290,7 @@ def ensure_parent_child_collection(
                         f"与当前模型维度 {dim} 不一致。请删除该集合后重新运行，或设置正确的 EMBEDDING_DIM。"
                     )
                 break
+        ensure_doc_vector_collection(collection_name, dim)
         return
 
     # 定义所有字段（包括主键、主向量、多向量和元数据）
@@ -339,6 +351,11 @@ def ensure_parent_child_collection(
                 max_length=16,
                 description="块类型：parent / child",
             ),
+            FieldSchema(
+                name="parent_index",
+                dtype=DataType.INT64,
+                description="所属父块在文档中的索引（用于按父块聚合检索结果）",
+            ),
             FieldSchema(
                 name="position_start",
                 dtype=DataType.INT64,
@@ -429,6 +446,31 @@ def ensure_parent_child_collection(
         ]
     )
 
+    # 结构特征字段（入库时预计算，检索时直接读取 / 过滤）
+    fields.extend(
+        [
+            FieldSchema(
+                name="table_score",
+                dtype=DataType.FLOAT,
+                description="表格特征得分（0~1）",
+            ),
+            FieldSchema(
+                name="citation_score",
+                dtype=DataType.FLOAT,
+                description="引用特征得分（0~1）",
+            ),
+            FieldSchema(
+                name="formula_score",
+                dtype=DataType.FLOAT,
+                description="公式特征得分（0~1）",
+            ),
+        ]
+    )
+
+    if doc_metadata.is_normalized_layout():
+        # 规范化布局：文档级字段只存于 {集合名}_docs，chunk 只保留键与过滤字段（写入时由 _fit_records_to_schema 剔除）
+        fields = [f for f in fields if f.name not in doc_metadata.DOC_LEVEL_FIELDS]
+
     # 元数据字段列表：排除主键与主向量字段（vector_content）
     metadata_fields = [f for f in fields if f.name not in ("id", "vector_content")]
 
@@ -449,6 +491,263 @@ def ensure_parent_child_collection(
     )
 
     StorageService.create_collection(req)
+    ensure_doc_vector_collection(collection_name, dim)
+
+
+def _doc_collection_enabled() -> bool:
+    """规范化布局下文档级字段只存于伴随集合，必须写入；否则由 DOC_VECTOR_ENABLED 控制。"""
+    return doc_metadata.is_normalized_layout() or is_truthy_env("DOC_VECTOR_ENABLED", True)
+
+
+def ensure_doc_vector_collection(collection_name: str, dim: int) -> None:
+    """
+    创建文档级伴随集合（每篇论文一条，主键即 doc_id）：文档级向量供 coarse_to_fine 检索先选文档再检索 chunk，
+    文档级字段供规范化布局（MILVUS_CHUNK_LAYOUT=normalized）在检索结果回填时使用。
+    """
+    if not _doc_collection_enabled():
+        return
+    docs_collection = doc_metadata.docs_collection_name(collection_name)
+    if utility.has_collection(docs_collection, using="default"):
+        return
+    metadata_fields = [
+        FieldSchema(name="kb_id", dtype=DataType.INT64, description="文件分类标识"),
+        FieldSchema(name="security_level", dtype=DataType.INT64, description="文件访问级别"),
+        FieldSchema(name="title", dtype=DataType.VARCHAR, max_length=2048, description="论文标题"),
+        FieldSchema(name="abstract_text", dtype=DataType.VARCHAR, max_length=65535, description="论文摘要文本"),
+        FieldSchema(name="keywords_text", dtype=DataType.VARCHAR, max_length=4096, description="关键词拼接文本"),
+        FieldSchema(name="summary_text", dtype=DataType.VARCHAR, max_length=65535, description="总结/结论文本"),
+        FieldSchema(name="authors", dtype=DataType.VARCHAR, max_length=4096, description="作者列表（JSON）"),
+        FieldSchema(name="institutions", dtype=DataType.VARCHAR, max_length=4096, description="机构列表（JSON）"),
+    ]
+    req = CreateCollectionRequest(
+        collection_name=docs_collection,
+        dimension=dim,
+        description="文档级向量（标题/摘要/关键词编码或 chunk 向量质心）",
+        auto_id=False,
+        primary_field="id",
+        dense_vector_field="vector_content",
+        metadata_fields=metadata_fields,
+        dense_index_params={
+            "metric_type": "IP",
+            "index_type": "HNSW",
+            "params": {"M": 16, "efConstruction": 200},
+        },
+    )
+    StorageService.create_collection(req)
+    try:
+        has_chunks = Collection(collection_name, using="default").num_entities > 0
+    except Exception:
+        has_chunks = False
+    if has_chunks:
+        logger.warning(
+            f"[ensure_doc_vector_collection] 集合 {collection_name} 已有数据，新建的 {docs_collection} 不含已入库文档，"
+            f"两阶段检索在补写前不会启用；请运行 backfill_doc_vectors.py 补写"
+        )
+
+
+_COLLECTION_FIELD_CACHE: Dict[str, frozenset] = {}
+
+
+def _get_collection_field_names(collection_name: str) -> frozenset:
+    """读取集合 schema 的字段名（按集合缓存，集合重建时需重启进程）。"""
+    cached = _COLLECTION_FIELD_CACHE.get(collection_name)
+    if cached is None:
+        _connect_milvus()
+        coll = Collection(collection_name, using="default")
+        cached = frozenset(f.name for f in coll.schema.fields)
+        _COLLECTION_FIELD_CACHE[collection_name] = cached
+    return cached
+
+
+def _fit_records_to_schema(collection_name: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    去掉集合 schema 中不存在的字段：新增的结构特征字段等在旧集合中不存在，
+    直接写入会被 Milvus 拒绝；旧集合缺少的得分由检索侧回退为现场计算。
+    """
+    if not records:
+        return records
+    try:
+        allowed = _get_collection_field_names(collection_name)
+    except Exception as e:
+        logger.warning(f"[_fit_records_to_schema] 读取集合 {collection_name} schema 失败，按原记录写入: {e}")
+        return records
+    extra = set(records[0].keys()) - allowed
+    if not extra:
+        return records
+    logger.info(f"[_fit_records_to_schema] 集合 {collection_name} 不含字段 {sorted(extra)}，写入时忽略")
+    return [{k: v for k, v in r.items() if k in allowed} for r in records]
+
+
+def _build_doc_vector(records: List[Dict[str, Any]], model: SentenceTransformer) -> List[float]:
+    """
+    文档级向量：DOC_VECTOR_SOURCE=text 用标题+摘要+关键词编码，centroid 用 chunk 向量质心；
+    auto（默认）在有摘要或关键词时编码文本，否则取质心。结果做 L2 归一化（IP 度量）。
+    """
+    first = records[0]
+    source = os.getenv("DOC_VECTOR_SOURCE", "auto").strip().lower()
+    text = "\n".join(x for x in (first.get("title"), first.get("abstract_text"), first.get("keywords_text")) if x)
+    has_summary_fields = bool(first.get("abstract_text") or first.get("keywords_text"))
+    if text and (source == "text" or (source == "auto" and has_summary_fields)):
+        vec = np.asarray(model.encode([text], task="retrieval", show_progress_bar=False, normalize_embeddings=True)[0], dtype=np.float32)
+    else:
+        mat = np.asarray([r["vector_content"] for r in records], dtype=np.float32)
+        mat = mat[np.abs(mat).sum(axis=1) > 0]
+        if mat.size == 0:
+            return []
+        vec = mat.mean(axis=0)
+    norm = float(np.linalg.norm(vec))
+    return (vec / norm).tolist() if norm > 0 else []
+
+
+def _doc_fields_record(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """文档级记录的键与文档级字段（不含向量）。"""
+    first = records[0]
+    record: Dict[str, Any] = {
+        "id": first["doc_id"],
+        "kb_id": first.get("kb_id"),
+        "security_level": first.get("security_level"),
+    }
+    for field in doc_metadata.DOC_LEVEL_FIELDS:
+        record[field] = first.get(field) or ""
+    record["title"] = record["title"][:2048]
+    return record
+
+
+def _build_doc_record(records: List[Dict[str, Any]], model: SentenceTransformer) -> Optional[Dict[str, Any]]:
+    """构建该文档在文档级集合中的记录（向量 + 文档级字段）；默认布局下无可用向量时返回 None。"""
+    vec = _build_doc_vector(records, model)
+    if not vec:
+        if not doc_metadata.is_normalized_layout():
+            return None
+        # 全部 chunk 为空时仍需保存文档级字段，向量置零
+        vec = _zero_vector(len(records[0]["vector_content"]))
+    record = _doc_fields_record(records)
+    record["vector_content"] = vec
+    return record
+
+
+def _write_doc_record(collection_name: str, records: List[Dict[str, Any]], model: SentenceTransformer) -> None:
+    """
+    写入该文档的文档级记录（向量 + 文档级字段）。
+    默认布局下在 chunk 写入成功后调用，失败只记日志；规范化布局下 chunk 不含文档级字段，
+    须在写 chunk 之前调用，写入失败向上抛出。
+    """
+    if not _doc_collection_enabled() or not records:
+        return
+    normalized = doc_metadata.is_normalized_layout()
+    try:
+        record = _build_doc_record(records, model)
+        if record is not None:
+            _milvus_insert(doc_metadata.docs_collection_name(collection_name), [record])
+    except Exception as e:
+        if normalized:
+            raise
+        logger.warning(f"[_write_doc_record] 写入文档级记录失败 doc_id={records[0].get('doc_id')}: {e}")
+
+
+def _discard_doc_records(collection_name: str, doc_ids: Sequence[int]) -> None:
+    """chunk 写入失败时删除已先行写入的文档级记录（失败只记日志）。"""
+    if not doc_ids:
+        return
+    try:
+        _delete_docs_by_ids(doc_metadata.docs_collection_name(collection_name), "id", list(doc_ids))
+    except Exception as e:
+        logger.warning(f"[_discard_doc_records] 删除文档级记录失败 doc_ids={list(doc_ids)}: {e}")
+
+
+def backfill_doc_vector_collection(collection_name: Optional[str] = None, batch_docs: int = 64) -> Dict[str, Any]:
+    """
+    为文档级集合补写缺失的文档记录：文档级集合建在已有数据的 chunk 集合上时，升级前入库的论文没有文档级记录，
+    两阶段检索会按覆盖核对退回单阶段检索，直到补写完成。
+    按 doc_id 每 batch_docs 篇读取其 chunk（向量与文档级字段），按与入库相同的规则生成文档记录后写入；可重复运行，
+    每次只补写仍缺失的文档。
+    """
+    _load_milvus_env()
+    collection = collection_name or _get_default_collection_name()
+    if not _doc_collection_enabled():
+        raise ValueError("DOC_VECTOR_ENABLED 已关闭，不写入文档级集合")
+    _connect_milvus()
+    if not utility.has_collection(collection, using="default"):
+        raise ValueError(f"集合 {collection} 不存在")
+    model = _get_embedding_model()
+    env_dim = os.getenv("EMBEDDING_DIM")
+    vector_dim = int(env_dim) if env_dim else model.get_sentence_embedding_dimension()
+    ensure_parent_child_collection(collection, vector_dim)
+    docs_collection = doc_metadata.docs_collection_name(collection)
+    chunk_coll = _get_milvus_collection(collection)
+    chunk_coll.load()
+    docs_coll = _get_milvus_collection(docs_collection)
+    docs_coll.load()
+
+    missing = doc_metadata.doc_ids_missing_from_docs(chunk_coll, docs_coll)
+    chunk_fields = _get_collection_field_names(collection)
+    output_fields = ["doc_id", "kb_id", "security_level", "vector_content"]
+    output_fields += [f for f in doc_metadata.DOC_LEVEL_FIELDS if f in chunk_fields]
+    logger.error(f"[backfill_doc_vector_collection] 集合 {collection} 有 {len(missing)} 篇文档缺少文档级记录")
+
+    written, skipped = 0, 0
+    for start in range(0, len(missing), max(1, batch_docs)):
+        batch = missing[start:start + max(1, batch_docs)]
+        records_by_doc: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        expr = f"doc_id in [{', '.join(str(x) for x in batch)}]"
+        for row in doc_metadata.iter_query_rows(chunk_coll, expr, output_fields):
+            records_by_doc[int(row["doc_id"])].append(row)
+        doc_records = []
+        for doc_id in batch:
+            record = _build_doc_record(records_by_doc[doc_id], model) if records_by_doc.get(doc_id) else None
+            if record is None:
+                skipped += 1
+                continue
+            doc_records.append(record)
+        if doc_records:
+            _milvus_insert(docs_collection, doc_records)
+            written += len(doc_records)
+        logger.error(f"[backfill_doc_vector_collection] 已补写 {written}/{len(missing)} 篇")
+    if written:
+        milvus_writer.flush_and_compact(docs_collection, _get_milvus_collection, False)
+
+    summary = {
+        "collection": collection,
+        "docs_collection": docs_collection,
+        "missing_docs": len(missing),
+        "written_docs": written,
+        "skipped_docs": skipped,
+    }
+    logger.error(f"[backfill_doc_vector_collection] 完成: {summary}")
+    return summary
+
+
+def _update_doc_side_indexes(collection_name: str, records: List[Dict[str, Any]]) -> None:
+    """Milvus 写入成功后同步更新锚点/关键事实倒排索引与标题索引（失败只记日志，不影响入库）。"""
+    if not records:
+        return
+    title_index.note_document_written(collection_name, records[0]["doc_id"], records[0].get("title") or "")
+    if not anchor_index.is_enabled():
+        return
+    try:
+        n = anchor_index.get_anchor_index().add_records(collection_name, records)
+        logger.info(f"[_update_doc_side_indexes] 集合 {collection_name} 写入锚点倒排 {n} 条")
+    except Exception as e:
+        logger.warning(f"[_update_doc_side_indexes] 写入锚点索引失败: {e}")
+
+
+def _remove_doc_side_indexes(collection_name: str, doc_id: int) -> None:
+    """删除 / 更新文档时清理该 doc_id 的文档级记录、锚点索引与标题索引条目。"""
+    title_index.note_document_deleted(collection_name, doc_id)
+    doc_metadata.note_document_deleted(collection_name, doc_id)
+    if _doc_collection_enabled():
+        try:
+            docs_collection = doc_metadata.docs_collection_name(collection_name)
+            if utility.has_collection(docs_collection, using="default"):
+                Collection(docs_collection, using="default").delete(f"id == {doc_id}")
+        except Exception as e:
+            logger.warning(f"[_remove_doc_side_indexes] 删除 doc_id={doc_id} 的文档级记录失败: {e}")
+    if not anchor_index.is_enabled():
+        return
+    try:
+        anchor_index.get_anchor_index().delete_doc(collection_name, doc_id)
+    except Exception as e:
+        logger.warning(f"[_remove_doc_side_indexes] 清理 doc_id={doc_id} 的锚点索引失败: {e}")
 
 
 # ===========================
@@ -636,33 +935,21 @@ def _build_plain_text_paper_data(text: str, filename: str, *, title: str = "") -
     }
 
 
-def _build_records_and_chunks(
-    *,
-    data: Dict[str, Any],
-    kb_id: int,
-    doc_id: int,
-    model: SentenceTransformer,
-    dim: int,
-    tenant_id: int = 1,
-    security_level: int = 1,
-    owner_id: int = 1,
-) -> Tuple[List[Dict[str, Any]], List[DocumentChunkModel]]:
-    """从 JSON 数据构建 Milvus 记录与 DocumentChunkModel."""
+def _prepare_paper_chunks(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    入库第一阶段（CPU）：抽取论文元信息并做父子切片，得到待编码的 child 块。
+    Returns:
+        {"title", "authors_str", "institutions_str", "abstract_text", "keywords_text", "summary_text",
+         "flat_children": [(chunk, parent_content, parent_index)], "contents": [child 文本]}；无可写入块时返回 None
+    """
     meta = _extract_paper_metadata(data)
     title: str = meta["title"]
-    authors_str: str = meta["authors_str"]
-    institutions_str: str = meta["institutions_str"]
-    abstract_text: str = meta["abstract"]
-    keywords_list: List[str] = meta["keywords_list"]
-    summary_text: str = meta["conclusion"]
     original_text: str = meta["original_text"]
 
-    logger.error(f"[_build_records_and_chunks] 入参: original_text 长度={len(original_text)}, title={title[:50] if title else ''}...")
+    logger.error(f"[_prepare_paper_chunks] 入参: original_text 长度={len(original_text)}, title={title[:50] if title else ''}...")
     if not original_text:
-        logger.error("[_build_records_and_chunks] 原因: original_text 为空，直接返回 []")
-        return [], []
-
-    keywords_text = "；".join(keywords_list)
+        logger.error("[_prepare_paper_chunks] 原因: original_text 为空，直接返回 None")
+        return None
 
     chunk_req = ChunkRequest(
         text=original_text,
@@ -671,11 +958,11 @@ def _build_records_and_chunks(
     chunks = ChunkerService.chunk(chunk_req)
     chunks_list = list(chunks) if chunks else []
     chunks_count = len(chunks_list)
-    logger.error(f"[_build_records_and_chunks] ChunkerService 返回 chunks 数量: {chunks_count}")
+    logger.error(f"[_prepare_paper_chunks] ChunkerService 返回 chunks 数量: {chunks_count}")
 
     if not chunks_list:
-        logger.error("[_build_records_and_chunks] 原因: ChunkerService 切片结果为空，返回 []")
-        return [], []
+        logger.error("[_prepare_paper_chunks] 原因: ChunkerService 切片结果为空，返回 None")
+        return None
 
     parents: Dict[int, Any] = {}
     children_by_parent_index: Dict[int, List[Any]] = {}
@@ -714,14 +1001,14 @@ def _build_records_and_chunks(
         # 前 5 个 chunk 打印详细诊断
         if i < 5:
             logger.error(
-                f"[_build_records_and_chunks] chunk[{i}] chunk_index={chunk_index} chunk_type={chunk_type!r} "
+                f"[_prepare_paper_chunks] chunk[{i}] chunk_index={chunk_index} chunk_type={chunk_type!r} "
                 f"parent_idx={parent_idx} metadata.keys={list(metadata.keys())} -> "
                 f"{'child' if (is_child and parent_idx is not None) else 'parent' if not is_child else 'child(无parent_idx)'}"
             )
 
     flat_children_count = sum(len(v) for v in children_by_parent_index.values())
     logger.error(
-        f"[_build_records_and_chunks] 解析结果: parent 块 {len(parents)} 个(parent_keys={list(parents.keys())[:20]}), "
+        f"[_prepare_paper_chunks] 解析结果: parent 块 {len(parents)} 个(parent_keys={list(parents.keys())[:20]}), "
         f"child 块 {flat_children_count} 个(child_parent_keys={list(children_by_parent_index.keys())[:20]}), "
         f"child 但无 parent_idx 的块 {len(chunks_without_parent)} 个"
     )
@@ -730,22 +1017,22 @@ def _build_records_and_chunks(
     orphan_parent_indices = [k for k in children_by_parent_index if k not in parents]
     if orphan_parent_indices:
         logger.error(
-            f"[_build_records_and_chunks] 诊断: 有 {len(orphan_parent_indices)} 个 child 引用的 parent_index 不在 parents 中: "
+            f"[_prepare_paper_chunks] 诊断: 有 {len(orphan_parent_indices)} 个 child 引用的 parent_index 不在 parents 中: "
             f"{orphan_parent_indices[:10]}，这些 child 不会被写入"
         )
 
     # 先按顺序收集所有 child 的 (chunk, parent_content)，再批量 encode
-    flat_children: List[Tuple[Any, str]] = []
+    flat_children: List[Tuple[Any, str, int]] = []
     for parent_index in sorted(parents.keys()):
         parent_chunk = parents[parent_index]
         parent_content: str = getattr(parent_chunk, "content", "") or ""
         for c in children_by_parent_index.get(parent_index, []):
-            flat_children.append((c, parent_content))
+            flat_children.append((c, parent_content, parent_index))
 
     # Fallback1：全为 child 且 parent_idx 为 None 时，将这些 chunk 视为 parent 以便后续 fallback2 使用
     if not parents and chunks_without_parent:
         logger.error(
-            f"[_build_records_and_chunks] 无 parent 块，但有 {len(chunks_without_parent)} 个 child(无 parent_idx)，"
+            f"[_prepare_paper_chunks] 无 parent 块，但有 {len(chunks_without_parent)} 个 child(无 parent_idx)，"
             "将其视为 parent 以便写入"
         )
         for i, c in enumerate(chunks_without_parent):
@@ -756,48 +1043,94 @@ def _build_records_and_chunks(
         c0 = next(iter(parents.values()))
         meta0 = getattr(c0, "metadata", {}) or {}
         logger.error(
-            "[_build_records_and_chunks] 无 child 块，触发 fallback：将 parent 块作为可写入块。"
+            "[_prepare_paper_chunks] 无 child 块，触发 fallback：将 parent 块作为可写入块。"
             f"首个 chunk 诊断: metadata.keys={list(meta0.keys())} chunk_type={meta0.get('chunk_type')!r} "
             f"parent_chunk_id={getattr(c0, 'parent_chunk_id', None)} content_len={len(getattr(c0, 'content', '') or '')}"
         )
         for parent_index in sorted(parents.keys()):
             parent_chunk = parents[parent_index]
             parent_content = getattr(parent_chunk, "content", "") or ""
-            flat_children.append((parent_chunk, parent_content))
-
-    records: List[Dict[str, Any]] = []
-    chunk_models: List[DocumentChunkModel] = []
-
-    embedding_model_name = os.getenv("EMBEDDING_MODEL", "jinaai/jina-embeddings-v5-text-small")
-
-    contents = [getattr(c, "content", "") or "" for c, _ in flat_children]
-    to_encode = [t for t in contents if t]
-    logger.error(
-        f"[_build_records_and_chunks] flat_children 数量={len(flat_children)}, 非空 content 数量={len(to_encode)}"
-    )
-    if to_encode:
-        content_vecs = model.encode(
-            to_encode,
-            task="retrieval",
-            show_progress_bar=False,
-            batch_size=64,
-        )
-        vec_iter = iter(content_vecs)
-    else:
-        vec_iter = iter([])
-        if flat_children:
-            logger.error(
-                "[_build_records_and_chunks] 诊断: flat_children 非空但所有 content 为空，将使用零向量"
-            )
+            flat_children.append((parent_chunk, parent_content, parent_index))
 
     if not flat_children:
         logger.error(
-            "[_build_records_and_chunks] 原因: flat_children 为空 -> records 为空。"
+            "[_prepare_paper_chunks] 原因: flat_children 为空 -> records 为空。"
             f"可能原因: 1) 全为 child 且 parent_idx 不在 parents 中 2) 全为 child 且 parent_idx 为 None 3) parents 为空"
         )
-        return [], []
+        return None
+
+    contents = [getattr(c, "content", "") or "" for c, _, _ in flat_children]
+    return {
+        "title": title,
+        "authors_str": meta["authors_str"],
+        "institutions_str": meta["institutions_str"],
+        "abstract_text": meta["abstract"],
+        "keywords_text": "；".join(meta["keywords_list"]),
+        "summary_text": meta["conclusion"],
+        "flat_children": flat_children,
+        "contents": contents,
+    }
+
+
+def _encode_chunk_contents(model: SentenceTransformer, contents: Sequence[str]) -> List[Optional[List[float]]]:
+    """入库第二阶段（GPU/CPU 密集）：编码 child 文本，返回与 contents 对齐的向量（空文本为 None）。"""
+    return _encode_pooled_contents(model, [contents])[0]
+
+
+def _encode_pooled_contents(
+    model: SentenceTransformer, contents_per_doc: Sequence[Sequence[str]]
+) -> List[List[Optional[List[float]]]]:
+    """
+    跨文档合并编码：多篇文档的非空 chunk 文本汇成一个池，按长度排序、按设备与序列长度自适应切批
+    （见 embed_batching），再把向量分发回各文档；空文本对应 None。
+    """
+    pooled: List[str] = []
+    for contents in contents_per_doc:
+        pooled.extend(t for t in contents if t)
+    logger.error(f"[_encode_pooled_contents] 文档数={len(contents_per_doc)}, 非空 content 数量={len(pooled)}")
+    vectors = embed_batching.encode_texts(model, pooled, _get_embedding_device(), task="retrieval") if pooled else None
+
+    out: List[List[Optional[List[float]]]] = []
+    pos = 0
+    for contents in contents_per_doc:
+        doc_vectors: List[Optional[List[float]]] = []
+        for t in contents:
+            if t:
+                doc_vectors.append(vectors[pos].tolist())
+                pos += 1
+            else:
+                doc_vectors.append(None)
+        out.append(doc_vectors)
+    return out
+
+
+def _assemble_records_and_chunks(
+    prepared: Dict[str, Any],
+    vectors: Sequence[Optional[List[float]]],
+    *,
+    kb_id: int,
+    doc_id: int,
+    dim: int,
+    tenant_id: int = 1,
+    security_level: int = 1,
+    owner_id: int = 1,
+) -> Tuple[List[Dict[str, Any]], List[DocumentChunkModel]]:
+    """入库第三阶段：按 doc_id 组装 Milvus 记录与 DocumentChunkModel（无模型、无 IO）。"""
+    title: str = prepared["title"]
+    authors_str: str = prepared["authors_str"]
+    institutions_str: str = prepared["institutions_str"]
+    abstract_text: str = prepared["abstract_text"]
+    keywords_text: str = prepared["keywords_text"]
+    summary_text: str = prepared["summary_text"]
+    flat_children: List[Tuple[Any, str, int]] = prepared["flat_children"]
+    contents: List[str] = prepared["contents"]
+
+    records: List[Dict[str, Any]] = []
+    chunk_models: List[DocumentChunkModel] = []
 
-    for i, ((c, parent_content), content) in enumerate(zip(flat_children, contents), start=1):
+    embedding_model_name = os.getenv("EMBEDDING_MODEL", "jinaai/jina-embeddings-v5-text-small")
+
+    for i, ((c, parent_content, parent_index), content, vec) in enumerate(zip(flat_children, contents, vectors), start=1):
         chunk_index: int = int(getattr(c, "chunk_index", 0) or 0)
         start_index: int = int(getattr(c, "start_index", 0) or 0)
         end_index: int = int(getattr(c, "end_index", 0) or 0)
@@ -809,7 +1142,7 @@ def _build_records_and_chunks(
         page_val = metadata.get("page")
         page: Optional[int] = int(page_val) if page_val is not None else None
 
-        vec_content = next(vec_iter).tolist() if content else _zero_vector(dim)
+        vec_content = vec if vec is not None else _zero_vector(dim)
 
         id_val = _hash_id(f"{doc_id}_{i}_{content[:80]}" if content else f"{doc_id}_{i}")
 
@@ -821,6 +1154,7 @@ def _build_records_and_chunks(
             "owner_id": owner_id,
             "chunk_index": chunk_index,
             "chunk_type": chunk_type,
+            "parent_index": parent_index,
             "position_start": start_index,
             "position_end": end_index,
             "section_title": section_title,
@@ -836,6 +1170,7 @@ def _build_records_and_chunks(
             "tags": "",
             "vector_content": vec_content,
         }
+        record.update(analyze_chunk_structure(content))
         records.append(record)
 
         chunk = DocumentChunkModel()
@@ -855,452 +1190,875 @@ def _build_records_and_chunks(
         }
         chunk_models.append(chunk)
 
-    logger.error(f"[_build_records_and_chunks] 构建完成: records={len(records)}, chunk_models={len(chunk_models)}")
+    logger.error(f"[_assemble_records_and_chunks] 构建完成: records={len(records)}, chunk_models={len(chunk_models)}")
     return records, chunk_models
 
-async def build_index_from_json_contents(
-    kb_id: int,
-    items: Sequence[Tuple[str, str]],
-    collection_name: Optional[str] = None,
-    model_name: Optional[str] = None,
-    dim: Optional[int] = None,
-    skip_base_db: bool = False,
-) -> Dict[str, Any]:
-    """从上传的 JSON 内容批量构建索引，写入 Milvus；可选写入 BaseDB。
-
-    - skip_base_db=True：仅写入 Milvus，不调用 BaseDB（适用于 BaseDB 不可用或本地脚本场景）
-    - skip_base_db=False：先写入 BaseDB 获取 doc_id，再写入 Milvus 与切片表（与 API 行为一致）
-    """
-    logger.error(f"[build_index_from_json_contents] 开始: kb_id={kb_id}, 文件数={len(items)}, skip_base_db={skip_base_db}")
-
-    if not items:
-        logger.warning("[build_index_from_json_contents] 无待处理文件")
-        return {
-            "kb_id": kb_id,
-            "total_documents": 0,
-            "total_chunks": 0,
-            "milvus_records": 0,
-            "skipped_files": [],
-        }
-
-    _load_milvus_env()
-    if not skip_base_db:
-        _load_db_env()
-
-    collection = collection_name or _get_default_collection_name()
-
-    if model_name:
-        os.environ["EMBEDDING_MODEL"] = model_name
-        model = _get_embedding_model()
-    else:
-        model = _get_embedding_model()
 
-    # 维度必须与模型输出一致：jina-embeddings-v5-text-small 为 1024，默认 768 会报错
-    if dim is not None:
-        vector_dim = dim
-    else:
-        env_dim = os.getenv("EMBEDDING_DIM")
-        vector_dim = int(env_dim) if env_dim else model.get_sentence_embedding_dimension()
+def _build_records_and_chunks(
+    *,
+    data: Dict[str, Any],
+    kb_id: int,
+    doc_id: int,
+    model: SentenceTransformer,
+    dim: int,
+    tenant_id: int = 1,
+    security_level: int = 1,
+    owner_id: int = 1,
+) -> Tuple[List[Dict[str, Any]], List[DocumentChunkModel]]:
+    """从 JSON 数据构建 Milvus 记录与 DocumentChunkModel（切片 → 编码 → 组装，单文档同步执行）。"""
+    prepared = _prepare_paper_chunks(data)
+    if prepared is None:
+        return [], []
+    vectors = _encode_chunk_contents(model, prepared["contents"])
+    return _assemble_records_and_chunks(
+        prepared,
+        vectors,
+        kb_id=kb_id,
+        doc_id=doc_id,
+        dim=dim,
+        tenant_id=tenant_id,
+        security_level=security_level,
+        owner_id=owner_id,
+    )
 
-    ensure_parent_child_collection(collection, vector_dim)
-    logger.error(f"[build_index_from_json_contents] 集合 {collection} 已就绪, vector_dim={vector_dim}")
 
-    doc_client = _get_document_client() if not skip_base_db else None
-    chunk_client = _get_chunk_client() if not skip_base_db else None
+def _milvus_insert(collection: str, records: List[Dict[str, Any]]) -> Any:
+    """按集合 schema 裁剪字段后写入 Milvus。"""
+    return StorageService.insert(InsertRequest(collection_name=collection, records=_fit_records_to_schema(collection, records)))
 
-    tenant_id = int(os.getenv("DB_TENANT_ID", "1"))
-    owner_id = int(os.getenv("DB_OWNER_ID", "1"))
-    security_level = int(os.getenv("DB_SECURITY_LEVEL", "1"))
-    status = os.getenv("DB_DOCUMENT_STATUS", "indexed")
 
-    total_documents = 0
-    total_chunks = 0
-    milvus_records = 0
-    skipped_files: List[str] = []
+def _get_milvus_collection(collection: str) -> Collection:
+    _connect_milvus()
+    return Collection(collection, using="default")
 
-    for filename, content in items:
-        logger.error(f"[build_index_from_json_contents] 处理文件: {filename}")
-        try:
-            data = json.loads(content)
-        except json.JSONDecodeError as e:
-            logger.warning(f"[build_index_from_json_contents] JSON 解析失败 {filename}: {e}")
-            skipped_files.append(filename)
-            continue
 
-        meta = _extract_paper_metadata(data)
-        original_text: str = meta["original_text"]
-        if not original_text:
-            logger.warning(f"[build_index_from_json_contents] {filename} original_text 为空，跳过")
-            skipped_files.append(filename)
-            continue
-        logger.error(f"[build_index_from_json_contents] {filename} original_text 长度: {len(original_text)}")
+def _insert_paper_records(collection: str, records: List[Dict[str, Any]], model: SentenceTransformer) -> List[int]:
+    """写入 Milvus 并同步更新锚点 / 标题索引与文档级记录，返回 Milvus ids（flush 交给 milvus_writer 的策略）。"""
+    logger.error(f"[_insert_paper_records] 写入 Milvus: collection={collection}, records 数={len(records)}")
+    normalized = doc_metadata.is_normalized_layout()
+    if normalized:
+        # 规范化布局：先写文档级记录，chunk 一旦可被检索到，其标题等字段即可回填
+        _write_doc_record(collection, records, model)
+    try:
+        ids = _milvus_insert(collection, records)
+    except Exception:
+        if normalized:
+            _discard_doc_records(collection, [records[0]["doc_id"]])
+        raise
+    _update_doc_side_indexes(collection, records)
+    if not normalized:
+        _write_doc_record(collection, records, model)
+    milvus_writer.note_mutation(collection, len(records), _get_milvus_collection)
+    return [int(x) for x in ids] if ids else []
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取入库并发度 / 批大小等正整数配置，至少为 1。"""
+    return max(1, get_env_int(name, default))
+
+
+class _IngestTask:
+    """入库流水线中单个文件的处理状态，依次由各阶段填充。"""
+
+    def __init__(self, index: int, filename: str, load: Callable[[], Tuple[Dict[str, Any], Optional[DocumentModel]]]):
+        self.index = index
+        self.filename = filename
+        # 在解析阶段的线程中执行，返回 (论文数据, 待创建的 DocumentModel；None 表示不写 BaseDB 文档、用哈希 doc_id)
+        self.load = load
+        self.data: Dict[str, Any] = {}
+        self.document: Optional[DocumentModel] = None
+        self.prepared: Optional[Dict[str, Any]] = None
+        self.vectors: List[Optional[List[float]]] = []
+        self.doc_id: Optional[int] = None
+        self.records: List[Dict[str, Any]] = []
+        self.chunk_models: List[DocumentChunkModel] = []
+        self.chunk_count = 0
+        self.milvus_ids: List[int] = []
+
+    def __repr__(self) -> str:
+        return self.filename
+
+
+def _prepare_and_embed_stages(model: SentenceTransformer) -> List[ingest_pipeline.PipelineStage]:
+    """入库流水线前两个阶段（在线入库与离线导出共用）：解析/切片（线程池）→ 跨文件合批的向量编码（线程池）。"""
+
+    def _load_and_prepare(task: _IngestTask) -> _IngestTask:
+        task.data, task.document = task.load()
+        task.prepared = _prepare_paper_chunks(task.data)
+        if task.prepared is None:
+            raise ingest_pipeline.SkipItem("正文为空或切片结果为空")
+        return task
+
+    async def _prepare(task: _IngestTask) -> _IngestTask:
+        return await asyncio.to_thread(_load_and_prepare, task)
+
+    async def _embed(tasks: List[_IngestTask]) -> List[_IngestTask]:
+        # 多个文件的 chunk 合并为一个编码池，向量按文件分发回去
+        pooled = await asyncio.to_thread(_encode_pooled_contents, model, [t.prepared["contents"] for t in tasks])
+        for task, vectors in zip(tasks, pooled):
+            task.vectors = vectors
+        return tasks
+
+    return [
+        ingest_pipeline.PipelineStage("prepare", _prepare, _env_int("INGEST_PREPARE_WORKERS", 2)),
+        ingest_pipeline.PipelineStage(
+            "embed",
+            _embed,
+            _env_int("INGEST_EMBED_WORKERS", 1),
+            batch_weight=_env_int("INGEST_EMBED_POOL_CHUNKS", 512),
+            weight=lambda task: len(task.prepared["contents"]),
+            max_wait_s=_env_int("INGEST_EMBED_POOL_WAIT_MS", 50) / 1000.0,
+        ),
+    ]
+
+
+def _offline_doc_id(filename: str, data: Dict[str, Any]) -> int:
+    """不写 BaseDB 文档时由文件名与正文确定性生成 doc_id（重复入库 / 离线导出续传得到相同 id）。"""
+    original_text = _extract_paper_metadata(data)["original_text"]
+    return _hash_id(f"{filename}_{original_text[:100]}")
+
+
+async def _discard_partial_document(
+    collection: str, doc_id: int, chunk_client: Optional[DocumentChunkClient]
+) -> None:
+    """删除某文档已写入的 Milvus 记录、文档级记录与侧索引，以及 BaseDB 切片（文档本身保留，供重新写入）。"""
+    await asyncio.to_thread(_delete_docs_by_ids, collection, "doc_id", [doc_id])
+    await asyncio.to_thread(_remove_doc_side_indexes, collection, doc_id)
+    if chunk_client is not None:
+        await chunk_client.remove_document_chunks_by_doc_id(doc_id=doc_id)
 
-        title: str = meta["title"]
-        authors_raw: List[Dict[str, Any]] = meta["authors_raw"]
-        institutions_list = list(
-            {a.get("school") for a in authors_raw if a.get("school")}
-        )
-        tags: List[str] = meta["tags"]
 
-        doc_extra: Dict[str, Any] = {
-            "title": title,
-            "tags": tags,
-            "authors": authors_raw,
-            "institutions": institutions_list,
-            "source_file": filename,
-        }
+def _build_ingest_stages(
+    *,
+    log_prefix: str,
+    kb_id: int,
+    collection: str,
+    model: SentenceTransformer,
+    vector_dim: int,
+    write_chunks: bool,
+    doc_client: Optional[DocumentClient],
+    chunk_client: Optional[DocumentChunkClient],
+    tenant_id: int,
+    security_level: int,
+    owner_id: int,
+    docs_collection: Optional[str],
+    on_document_done: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+    on_document_created: Optional[Callable[[int, int], None]] = None,
+    resume_doc_ids: Optional[Dict[int, int]] = None,
+) -> List[ingest_pipeline.PipelineStage]:
+    """
+    入库流水线四个阶段：解析/切片（线程池）→ 跨文件合批的向量编码（线程池）→ BaseDB 文档与切片写入（异步 IO）
+    → 跨文件合批的 Milvus 写入（线程池，每批各用一个 MilvusWriteBuffer 按条数与字节切批；docs_collection 非空时同时写文档级记录）。
+    各阶段并发度由 INGEST_*_WORKERS 配置。
+    """
 
-        if skip_base_db:
-            doc_id = _hash_id(f"{filename}_{original_text[:100]}")
-            logger.error(f"[build_index_from_json_contents] skip_base_db=True, 使用 hash doc_id={doc_id}")
+    async def _write_db(task: _IngestTask) -> _IngestTask:
+        reused_doc_id = (resume_doc_ids or {}).get(task.index)
+        if reused_doc_id is not None:
+            # 上次运行已创建文档但未写完：沿用其 doc_id，先清掉可能已部分写入的切片与向量
+            task.doc_id = reused_doc_id
+            await _discard_partial_document(collection, reused_doc_id, chunk_client)
+        elif task.document is None:
+            task.doc_id = _offline_doc_id(task.filename, task.data)
         else:
-            document = DocumentModel()
-            document.kb_id = kb_id
-            document.tenant_id = tenant_id
-            document.owner_id = owner_id
-            document.file_name = filename
-            document.minio_path = f"pdf/{filename}"
-            document.file_type = "pdf"
-            document.file_size = len(original_text.encode("utf-8"))
-            document.markdown_content = original_text
-            document.status = status
-            document.security_level = security_level
-            document.extra = doc_extra
-
-            try:
-                created = await doc_client.create_document(document)
-                logger.error(f"[build_index_from_json_contents] BaseDB create_document 返回类型: {type(created).__name__}")
-            except Exception as exc:
-                logger.error(f"[build_index_from_json_contents] BaseDB 创建文档失败 {filename}: {exc}", exc_info=True)
-                skipped_files.append(filename)
-                continue
-
+            created = await doc_client.create_document(task.document)
             # 兼容多种返回结构: {"data": {"id": N}} / {"data": [{"id": N}]} / 对象.data.id
             doc_id = _extract_doc_id_from_create_response(created)
             if not isinstance(doc_id, int):
-                logger.error(
-                    f"[build_index_from_json_contents] 无法从 BaseDB 响应提取 doc_id, created={created!r}"
-                )
-                skipped_files.append(filename)
-                continue
-            logger.error(f"[build_index_from_json_contents] doc_id={doc_id}")
-        records, chunk_models = _build_records_and_chunks(
-            data=data,
+                raise ingest_pipeline.SkipItem(f"无法从 BaseDB 响应提取 doc_id, created={created!r}")
+            task.doc_id = doc_id
+        logger.error(f"[{log_prefix}] {task.filename} doc_id={task.doc_id}")
+        if on_document_created is not None:
+            # 写切片 / Milvus 之前先记录 doc_id，中断后恢复时据此清理与复用
+            on_document_created(task.index, task.doc_id)
+
+        task.records, task.chunk_models = _assemble_records_and_chunks(
+            task.prepared,
+            task.vectors,
             kb_id=kb_id,
-            doc_id=doc_id,
-            model=model,
+            doc_id=task.doc_id,
             dim=vector_dim,
             tenant_id=tenant_id,
             security_level=security_level,
             owner_id=owner_id,
         )
-
-        if not records:
-            logger.warning(f"[build_index_from_json_contents] {filename} records 为空（切片无 child 块），跳过")
-            skipped_files.append(filename)
-            continue
+        # 编码结果已写入 records，释放中间数据与原文
+        task.prepared, task.vectors, task.data, task.document = None, [], {}, None
+        if not task.records:
+            raise ingest_pipeline.SkipItem("records 为空（切片无 child 块）")
 
         # 使用 BaseDB 时：先写入 DB 获取 chunk_id，再替换 records 的 id 后写入 Milvus，保证 id 一致
-        if not skip_base_db:
-            try:
-                created = await chunk_client.create_document_chunk_batch(chunk_models)
-                logger.error(
-                    f"[build_index_from_json_contents] BaseDB create_document_chunk_batch 返回类型: {type(created).__name__}, "
-                    f"records 数={len(records)}"
-                )
-            except Exception as exc:
-                logger.error(f"[build_index_from_json_contents] BaseDB 创建 chunk 失败 {filename}: {exc}", exc_info=True)
-                skipped_files.append(filename)
-                continue
-            chunk_ids = _extract_chunk_ids_from_batch_response(created, records)
+        if write_chunks:
+            created = await chunk_client.create_document_chunk_batch(task.chunk_models)
+            chunk_ids = _extract_chunk_ids_from_batch_response(created, task.records)
             if not chunk_ids:
-                logger.error(
-                    f"[build_index_from_json_contents] 无法从 BaseDB 响应提取 chunk_ids, "
-                    f"created 类型={type(created).__name__}, records 数={len(records)}。"
-                    "请检查 BaseDB create_document_chunk_batch 返回格式与 _extract_chunk_ids_from_batch_response 匹配逻辑。"
+                raise ingest_pipeline.SkipItem(
+                    f"无法从 BaseDB 响应提取 chunk_ids, created 类型={type(created).__name__}, records 数={len(task.records)}"
                 )
-                skipped_files.append(filename)
-                continue
-            logger.error(f"[build_index_from_json_contents] 已获取 chunk_ids 数量: {len(chunk_ids)}")
-            for rec, cid in zip(records, chunk_ids):
+            for rec, cid in zip(task.records, chunk_ids):
                 rec["id"] = cid
+        return task
 
-        logger.error(f"[build_index_from_json_contents] 准备写入 Milvus: collection={collection}, records 数={len(records)}")
-        try:
-            insert_req = InsertRequest(
-                collection_name=collection,
-                records=records,
-            )
-            ids = StorageService.insert(insert_req)
-            logger.error(f"[build_index_from_json_contents] Milvus 写入成功: 返回 ids 数量={len(ids) if ids else 0}")
-        except Exception as exc:
-            logger.error(f"[build_index_from_json_contents] Milvus 写入失败 {filename}: {exc}", exc_info=True)
-            skipped_files.append(filename)
-            continue
-        inserted_count = len(ids) if ids else 0
-        total_documents += 1
-        total_chunks += len(chunk_models)
-        milvus_records += inserted_count
-        logger.error(f"[build_index_from_json_contents] {filename} 完成: doc_id={doc_id}, 写入 Milvus {inserted_count} 条")
+    normalized = doc_metadata.is_normalized_layout()
 
-    logger.error(
-        f"[build_index_from_json_contents] 全部完成: total_documents={total_documents}, "
-        f"total_chunks={total_chunks}, milvus_records={milvus_records}, skipped={len(skipped_files)}"
+    def _write_doc_batch(tasks: List[_IngestTask]) -> Dict[_IngestTask, BaseException]:
+        """写入一批文件的文档级记录，返回构建或写入失败的文件。"""
+        errors: Dict[_IngestTask, BaseException] = {}
+        doc_buffer = milvus_writer.MilvusWriteBuffer(docs_collection, _milvus_insert)
+        for task in tasks:
+            try:
+                record = _build_doc_record(task.records, model)
+            except Exception as e:
+                logger.warning(f"[{log_prefix}] {task.filename} 构建文档级记录失败: {e}")
+                errors[task] = e
+                continue
+            if record is not None:
+                doc_buffer.add([record], owner=task)
+        doc_buffer.write_pending()
+        for task, e in doc_buffer.failed().items():
+            errors.setdefault(task, e)
+        return errors
+
+    def _insert_batch(tasks: List[_IngestTask]) -> List[Any]:
+        errors: Dict[_IngestTask, BaseException] = {}
+        if docs_collection is not None and normalized:
+            # 规范化布局下 chunk 不含文档级字段：先写文档级记录，失败的文件不再写 chunk，
+            # 避免检索到无法回填标题等字段的 chunk
+            errors.update(_write_doc_batch(tasks))
+
+        # 缓冲只属于本批：并发的 insert worker 之间不共享待写记录与失败状态
+        chunk_buffer = milvus_writer.MilvusWriteBuffer(collection, _milvus_insert)
+        for task in tasks:
+            if task not in errors:
+                chunk_buffer.add(task.records, owner=task)
+        chunk_buffer.write_pending()
+        chunk_errors = chunk_buffer.failed()
+        errors.update(chunk_errors)
+        if docs_collection is not None and normalized:
+            _discard_doc_records(collection, [task.doc_id for task in chunk_errors])
+        elif docs_collection is not None:
+            # 默认布局下文档级记录只用于粗筛，写入失败只记日志
+            _write_doc_batch([task for task in tasks if task not in errors])
+
+        outs: List[Any] = []
+        for task in tasks:
+            if task in errors:
+                outs.append(errors[task])
+                continue
+            _update_doc_side_indexes(collection, task.records)
+            task.milvus_ids = [int(rec["id"]) for rec in task.records]
+            # 已完成的文件只保留计数，释放正文、向量与切片，内存不随批次文件数增长
+            task.chunk_count = len(task.chunk_models)
+            task.records, task.chunk_models = [], []
+            logger.error(f"[{log_prefix}] {task.filename} 完成: doc_id={task.doc_id}, 写入 Milvus {len(task.milvus_ids)} 条")
+            if on_document_done is not None:
+                on_document_done(
+                    task.index,
+                    {"filename": task.filename, "doc_id": task.doc_id, "chunks": len(task.milvus_ids)},
+                )
+            outs.append(task)
+        milvus_writer.note_mutation(collection, sum(len(t.milvus_ids) for t in tasks), _get_milvus_collection)
+        return outs
+
+    async def _insert(tasks: List[_IngestTask]) -> List[Any]:
+        return await asyncio.to_thread(_insert_batch, tasks)
+
+    return _prepare_and_embed_stages(model) + [
+        ingest_pipeline.PipelineStage("db_write", _write_db, _env_int("INGEST_DB_WORKERS", 4)),
+        ingest_pipeline.PipelineStage(
+            "milvus_insert",
+            _insert,
+            _env_int("INGEST_INSERT_WORKERS", 2),
+            batch_weight=milvus_writer.write_batch_records(),
+            weight=lambda task: len(task.records),
+            max_wait_s=_env_int("MILVUS_WRITE_MAX_DELAY_MS", 200) / 1000.0,
+        ),
+    ]
+
+
+async def _run_ingest_pipeline(
+    kb_id: int,
+    tasks: Iterable[_IngestTask],
+    *,
+    log_prefix: str,
+    create_documents: bool,
+    write_chunks: bool,
+    collection_name: Optional[str] = None,
+    dim: Optional[int] = None,
+    on_document_done: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+    on_document_created: Optional[Callable[[int, int], None]] = None,
+    resume_doc_ids: Optional[Dict[int, int]] = None,
+) -> Dict[str, Any]:
+    """
+    以流水线方式批量入库：不同文件的解析、编码、BaseDB 写入与 Milvus 写入并发进行，
+    阶段之间经有界队列（INGEST_QUEUE_SIZE）反压，单个文件失败只记入 skipped_files。
+    on_document_done(文件下标, {filename, doc_id, chunks}) 在文件写入 Milvus 后回调（在工作线程中执行）；
+    cancelled() 返回 True 后不再读入新文件，已在流水线中的文件照常处理完。
+    on_document_created(文件下标, doc_id) 在文档创建后、写入切片与 Milvus 之前回调；
+    resume_doc_ids（文件下标 -> doc_id）中的文件不再新建文档，沿用该 doc_id 并先清理上次写入的残留。
+    """
+    _load_milvus_env()
+    if create_documents or write_chunks:
+        _load_db_env()
+
+    collection = collection_name or _get_default_collection_name()
+    model = _get_embedding_model()
+    # 维度必须与模型输出一致：jina-embeddings-v5-text-small 为 1024，默认 768 会报错
+    if dim is not None:
+        vector_dim = dim
+    else:
+        env_dim = os.getenv("EMBEDDING_DIM")
+        vector_dim = int(env_dim) if env_dim else model.get_sentence_embedding_dimension()
+
+    ensure_parent_child_collection(collection, vector_dim)
+    logger.error(f"[{log_prefix}] 集合 {collection} 已就绪, vector_dim={vector_dim}")
+
+    stages = _build_ingest_stages(
+        log_prefix=log_prefix,
+        kb_id=kb_id,
+        collection=collection,
+        model=model,
+        vector_dim=vector_dim,
+        write_chunks=write_chunks,
+        doc_client=_get_document_client() if create_documents else None,
+        chunk_client=_get_chunk_client() if write_chunks else None,
+        tenant_id=int(os.getenv("DB_TENANT_ID", "1")),
+        security_level=int(os.getenv("DB_SECURITY_LEVEL", "1")),
+        owner_id=int(os.getenv("DB_OWNER_ID", "1")),
+        docs_collection=doc_metadata.docs_collection_name(collection) if _doc_collection_enabled() else None,
+        on_document_done=on_document_done,
+        on_document_created=on_document_created,
+        resume_doc_ids=resume_doc_ids,
     )
-    return {
+    if cancelled is not None:
+        tasks = itertools.takewhile(lambda _task: not cancelled(), tasks)
+    result = await ingest_pipeline.run_pipeline(tasks, stages, queue_size=_env_int("INGEST_QUEUE_SIZE", 8))
+
+    completed: List[_IngestTask] = result.completed
+    # 批量写入结束后统一 flush；写入量较大时触发 compaction 合并小 segment
+    written_records = sum(len(task.milvus_ids) for task in completed)
+    if written_records:
+        compact = written_records >= _env_int("MILVUS_COMPACT_MIN_RECORDS", 20000)
+        await asyncio.to_thread(milvus_writer.flush_and_compact, collection, _get_milvus_collection, compact)
+
+    skipped_files = [task.filename for task, _, _ in sorted(result.failed, key=lambda f: f[0].index)]
+    summary = {
         "kb_id": kb_id,
-        "total_documents": total_documents,
-        "total_chunks": total_chunks,
-        "milvus_records": milvus_records,
+        "total_documents": len(completed),
+        "total_chunks": sum(task.chunk_count for task in completed),
+        "milvus_records": written_records,
         "skipped_files": skipped_files,
     }
+    logger.error(
+        f"[{log_prefix}] 全部完成: total_documents={summary['total_documents']}, "
+        f"total_chunks={summary['total_chunks']}, milvus_records={summary['milvus_records']}, skipped={len(skipped_files)}"
+    )
+    return summary
 
 
-async def build_index_from_markdown_contents(
-    kb_id: int,
-    items: Sequence[Tuple[str, str]],
+def _new_document_model(
     *,
-    skip_base_db: bool = False,
-) -> Dict[str, Any]:
-    """从上传的 Markdown 内容批量构建索引。"""
-    logger.error(
-        f"[build_index_from_markdown_contents] 开始: kb_id={kb_id}, 文件数={len(items)}, skip_base_db={skip_base_db}"
-    )
-    if not items:
-        return {
-            "kb_id": kb_id,
-            "total_documents": 0,
-            "total_chunks": 0,
-            "milvus_records": 0,
-            "skipped_files": [],
+    kb_id: int,
+    filename: str,
+    minio_path: str,
+    file_type: str,
+    markdown_content: str,
+    extra: Dict[str, Any],
+) -> DocumentModel:
+    document = DocumentModel()
+    document.kb_id = kb_id
+    document.tenant_id = int(os.getenv("DB_TENANT_ID", "1"))
+    document.owner_id = int(os.getenv("DB_OWNER_ID", "1"))
+    document.file_name = filename
+    document.minio_path = minio_path
+    document.file_type = file_type
+    document.file_size = len(markdown_content.encode("utf-8"))
+    document.markdown_content = markdown_content
+    document.status = os.getenv("DB_DOCUMENT_STATUS", "indexed")
+    document.security_level = int(os.getenv("DB_SECURITY_LEVEL", "1"))
+    document.extra = extra
+    return document
+
+
+def _read_upload_text(content: Union[str, upload_spool.SpooledUpload]) -> str:
+    """在解析阶段读取文件内容（落盘暂存的上传此时才读入内存）。"""
+    try:
+        return upload_spool.read_text(content)
+    except (OSError, UnicodeDecodeError) as e:
+        raise ingest_pipeline.SkipItem(f"读取文件失败: {e}") from e
+
+
+def _json_ingest_task(
+    index: int,
+    filename: str,
+    content: Union[str, upload_spool.SpooledUpload],
+    kb_id: int,
+    create_document: bool,
+) -> _IngestTask:
+    def _load() -> Tuple[Dict[str, Any], Optional[DocumentModel]]:
+        try:
+            data = json.loads(_read_upload_text(content))
+        except json.JSONDecodeError as e:
+            raise ingest_pipeline.SkipItem(f"JSON 解析失败: {e}") from e
+        meta = _extract_paper_metadata(data)
+        original_text: str = meta["original_text"]
+        if not original_text:
+            raise ingest_pipeline.SkipItem("original_text 为空")
+        if not create_document:
+            return data, None
+        authors_raw: List[Dict[str, Any]] = meta["authors_raw"]
+        doc_extra: Dict[str, Any] = {
+            "title": meta["title"],
+            "tags": meta["tags"],
+            "authors": authors_raw,
+            "institutions": list({a.get("school") for a in authors_raw if a.get("school")}),
+            "source_file": filename,
         }
+        return data, _new_document_model(
+            kb_id=kb_id,
+            filename=filename,
+            minio_path=f"pdf/{filename}",
+            file_type="pdf",
+            markdown_content=original_text,
+            extra=doc_extra,
+        )
 
-    _load_db_env()
-    doc_client = _get_document_client()
+    return _IngestTask(index, filename, _load)
 
-    tenant_id = int(os.getenv("DB_TENANT_ID", "1"))
-    owner_id = int(os.getenv("DB_OWNER_ID", "1"))
-    security_level = int(os.getenv("DB_SECURITY_LEVEL", "1"))
-    status = os.getenv("DB_DOCUMENT_STATUS", "indexed")
 
-    total_documents = 0
-    total_chunks = 0
-    milvus_records = 0
-    skipped_files: List[str] = []
+def _markdown_ingest_task(
+    index: int,
+    filename: str,
+    content: Union[str, upload_spool.SpooledUpload],
+    kb_id: int,
+) -> _IngestTask:
+    source_name = filename or "unknown.md"
 
-    for filename, markdown_text in items:
-        source_name = filename or "unknown.md"
+    def _load() -> Tuple[Dict[str, Any], Optional[DocumentModel]]:
+        markdown_text = _read_upload_text(content)
         if not markdown_text.strip():
-            logger.warning(f"[build_index_from_markdown_contents] {source_name} 内容为空，跳过")
-            skipped_files.append(source_name)
-            continue
-
+            raise ingest_pipeline.SkipItem("内容为空")
         paper_data = _build_markdown_paper_data(markdown_text, source_name)
-        title = paper_data.get("title", "")
         doc_extra: Dict[str, Any] = {
-            "title": title,
+            "title": paper_data.get("title", ""),
             "tags": [],
             "authors": [],
             "institutions": [],
             "source_file": source_name,
         }
+        return paper_data, _new_document_model(
+            kb_id=kb_id,
+            filename=source_name,
+            minio_path=f"markdown/{source_name}",
+            file_type="md",
+            markdown_content=markdown_text,
+            extra=doc_extra,
+        )
 
-        document = DocumentModel()
-        document.kb_id = kb_id
-        document.tenant_id = tenant_id
-        document.owner_id = owner_id
-        document.file_name = source_name
-        document.minio_path = f"markdown/{source_name}"
-        document.file_type = "md"
-        document.file_size = len(markdown_text.encode("utf-8"))
-        document.markdown_content = markdown_text
-        document.status = status
-        document.security_level = security_level
-        document.extra = doc_extra
-
-        try:
-            created = await doc_client.create_document(document)
-        except Exception as exc:
-            logger.error(
-                f"[build_index_from_markdown_contents] BaseDB 创建文档失败 {source_name}: {exc}",
-                exc_info=True,
-            )
-            skipped_files.append(source_name)
-            continue
+    return _IngestTask(index, source_name, _load)
 
-        doc_id = _extract_doc_id_from_create_response(created)
-        if not isinstance(doc_id, int):
-            logger.error(
-                f"[build_index_from_markdown_contents] 无法提取 doc_id: source={source_name}, created={created!r}"
-            )
-            skipped_files.append(source_name)
-            continue
 
-        try:
-            result = await insert_single_paper_data(
-                kb_id=kb_id,
-                doc_id=doc_id,
-                data=paper_data,
-                tenant_id=tenant_id,
-                security_level=security_level,
-                owner_id=owner_id,
-                filename=source_name,
-                skip_base_db=skip_base_db,
-            )
-        except Exception as exc:
-            logger.error(
-                f"[build_index_from_markdown_contents] insert_single_paper_data 异常 {source_name}: {exc}",
-                exc_info=True,
-            )
-            skipped_files.append(source_name)
-            continue
+def _parse_spooled_document(upload: upload_spool.SpooledUpload) -> Tuple[str, str]:
+    """解析落盘暂存的上传文档，返回 (正文, 标题)。"""
+    try:
+        parsed = operator_service.parse_file(str(upload.path))
+    except Exception as e:
+        raise ingest_pipeline.SkipItem(f"文档解析失败: {e}") from e
+    if not isinstance(parsed, dict):
+        return "", ""
+    metadata = parsed.get("metadata", {})
+    title = metadata.get("title", "") if isinstance(metadata, dict) else ""
+    return str(parsed.get("content") or ""), str(title or "")
+
+
+def _parsed_document_ingest_task(index: int, item: Dict[str, Any], kb_id: int) -> _IngestTask:
+    """item 为已解析的 {filename, file_type, title, content}，或带落盘暂存文件的 {filename, file_type, upload}（在解析阶段解析）。"""
+    source_name = str(item.get("filename") or "unknown.bin")
+
+    def _load() -> Tuple[Dict[str, Any], Optional[DocumentModel]]:
+        upload = item.get("upload")
+        if isinstance(upload, upload_spool.SpooledUpload):
+            parsed_text, title = _parse_spooled_document(upload)
+        else:
+            parsed_text, title = str(item.get("content") or ""), str(item.get("title") or "")
+        if not parsed_text.strip():
+            raise ingest_pipeline.SkipItem("解析内容为空")
+        paper_data = _build_plain_text_paper_data(parsed_text, source_name, title=title)
+        doc_extra: Dict[str, Any] = {
+            "title": paper_data.get("title", ""),
+            "tags": [],
+            "authors": [],
+            "institutions": [],
+            "source_file": source_name,
+            "parsed": True,
+        }
+        return paper_data, _new_document_model(
+            kb_id=kb_id,
+            filename=source_name,
+            minio_path=f"documents/{source_name}",
+            file_type=str(item.get("file_type") or "bin"),
+            markdown_content=parsed_text,
+            extra=doc_extra,
+        )
 
-        if not result.get("success"):
-            logger.warning(
-                f"[build_index_from_markdown_contents] 写入失败 {source_name}: {result.get('error', 'unknown')}"
-            )
-            skipped_files.append(source_name)
-            continue
+    return _IngestTask(index, source_name, _load)
 
-        total_documents += 1
-        chunk_count = int(result.get("chunk_count", 0) or 0)
-        total_chunks += chunk_count
-        milvus_ids = result.get("milvus_ids", []) or []
-        milvus_records += len(milvus_ids)
 
+def _empty_build_summary(kb_id: int) -> Dict[str, Any]:
     return {
         "kb_id": kb_id,
-        "total_documents": total_documents,
-        "total_chunks": total_chunks,
-        "milvus_records": milvus_records,
-        "skipped_files": skipped_files,
+        "total_documents": 0,
+        "total_chunks": 0,
+        "milvus_records": 0,
+        "skipped_files": [],
     }
 
 
+async def build_index_from_json_contents(
+    kb_id: int,
+    items: Sequence[Tuple[str, Union[str, upload_spool.SpooledUpload]]],
+    collection_name: Optional[str] = None,
+    model_name: Optional[str] = None,
+    dim: Optional[int] = None,
+    skip_base_db: bool = False,
+    on_document_done: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+    on_document_created: Optional[Callable[[int, int], None]] = None,
+    resume_doc_ids: Optional[Dict[int, int]] = None,
+) -> Dict[str, Any]:
+    """从上传的 JSON 内容批量构建索引，写入 Milvus；可选写入 BaseDB。
+
+    - skip_base_db=True：仅写入 Milvus，不调用 BaseDB（适用于 BaseDB 不可用或本地脚本场景）
+    - skip_base_db=False：先写入 BaseDB 获取 doc_id，再写入 Milvus 与切片表（与 API 行为一致）
+    各文件经 _run_ingest_pipeline 分阶段并发处理；on_document_done / cancelled / on_document_created /
+    resume_doc_ids 供异步索引任务跟踪进度、取消与断点恢复。
+    """
+    logger.error(f"[build_index_from_json_contents] 开始: kb_id={kb_id}, 文件数={len(items)}, skip_base_db={skip_base_db}")
+
+    if not items:
+        logger.warning("[build_index_from_json_contents] 无待处理文件")
+        return _empty_build_summary(kb_id)
+
+    if model_name:
+        os.environ["EMBEDDING_MODEL"] = model_name
+
+    tasks = (
+        _json_ingest_task(i, filename, content, kb_id, create_document=not skip_base_db)
+        for i, (filename, content) in enumerate(items)
+    )
+    return await _run_ingest_pipeline(
+        kb_id,
+        tasks,
+        log_prefix="build_index_from_json_contents",
+        create_documents=not skip_base_db,
+        write_chunks=not skip_base_db,
+        collection_name=collection_name,
+        dim=dim,
+        on_document_done=on_document_done,
+        cancelled=cancelled,
+        on_document_created=on_document_created,
+        resume_doc_ids=resume_doc_ids,
+    )
+
+
+async def build_index_from_markdown_contents(
+    kb_id: int,
+    items: Sequence[Tuple[str, Union[str, upload_spool.SpooledUpload]]],
+    *,
+    skip_base_db: bool = False,
+    on_document_done: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+    on_document_created: Optional[Callable[[int, int], None]] = None,
+    resume_doc_ids: Optional[Dict[int, int]] = None,
+) -> Dict[str, Any]:
+    """从上传的 Markdown 内容批量构建索引（BaseDB 文档始终创建，skip_base_db 只跳过切片表写入）。"""
+    logger.error(
+        f"[build_index_from_markdown_contents] 开始: kb_id={kb_id}, 文件数={len(items)}, skip_base_db={skip_base_db}"
+    )
+    if not items:
+        return _empty_build_summary(kb_id)
+
+    tasks = (_markdown_ingest_task(i, filename, markdown_text, kb_id) for i, (filename, markdown_text) in enumerate(items))
+    return await _run_ingest_pipeline(
+        kb_id,
+        tasks,
+        log_prefix="build_index_from_markdown_contents",
+        create_documents=True,
+        write_chunks=not skip_base_db,
+        on_document_done=on_document_done,
+        cancelled=cancelled,
+        on_document_created=on_document_created,
+        resume_doc_ids=resume_doc_ids,
+    )
+
+
 async def build_index_from_parsed_document_contents(
     kb_id: int,
     items: Sequence[Dict[str, Any]],
     *,
     skip_base_db: bool = False,
+    on_document_done: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+    on_document_created: Optional[Callable[[int, int], None]] = None,
+    resume_doc_ids: Optional[Dict[int, int]] = None,
 ) -> Dict[str, Any]:
-    """从解析后的文档内容批量构建索引。"""
+    """从解析后的文档内容批量构建索引（BaseDB 文档始终创建，skip_base_db 只跳过切片表写入）。"""
     logger.error(
         f"[build_index_from_parsed_document_contents] 开始: kb_id={kb_id}, 文件数={len(items)}, skip_base_db={skip_base_db}"
     )
     if not items:
-        return {
-            "kb_id": kb_id,
-            "total_documents": 0,
-            "total_chunks": 0,
-            "milvus_records": 0,
-            "skipped_files": [],
-        }
+        return _empty_build_summary(kb_id)
+
+    tasks = (_parsed_document_ingest_task(i, item, kb_id) for i, item in enumerate(items))
+    return await _run_ingest_pipeline(
+        kb_id,
+        tasks,
+        log_prefix="build_index_from_parsed_document_contents",
+        create_documents=True,
+        write_chunks=not skip_base_db,
+        on_document_done=on_document_done,
+        cancelled=cancelled,
+        on_document_created=on_document_created,
+        resume_doc_ids=resume_doc_ids,
+    )
 
-    _load_db_env()
-    doc_client = _get_document_client()
 
-    tenant_id = int(os.getenv("DB_TENANT_ID", "1"))
-    owner_id = int(os.getenv("DB_OWNER_ID", "1"))
-    security_level = int(os.getenv("DB_SECURITY_LEVEL", "1"))
-    status = os.getenv("DB_DOCUMENT_STATUS", "indexed")
+# ===========================
+# 离线批量入库（列式分片导出 / 导入）
+# ===========================
 
-    total_documents = 0
-    total_chunks = 0
-    milvus_records = 0
-    skipped_files: List[str] = []
 
-    for item in items:
-        source_name = str(item.get("filename") or "unknown.bin")
-        parsed_text = str(item.get("content") or "")
-        parsed_title = str(item.get("title") or "")
-        file_type = str(item.get("file_type") or "bin")
+def _bulk_file_task(index: int, path: Path, kb_id: int) -> _IngestTask:
+    def _load() -> Tuple[Dict[str, Any], Optional[DocumentModel]]:
+        try:
+            content = path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError) as e:
+            raise ingest_pipeline.SkipItem(f"读取文件失败: {e}") from e
+        return _json_ingest_task(index, path.name, content, kb_id, False).load()
 
-        if not parsed_text.strip():
-            logger.warning(f"[build_index_from_parsed_document_contents] {source_name} 解析内容为空，跳过")
-            skipped_files.append(source_name)
-            continue
+    return _IngestTask(index, path.name, _load)
 
-        paper_data = _build_plain_text_paper_data(parsed_text, source_name, title=parsed_title)
-        title = paper_data.get("title", "")
-        doc_extra: Dict[str, Any] = {
-            "title": title,
-            "tags": [],
-            "authors": [],
-            "institutions": [],
-            "source_file": source_name,
-            "parsed": True,
-        }
 
-        document = DocumentModel()
-        document.kb_id = kb_id
-        document.tenant_id = tenant_id
-        document.owner_id = owner_id
-        document.file_name = source_name
-        document.minio_path = f"documents/{source_name}"
-        document.file_type = file_type
-        document.file_size = len(parsed_text.encode("utf-8"))
-        document.markdown_content = parsed_text
-        document.status = status
-        document.security_level = security_level
-        document.extra = doc_extra
+async def export_bulk_shards(
+    kb_id: int,
+    input_dir: str,
+    output_dir: str,
+    *,
+    pattern: str = "*.json",
+    dim: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    离线导出：本地切片、跨文件合批编码，记录按 BULK_SHARD_RECORDS 条写为列式分片（见 bulk_load），
+    不连接 Milvus / BaseDB。文件按名称顺序处理，manifest 中已完成的文件跳过，中断后重跑即续传。
+    chunk 记录去掉文档级字段，每篇文档的文档级字段（启用文档级集合时连同文档向量）写一条 docs 记录。
+    """
+    model = _get_embedding_model()
+    if dim is not None:
+        vector_dim = dim
+    else:
+        env_dim = os.getenv("EMBEDDING_DIM")
+        vector_dim = int(env_dim) if env_dim else model.get_sentence_embedding_dimension()
 
-        try:
-            created = await doc_client.create_document(document)
-        except Exception as exc:
-            logger.error(
-                f"[build_index_from_parsed_document_contents] BaseDB 创建文档失败 {source_name}: {exc}",
-                exc_info=True,
-            )
-            skipped_files.append(source_name)
-            continue
+    build_docs = _doc_collection_enabled()
+    manifest = bulk_load.BulkManifest(Path(output_dir))
+    manifest.check_params(
+        kb_id=kb_id,
+        dim=vector_dim,
+        embedding_model=os.getenv("EMBEDDING_MODEL", "jinaai/jina-embeddings-v5-text-small"),
+        doc_records=build_docs,
+    )
+    files = [p for p in sorted(Path(input_dir).glob(pattern)) if not manifest.is_file_done(p.name)]
+    logger.error(f"[export_bulk_shards] 开始: kb_id={kb_id}, 待导出文件数={len(files)}, 输出目录={output_dir}")
 
-        doc_id = _extract_doc_id_from_create_response(created)
-        if not isinstance(doc_id, int):
-            logger.error(
-                f"[build_index_from_parsed_document_contents] 无法提取 doc_id: source={source_name}, created={created!r}"
-            )
-            skipped_files.append(source_name)
-            continue
+    writer = bulk_load.ShardWriter(manifest, _env_int("BULK_SHARD_RECORDS", 50000))
+    tenant_id = int(os.getenv("DB_TENANT_ID", "1"))
+    security_level = int(os.getenv("DB_SECURITY_LEVEL", "1"))
+    owner_id = int(os.getenv("DB_OWNER_ID", "1"))
 
-        try:
-            result = await insert_single_paper_data(
-                kb_id=kb_id,
-                doc_id=doc_id,
-                data=paper_data,
-                tenant_id=tenant_id,
-                security_level=security_level,
-                owner_id=owner_id,
-                filename=source_name,
-                skip_base_db=skip_base_db,
-            )
-        except Exception as exc:
-            logger.error(
-                f"[build_index_from_parsed_document_contents] insert_single_paper_data 异常 {source_name}: {exc}",
-                exc_info=True,
-            )
-            skipped_files.append(source_name)
-            continue
+    def _assemble_and_write(task: _IngestTask) -> _IngestTask:
+        task.doc_id = _offline_doc_id(task.filename, task.data)
+        records, _ = _assemble_records_and_chunks(
+            task.prepared,
+            task.vectors,
+            kb_id=kb_id,
+            doc_id=task.doc_id,
+            dim=vector_dim,
+            tenant_id=tenant_id,
+            security_level=security_level,
+            owner_id=owner_id,
+        )
+        task.prepared, task.vectors, task.data = None, [], {}
+        if not records:
+            raise ingest_pipeline.SkipItem("records 为空（切片无 child 块）")
+        doc_record = _doc_fields_record(records)
+        if build_docs:
+            # 分片内 docs 记录的字段须一致：无可用文档向量时置零，加载时按布局决定是否写入文档级集合
+            doc_record["vector_content"] = _build_doc_vector(records, model) or _zero_vector(vector_dim)
+        chunk_records = [{k: v for k, v in rec.items() if k not in doc_metadata.DOC_LEVEL_FIELDS} for rec in records]
+        writer.add(task.filename, chunk_records, doc_record)
+        task.milvus_ids = [int(rec["id"]) for rec in records]
+        return task
+
+    async def _write(task: _IngestTask) -> _IngestTask:
+        return await asyncio.to_thread(_assemble_and_write, task)
+
+    # 分片写出阶段单并发：ShardWriter 非线程安全，且保证分片内文件顺序确定
+    stages = _prepare_and_embed_stages(model) + [ingest_pipeline.PipelineStage("shard_write", _write, 1)]
+    tasks = (_bulk_file_task(i, path, kb_id) for i, path in enumerate(files))
+    result = await ingest_pipeline.run_pipeline(tasks, stages, queue_size=_env_int("INGEST_QUEUE_SIZE", 8))
+    await asyncio.to_thread(writer.flush)
+    for task, _, exc in result.failed:
+        manifest.note_skipped(task.filename, str(exc))
+    manifest.save()
+
+    summary = {
+        "kb_id": kb_id,
+        "output_dir": str(output_dir),
+        "exported_documents": len(result.completed),
+        "exported_records": sum(len(task.milvus_ids) for task in result.completed),
+        "shards_written": writer.shards_written,
+        "total_shards": len(manifest.shards()),
+        "skipped_files": sorted(task.filename for task, _, _ in result.failed),
+    }
+    logger.error(
+        f"[export_bulk_shards] 完成: documents={summary['exported_documents']}, records={summary['exported_records']}, "
+        f"shards_written={summary['shards_written']}, skipped={len(summary['skipped_files'])}"
+    )
+    return summary
 
-        if not result.get("success"):
-            logger.warning(
-                f"[build_index_from_parsed_document_contents] 写入失败 {source_name}: {result.get('error', 'unknown')}"
-            )
-            skipped_files.append(source_name)
-            continue
 
-        total_documents += 1
-        chunk_count = int(result.get("chunk_count", 0) or 0)
-        total_chunks += chunk_count
-        milvus_ids = result.get("milvus_ids", []) or []
-        milvus_records += len(milvus_ids)
+def _delete_docs_by_ids(collection: str, expr_field: str, doc_ids: Sequence[int]) -> None:
+    coll = _get_milvus_collection(collection)
+    for i in range(0, len(doc_ids), 1000):
+        coll.delete(f"{expr_field} in {list(doc_ids[i:i + 1000])}")
 
-    return {
-        "kb_id": kb_id,
-        "total_documents": total_documents,
-        "total_chunks": total_chunks,
-        "milvus_records": milvus_records,
-        "skipped_files": skipped_files,
+
+def _bulk_insert_records(collection: str, records: List[Dict[str, Any]]) -> None:
+    buffer = milvus_writer.MilvusWriteBuffer(collection, _milvus_insert)
+    buffer.add(records)
+    buffer.write_pending()
+    failed = buffer.failed()
+    if failed:
+        raise next(iter(failed.values()))
+
+
+def _bulk_import_part(
+    collection: str, shard_dir: Path, part: str, records: List[Dict[str, Any]], remote_prefix: str
+) -> None:
+    """
+    经 Milvus bulk import 导入分片的一部分：先把记录按集合 schema 写成行式 JSON（{part}.rows.json，放在分片目录），
+    再提交导入并轮询直至完成（超时 BULK_IMPORT_TIMEOUT_S 秒），完成后删除该 JSON。
+    输出目录须位于 Milvus 可读取的存储上（如挂载的对象存储桶），remote_prefix 为其在存储中的根路径。
+    """
+    fields = _get_collection_field_names(collection)
+    rows_path = Path(shard_dir) / f"{part}.rows.json"
+    bulk_load.write_rows_json(rows_path, records, fields)
+    files = [bulk_load.remote_file_path(shard_dir, rows_path.name, remote_prefix)]
+    task_id = utility.do_bulk_insert(collection_name=collection, files=files, using="default")
+    deadline = time.monotonic() + _env_int("BULK_IMPORT_TIMEOUT_S", 3600)
+    while True:
+        state = utility.get_bulk_insert_state(task_id, using="default")
+        if state.state == BulkInsertState.ImportCompleted:
+            rows_path.unlink(missing_ok=True)
+            return
+        if state.state in (BulkInsertState.ImportFailed, BulkInsertState.ImportFailedAndCleaned):
+            raise RuntimeError(f"bulk import 失败: task_id={task_id}, reason={state.failed_reason}")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"bulk import 超时: task_id={task_id}, state={state.state_name}")
+        time.sleep(2)
+
+
+def load_bulk_shards(
+    output_dir: str,
+    *,
+    collection_name: Optional[str] = None,
+    mode: str = "insert",
+    remote_prefix: str = "",
+) -> Dict[str, Any]:
+    """
+    把 export_bulk_shards 导出的分片逐个加载到 Milvus，manifest 记录每个分片的状态，中断后重跑只加载未完成的分片。
+    mode="insert"：本地读取分片，经 MilvusWriteBuffer 大批量写入；
+    mode="import"：逐个分片转为 Milvus 行式 JSON 后走 Milvus bulk import，输出目录须是 Milvus 可读取的存储
+    （remote_prefix 为其在存储中的根路径）。
+    chunk 分片不含文档级字段，目标集合含这些字段（非规范化布局）时按 doc_id 从 docs 记录回填。
+    上次中断在加载中的分片先按 doc_id 删除已写入部分再重写（id 确定性生成，重写结果一致）。
+    """
+    if mode not in ("insert", "import"):
+        raise ValueError(f"不支持的加载方式: {mode}")
+    _load_milvus_env()
+    manifest = bulk_load.BulkManifest(Path(output_dir))
+    if not manifest.params:
+        raise ValueError(f"{output_dir} 下没有导出清单 {bulk_load.MANIFEST_NAME}")
+
+    collection = collection_name or _get_default_collection_name()
+    ensure_parent_child_collection(collection, int(manifest.params["dim"]))
+    docs_collection = doc_metadata.docs_collection_name(collection) if _doc_collection_enabled() else None
+    if docs_collection and not manifest.params.get("doc_records"):
+        raise ValueError(f"{output_dir} 导出时未生成文档向量，无法写入文档级集合 {docs_collection}，请按当前配置重新导出")
+    chunk_fields = _get_collection_field_names(collection)
+    hydrate_fields = [f for f in doc_metadata.DOC_LEVEL_FIELDS if f in chunk_fields]
+    normalized = doc_metadata.is_normalized_layout()
+
+    loaded_shards = 0
+    loaded_records = 0
+    for shard in manifest.shards():
+        if shard["state"] == bulk_load.SHARD_LOADED:
+            continue
+        name = shard["name"]
+        shard_dir = manifest.output_dir / name
+        all_doc_records = bulk_load.read_shard_records(shard_dir, bulk_load.DOC_PART)
+        records = bulk_load.attach_doc_fields(
+            bulk_load.read_shard_records(shard_dir, bulk_load.CHUNK_PART), all_doc_records, hydrate_fields
+        )
+        # 与在线入库一致：默认布局下没有可用文档向量的文档不写文档级记录
+        doc_records = (
+            [rec for rec in all_doc_records if normalized or any(rec["vector_content"])] if docs_collection else []
+        )
+        records_by_doc: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for rec in records:
+            records_by_doc[rec["doc_id"]].append(rec)
+
+        if shard["state"] == bulk_load.SHARD_LOADING:
+            logger.error(f"[load_bulk_shards] 分片 {name} 上次加载中断，删除已写入部分后重写")
+            _delete_docs_by_ids(collection, "doc_id", list(records_by_doc))
+            if doc_records:
+                _delete_docs_by_ids(docs_collection, "id", [rec["id"] for rec in doc_records])
+        manifest.set_shard_state(name, bulk_load.SHARD_LOADING)
+
+        if mode == "import":
+            _bulk_import_part(collection, shard_dir, bulk_load.CHUNK_PART, records, remote_prefix)
+            if doc_records:
+                _bulk_import_part(docs_collection, shard_dir, bulk_load.DOC_PART, doc_records, remote_prefix)
+        else:
+            _bulk_insert_records(collection, records)
+            if doc_records:
+                _bulk_insert_records(docs_collection, doc_records)
+        doc_titles = {rec["id"]: rec.get("title") or "" for rec in all_doc_records}
+        for doc_id, doc_chunk_records in records_by_doc.items():
+            doc_chunk_records[0].setdefault("title", doc_titles.get(doc_id, ""))
+            _update_doc_side_indexes(collection, doc_chunk_records)
+
+        manifest.set_shard_state(name, bulk_load.SHARD_LOADED, collection=collection)
+        loaded_shards += 1
+        loaded_records += len(records)
+        logger.error(f"[load_bulk_shards] 分片 {name} 已加载: records={len(records)}, docs={len(records_by_doc)}")
+
+    if loaded_records:
+        compact = loaded_records >= _env_int("MILVUS_COMPACT_MIN_RECORDS", 20000)
+        milvus_writer.flush_and_compact(collection, _get_milvus_collection, compact)
+        if docs_collection:
+            milvus_writer.flush_and_compact(docs_collection, _get_milvus_collection, False)
+
+    summary = {
+        "collection": collection,
+        "mode": mode,
+        "loaded_shards": loaded_shards,
+        "loaded_records": loaded_records,
+        "total_shards": len(manifest.shards()),
     }
+    logger.error(f"[load_bulk_shards] 完成: {summary}")
+    return summary
 
 
 async def insert_single_paper_data(
@@ -1381,15 +2139,13 @@ async def insert_single_paper_data(
         for rec, cid in zip(records, chunk_ids):
             rec["id"] = cid
 
-    insert_req = InsertRequest(collection_name=collection, records=records)
-    logger.error(f"[insert_single_paper_data] 写入 Milvus: collection={collection}, records 数={len(records)}")
-    ids = StorageService.insert(insert_req)
+    milvus_ids = _insert_paper_records(collection, records, model)
 
     return {
         "success": True,
         "doc_id": doc_id,
         "chunk_count": len(records),
-        "milvus_ids": [int(x) for x in ids] if ids else [],
+        "milvus_ids": milvus_ids,
     }
 
 
@@ -1408,7 +2164,8 @@ async def delete_document_by_doc_id(
     _connect_milvus()
     coll = Collection(collection, using="default")
     coll.delete(f"doc_id == {doc_id}")
-    coll.flush()
+    milvus_writer.note_mutation(collection, 1, _get_milvus_collection)
+    _remove_doc_side_indexes(collection, doc_id)
 
     # 2. 删除 BaseDB 中该 doc_id 的 chunk
     chunk_client = _get_chunk_client()
@@ -1454,7 +2211,8 @@ async def update_single_paper_data(
     _connect_milvus()
     coll = Collection(collection, using="default")
     coll.delete(f"doc_id == {doc_id}")
-    coll.flush()
+    milvus_writer.note_mutation(collection, 1, _get_milvus_collection)
+    _remove_doc_side_indexes(collection, doc_id)
 
     # 2. 同步删除 BaseDB 中该 doc_id 的旧 chunk
     chunk_client = _get_chunk_client()
@@ -1490,13 +2248,12 @@ async def update_single_paper_data(
         rec["id"] = cid
 
     # 5. 插入 Milvus
-    insert_req = InsertRequest(collection_name=collection, records=records)
-    ids = StorageService.insert(insert_req)
+    milvus_ids = _insert_paper_records(collection, records, model)
 
     return {
         "success": True,
         "doc_id": doc_id,
         "chunk_count": len(records),
-        "milvus_ids": [int(x) for x in ids] if ids else [],
+        "milvus_ids": milvus_ids,
     }
 
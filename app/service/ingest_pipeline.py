@@ -0,0 +1,199 @@
+"""分阶段并发入库流水线。
+
+把入库拆为若干阶段（解析/切片 → 向量编码 → BaseDB 写入 → Milvus 写入），阶段之间用有界
+asyncio.Queue 连接，每个阶段按各自的并发度起 worker：
+- 反压：下游处理不过来时队列写满，上游 worker 阻塞在 put 上，内存中滞留的文件数有上限
+- 文件级隔离：某个文件在任一阶段抛出异常只记录该文件失败，不影响其它文件与后续阶段
+- 阻塞调用（切片、模型编码、Milvus 写入）由阶段函数自行放到线程池执行，事件循环保持空闲
+- 批处理阶段（如向量编码）把多个文件攒成一批再处理：攒够 batch_weight（按 weight 计，如 chunk 数）
+  或等待超过 max_wait_s 即出批，使小文件也能凑成满批
+- 流水线自身出错（如输入迭代器抛出异常）时取消全部 worker 并向调用方抛出，不留下挂起的任务
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, List, Optional, Sequence, Tuple, Union
+
+from app.service import instrumentation
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class SkipItem(Exception):
+    """文件在某一阶段被跳过（预期内的情况，如内容为空），只记 warning，不打印堆栈。"""
+
+
+class PipelineStage:
+    """
+    流水线阶段：func 接收上一阶段的输出并返回交给下一阶段的对象（返回 None 表示该文件就此结束）。
+    设置 batch_weight 时为批处理阶段：func 接收一批对象，返回等长的输出列表（元素为异常实例时该文件记为失败）；
+    func 抛出异常时批内文件均记为失败。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Awaitable[Any]],
+        concurrency: int = 1,
+        *,
+        batch_weight: Optional[int] = None,
+        weight: Optional[Callable[[Any], int]] = None,
+        max_wait_s: float = 0.05,
+    ):
+        self.name = name
+        self.func = func
+        self.concurrency = max(1, int(concurrency))
+        self.batch_weight = batch_weight
+        self.weight = weight or (lambda _item: 1)
+        self.max_wait_s = max_wait_s
+
+
+class PipelineResult:
+    """流水线运行结果：completed 为最后一阶段的输出，failed 为 (item, 阶段名, 异常)。"""
+
+    def __init__(self) -> None:
+        self.completed: List[Any] = []
+        self.failed: List[Tuple[Any, str, BaseException]] = []
+
+
+async def _produce(items: Union[Iterable[Any], AsyncIterable[Any]], queue: "asyncio.Queue[Any]") -> None:
+    if hasattr(items, "__aiter__"):
+        async for item in items:  # type: ignore[union-attr]
+            await queue.put(item)
+    else:
+        for item in items:  # type: ignore[union-attr]
+            await queue.put(item)
+
+
+async def _stage_worker(
+    stage: PipelineStage,
+    inq: "asyncio.Queue[Any]",
+    outq: Optional["asyncio.Queue[Any]"],
+    result: PipelineResult,
+) -> None:
+    while True:
+        item = await inq.get()
+        if item is _DONE:
+            return
+        try:
+            with instrumentation.stage(f"ingest.{stage.name}"):
+                out = await stage.func(item)
+        except SkipItem as e:
+            logger.warning(f"[ingest_pipeline] {stage.name} 跳过 {item!r}: {e}")
+            result.failed.append((item, stage.name, e))
+            continue
+        except Exception as e:
+            logger.error(f"[ingest_pipeline] {stage.name} 失败 {item!r}: {e}", exc_info=True)
+            result.failed.append((item, stage.name, e))
+            continue
+        if out is None:
+            continue
+        if outq is None:
+            result.completed.append(out)
+        else:
+            await outq.put(out)
+
+
+async def _collect_batch(stage: PipelineStage, inq: "asyncio.Queue[Any]") -> Tuple[List[Any], bool]:
+    """从队列攒一批：返回 (批内对象, 是否已读到结束标记)。首个对象无限等待，之后最多等待 max_wait_s。"""
+    first = await inq.get()
+    if first is _DONE:
+        return [], True
+    batch = [first]
+    total = stage.weight(first)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + stage.max_wait_s
+    while total < stage.batch_weight:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            item = await asyncio.wait_for(inq.get(), timeout)
+        except asyncio.TimeoutError:
+            break
+        if item is _DONE:
+            return batch, True
+        batch.append(item)
+        total += stage.weight(item)
+    return batch, False
+
+
+async def _batch_stage_worker(
+    stage: PipelineStage,
+    inq: "asyncio.Queue[Any]",
+    outq: Optional["asyncio.Queue[Any]"],
+    result: PipelineResult,
+) -> None:
+    done = False
+    while not done:
+        batch, done = await _collect_batch(stage, inq)
+        if not batch:
+            continue
+        try:
+            with instrumentation.stage(f"ingest.{stage.name}", batch_items=len(batch)):
+                outs = await stage.func(batch)
+            if len(outs) != len(batch):
+                # 批处理函数须逐个返回输出，长度不一致时无法把输出对应回文件，整批记为失败
+                raise RuntimeError(f"批处理输出数 {len(outs)} 与输入数 {len(batch)} 不一致")
+        except Exception as e:
+            logger.error(f"[ingest_pipeline] {stage.name} 批处理失败 {batch!r}: {e}", exc_info=True)
+            result.failed.extend((item, stage.name, e) for item in batch)
+            continue
+        for item, out in zip(batch, outs):
+            if out is None:
+                continue
+            if isinstance(out, BaseException):
+                logger.error(f"[ingest_pipeline] {stage.name} 失败 {item!r}: {out}")
+                result.failed.append((item, stage.name, out))
+                continue
+            if outq is None:
+                result.completed.append(out)
+            else:
+                await outq.put(out)
+
+
+async def run_pipeline(
+    items: Union[Iterable[Any], AsyncIterable[Any]],
+    stages: Sequence[PipelineStage],
+    queue_size: int = 8,
+) -> PipelineResult:
+    """
+    运行流水线直到所有文件走完全部阶段。items 可以是普通或异步可迭代对象（按需拉取，受首个队列反压）。
+    单个文件的失败记入 result.failed；输入迭代器或流水线自身抛出的异常会取消其余 worker 后原样抛出。
+    """
+    result = PipelineResult()
+    if not stages:
+        return result
+    queues = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in stages]
+
+    async def _drive(i: int, stage: PipelineStage) -> None:
+        outq = queues[i + 1] if i + 1 < len(stages) else None
+        worker = _batch_stage_worker if stage.batch_weight else _stage_worker
+        await asyncio.gather(*(worker(stage, queues[i], outq, result) for _ in range(stage.concurrency)))
+        if outq is not None:
+            for _ in range(stages[i + 1].concurrency):
+                await outq.put(_DONE)
+
+    async def _feed() -> None:
+        try:
+            await _produce(items, queues[0])
+        finally:
+            for _ in range(stages[0].concurrency):
+                await queues[0].put(_DONE)
+
+    tasks = [asyncio.ensure_future(_feed())] + [asyncio.ensure_future(_drive(i, stage)) for i, stage in enumerate(stages)]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+    finally:
+        # 出错或调用方被取消时，其余 worker 可能阻塞在队列上，全部取消并等待退出
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return result
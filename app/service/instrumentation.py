@@ -0,0 +1,237 @@
+"""性能埋点：阶段耗时、LLM 调用 token 统计与进程内聚合直方图。
+
+- 单次运行内的明细由 TraceRecorder 记录（通过 contextvars 传递，线程池中需用 submit_with_context 提交）
+- 所有阶段与 LLM 调用同时汇总到进程级直方图，供 /process/metrics 查询
+- 计时统一使用单调时钟 time.perf_counter
+"""
+
+from __future__ import annotations
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+# 直方图分桶（上界，含），超出最后一个桶计入 +inf
+LATENCY_BUCKETS_MS: Sequence[float] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+TOKEN_BUCKETS: Sequence[float] = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+class Histogram:
+    """固定分桶直方图，分位数按桶上界近似估计。"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float) -> None:
+        v = float(value)
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.count += 1
+        self.total += v
+        self.min = v if self.min is None else min(self.min, v)
+        self.max = v if self.max is None else max(self.max, v)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target and c > 0:
+                return float(self.buckets[i]) if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"le_{b:g}" for b in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class MetricsRegistry:
+    """进程级指标汇总（线程安全）：直方图 + 计数器。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, int] = {}
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS_MS) -> None:
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = Histogram(buckets)
+                self._histograms[name] = hist
+            hist.observe(value)
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def quantile(self, name: str, q: float) -> Optional[float]:
+        with self._lock:
+            hist = self._histograms.get(name)
+            return hist.quantile(q) if hist is not None else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "histograms": {k: v.snapshot() for k, v in sorted(self._histograms.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+metrics = MetricsRegistry()
+
+
+class TraceRecorder:
+    """单次 RAG 运行的埋点记录：阶段耗时与每次 LLM 调用明细。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.perf_counter()
+        self.iteration: Optional[int] = None
+        self.stages: List[Dict[str, Any]] = []
+        self.llm_calls: List[Dict[str, Any]] = []
+
+    def add_stage(self, name: str, elapsed_ms: float, **extra: Any) -> None:
+        record = {"stage": name, "elapsed_ms": round(elapsed_ms, 3), "iteration": self.iteration}
+        record.update(extra)
+        with self._lock:
+            self.stages.append(record)
+
+    def add_llm_call(self, record: Dict[str, Any]) -> None:
+        record.setdefault("iteration", self.iteration)
+        with self._lock:
+            self.llm_calls.append(record)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stage_totals: Dict[str, float] = {}
+            for st in self.stages:
+                stage_totals[st["stage"]] = round(stage_totals.get(st["stage"], 0.0) + st["elapsed_ms"], 3)
+            llm_by_stage: Dict[str, Dict[str, Any]] = {}
+            for call in self.llm_calls:
+                agg = llm_by_stage.setdefault(
+                    call.get("stage") or "llm",
+                    {"calls": 0, "elapsed_ms": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cache_hits": 0},
+                )
+                agg["calls"] += 1
+                agg["elapsed_ms"] = round(agg["elapsed_ms"] + float(call.get("elapsed_ms") or 0.0), 3)
+                agg["prompt_tokens"] += int(call.get("prompt_tokens") or 0)
+                agg["completion_tokens"] += int(call.get("completion_tokens") or 0)
+                agg["cache_hits"] += 1 if call.get("cache_hit") else 0
+            return {"stage_totals_ms": stage_totals, "llm_by_stage": llm_by_stage}
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = list(self.stages)
+            llm_calls = list(self.llm_calls)
+        return {
+            "total_ms": round((time.perf_counter() - self.started_at) * 1000.0, 3),
+            "summary": self.summary(),
+            "stages": stages,
+            "llm_calls": llm_calls,
+        }
+
+
+_current_recorder: contextvars.ContextVar[Optional[TraceRecorder]] = contextvars.ContextVar(
+    "rag_trace_recorder", default=None
+)
+
+
+def start_recording() -> TraceRecorder:
+    """为当前上下文创建新的记录器。"""
+    recorder = TraceRecorder()
+    _current_recorder.set(recorder)
+    return recorder
+
+
+def get_recorder() -> Optional[TraceRecorder]:
+    return _current_recorder.get()
+
+
+def submit_with_context(executor: Any, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """向线程池提交任务时复制当前上下文，使子线程中的埋点写入同一个记录器。"""
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
+
+
+@contextmanager
+def stage(name: str, **extra: Any) -> Iterator[Dict[str, Any]]:
+    """
+    阶段计时：耗时写入当前记录器并汇总到 stage.<name>.ms 直方图。
+    yield 出的 dict 可在阶段内补充字段（如结果数），一并写入记录。
+    """
+    info: Dict[str, Any] = dict(extra)
+    t0 = time.perf_counter()
+    try:
+        yield info
+    finally:
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        metrics.observe(f"stage.{name}.ms", elapsed_ms)
+        recorder = _current_recorder.get()
+        if recorder is not None:
+            recorder.add_stage(name, elapsed_ms, **info)
+
+
+def record_llm_call(
+    stage_name: str,
+    elapsed_ms: float,
+    usage: Optional[Dict[str, Any]] = None,
+    success: bool = True,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """
+    记录一次 LLM 调用：耗时、prompt/completion token 数与缓存命中（DeepSeek 返回 prompt_cache_hit_tokens）。
+    """
+    usage = usage if isinstance(usage, dict) else {}
+    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+    completion_tokens = int(usage.get("completion_tokens") or 0)
+    cache_hit_tokens = int(usage.get("prompt_cache_hit_tokens") or 0)
+    record: Dict[str, Any] = {
+        "stage": stage_name,
+        "elapsed_ms": round(elapsed_ms, 3),
+        "success": success,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cache_hit_tokens": cache_hit_tokens,
+        "cache_hit": cache_hit_tokens > 0,
+    }
+    record.update(extra)
+
+    metrics.observe(f"llm.{stage_name}.ms", elapsed_ms)
+    metrics.incr(f"llm.{stage_name}.calls")
+    if not success:
+        metrics.incr(f"llm.{stage_name}.failures")
+    if usage:
+        metrics.observe(f"llm.{stage_name}.prompt_tokens", prompt_tokens, TOKEN_BUCKETS)
+        metrics.observe(f"llm.{stage_name}.completion_tokens", completion_tokens, TOKEN_BUCKETS)
+        if cache_hit_tokens > 0:
+            metrics.incr(f"llm.{stage_name}.cache_hits")
+
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.add_llm_call(record)
+    return record
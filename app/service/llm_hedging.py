@@ -0,0 +1,108 @@
+"""LLM 请求对冲（hedging）策略。
+
+- 按阶段维护最近调用耗时的滑动窗口，调用超过该阶段 p90 仍未返回时发出一个重复请求，先返回者胜出
+- 对冲总量受预算约束：已发对冲数不超过总调用数的 DEEPSEEK_HEDGE_BUDGET_RATIO
+- 对冲请求同样占用全局 LLM 调度名额，但只做非阻塞尝试，名额紧张时不对冲
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from app.service import instrumentation
+from app.service.env_utils import get_env_float, is_truthy_env
+
+
+class HedgePolicy:
+    """
+    enabled: 是否启用对冲
+    budget_ratio: 对冲请求占总调用数的上限比例
+    stages: 允许对冲的阶段
+    window: 每个阶段保留的最近耗时样本数
+    min_samples: 样本不足时不对冲（p90 不可信）
+    min_delay_ms: 对冲触发延迟下限，避免对本就很快的调用重复请求
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        budget_ratio: float = 0.05,
+        stages: Optional[set] = None,
+        window: int = 200,
+        min_samples: int = 20,
+        min_delay_ms: float = 500.0,
+    ):
+        self.enabled = enabled
+        self.budget_ratio = max(0.0, float(budget_ratio))
+        self.stages = stages if stages is not None else {"evidence", "judge", "rewrite", "fusion"}
+        self.window = max(10, int(window))
+        self.min_samples = max(1, int(min_samples))
+        self.min_delay_ms = max(0.0, float(min_delay_ms))
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._total_calls = 0
+        self._hedges_sent = 0
+
+    def observe(self, stage: str, elapsed_ms: float) -> None:
+        """记录一次成功调用的耗时（对冲时为胜出请求的耗时）。"""
+        with self._lock:
+            self._total_calls += 1
+            samples = self._latencies.get(stage)
+            if samples is None:
+                samples = deque(maxlen=self.window)
+                self._latencies[stage] = samples
+            samples.append(float(elapsed_ms))
+
+    def hedge_delay_seconds(self, stage: str) -> Optional[float]:
+        """返回该阶段的对冲触发延迟（秒）；不满足对冲条件时返回 None。"""
+        if not self.enabled or stage not in self.stages:
+            return None
+        with self._lock:
+            samples = self._latencies.get(stage)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        p90 = ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+        return max(p90, self.min_delay_ms) / 1000.0
+
+    def try_spend(self, stage: str) -> bool:
+        """在对冲预算内登记一次对冲，超出预算时返回 False。"""
+        with self._lock:
+            if self._hedges_sent + 1 > self.budget_ratio * self._total_calls:
+                return False
+            self._hedges_sent += 1
+        instrumentation.metrics.incr(f"llm.{stage}.hedges")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "budget_ratio": self.budget_ratio,
+                "total_calls": self._total_calls,
+                "hedges_sent": self._hedges_sent,
+            }
+
+
+_policy_lock = threading.Lock()
+_policy: Optional[HedgePolicy] = None
+
+
+def get_hedge_policy() -> HedgePolicy:
+    """获取进程级对冲策略（按环境变量懒加载）。"""
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                stages_env = os.getenv("DEEPSEEK_HEDGE_STAGES", "").strip()
+                _policy = HedgePolicy(
+                    enabled=is_truthy_env("DEEPSEEK_HEDGE_ENABLED", False),
+                    budget_ratio=get_env_float("DEEPSEEK_HEDGE_BUDGET_RATIO", 0.05),
+                    stages={s.strip() for s in stages_env.split(",") if s.strip()} if stages_env else None,
+                    min_samples=int(get_env_float("DEEPSEEK_HEDGE_MIN_SAMPLES", 20)),
+                    min_delay_ms=get_env_float("DEEPSEEK_HEDGE_MIN_DELAY_MS", 500.0),
+                )
+    return _policy
@@ -0,0 +1,176 @@
+"""进程级 LLM 调用调度：全局并发上限 + 令牌桶限速 + 优先级队列。
+
+- 所有 LLM 调用在发请求前通过 slot() 取得名额，名额不足时按优先级排队（同优先级先到先得）
+- 优先级：交互式生成 > Judge/改写/融合 > 证据抽取 > 离线（md_to_json、评估）
+- 排队耗时写入 llm_queue.<stage>.wait_ms 直方图，并随 LLM 调用记录进入 trace
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.service import instrumentation
+from app.service.env_utils import get_env_float
+
+PRIORITY_GENERATION = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_EVIDENCE = 2
+PRIORITY_OFFLINE = 3
+
+# 阶段名 → 优先级，未列出的阶段按交互式处理
+STAGE_PRIORITIES: Dict[str, int] = {
+    "generation": PRIORITY_GENERATION,
+    "chat": PRIORITY_GENERATION,
+    "judge": PRIORITY_INTERACTIVE,
+    "rewrite": PRIORITY_INTERACTIVE,
+    "decompose": PRIORITY_INTERACTIVE,
+    "fusion": PRIORITY_INTERACTIVE,
+    "evidence": PRIORITY_EVIDENCE,
+    "offline": PRIORITY_OFFLINE,
+    "eval": PRIORITY_OFFLINE,
+}
+
+
+class SchedulerTimeout(Exception):
+    """在给定时间内未取得调用名额。"""
+
+
+class LLMScheduler:
+    """
+    全局 LLM 调用调度器（线程安全）。
+    max_concurrency: 同时在途的调用数上限
+    rate_per_second: 令牌桶补充速率（<=0 表示不限速）
+    burst: 令牌桶容量
+    """
+
+    def __init__(self, max_concurrency: int, rate_per_second: float = 0.0, burst: Optional[float] = None):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.rate_per_second = float(rate_per_second)
+        self.burst = float(burst) if burst and burst > 0 else float(self.max_concurrency)
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate_per_second > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate_per_second)
+        self._last_refill = now
+
+    def _token_wait_seconds(self) -> float:
+        """令牌桶有令牌时返回 0，否则返回补充到 1 个令牌所需秒数。"""
+        if self.rate_per_second <= 0:
+            return 0.0
+        self._refill()
+        if self._tokens >= 1.0:
+            return 0.0
+        return (1.0 - self._tokens) / self.rate_per_second
+
+    def _grant(self) -> None:
+        heapq.heappop(self._waiters)
+        self._in_flight += 1
+        if self.rate_per_second > 0:
+            self._tokens -= 1.0
+        # 队首变化，唤醒其他等待者重新检查
+        self._cond.notify_all()
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> float:
+        """
+        按优先级排队取得一个调用名额，返回排队耗时（毫秒）。
+        超过 timeout 秒仍未取得时抛出 SchedulerTimeout。
+        """
+        t0 = time.perf_counter()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = (int(priority), next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            while True:
+                wait_s: Optional[float] = None
+                if self._waiters[0] == ticket and self._in_flight < self.max_concurrency:
+                    token_wait = self._token_wait_seconds()
+                    if token_wait <= 0:
+                        self._grant()
+                        break
+                    wait_s = token_wait
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiters.remove(ticket)
+                        heapq.heapify(self._waiters)
+                        self._cond.notify_all()
+                        raise SchedulerTimeout(f"LLM 调用排队超时（{timeout}s）")
+                    wait_s = remaining if wait_s is None else min(wait_s, remaining)
+                self._cond.wait(wait_s)
+        return (time.perf_counter() - t0) * 1000.0
+
+    def try_acquire(self, priority: int = PRIORITY_INTERACTIVE) -> bool:
+        """非阻塞取得名额：仅在无人排队、并发与令牌均有余量时成功。"""
+        with self._cond:
+            if self._waiters or self._in_flight >= self.max_concurrency or self._token_wait_seconds() > 0:
+                return False
+            heapq.heappush(self._waiters, (int(priority), next(self._seq)))
+            self._grant()
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._cond.notify_all()
+
+    def acquire_stage(self, stage: str = "llm", timeout: Optional[float] = None) -> Dict[str, Any]:
+        """按阶段优先级取得名额并记录排队耗时，返回 {"queue_wait_ms", "priority"}；调用方负责 release。"""
+        priority = STAGE_PRIORITIES.get(stage, PRIORITY_INTERACTIVE)
+        wait_ms = self.acquire(priority, timeout=timeout)
+        instrumentation.metrics.observe(f"llm_queue.{stage}.wait_ms", wait_ms)
+        return {"queue_wait_ms": round(wait_ms, 3), "priority": priority}
+
+    @contextmanager
+    def slot(self, stage: str = "llm", timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """按阶段优先级取得名额，yield 出的 dict 含 queue_wait_ms。"""
+        queue_info = self.acquire_stage(stage, timeout=timeout)
+        try:
+            yield queue_info
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queued: Dict[int, int] = {}
+            for prio, _ in self._waiters:
+                queued[prio] = queued.get(prio, 0) + 1
+            self._refill()
+            return {
+                "max_concurrency": self.max_concurrency,
+                "rate_per_second": self.rate_per_second,
+                "burst": self.burst,
+                "in_flight": self._in_flight,
+                "queued": len(self._waiters),
+                "queued_by_priority": queued,
+                "tokens": round(self._tokens, 3) if self.rate_per_second > 0 else None,
+            }
+
+
+_scheduler_lock = threading.Lock()
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_scheduler() -> LLMScheduler:
+    """获取进程级调度器（按环境变量懒加载）。"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler(
+                    max_concurrency=int(get_env_float("LLM_MAX_CONCURRENCY", 8)),
+                    rate_per_second=get_env_float("LLM_RATE_LIMIT_RPS", 0.0),
+                    burst=get_env_float("LLM_RATE_BURST", 0.0),
+                )
+    return _scheduler
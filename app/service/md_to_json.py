@@ -8,6 +8,14 @@ import re
 import concurrent.futures
 import time
 from collections import Counter
+from contextlib import nullcontext
+
+try:
+    # 与服务共进程运行时纳入全局 LLM 调度（离线优先级，让位于在线问答）
+    from app.service.llm_scheduler import get_scheduler
+except ImportError:
+    # 作为独立脚本运行时不做全局调度
+    get_scheduler = None
 
 # 路径配置，MD_DIR 为需要翻译的MD文件存放目录，JSON_DIR为生成的JSON文件存放的目录
 MD_DIR = Path(r"E:\My_Project\Python\RAG\md")
@@ -310,7 +318,8 @@ class FastPaperProcessor:
 
         try:
             # 使用会话发送请求，重用连接
-            response = self.session.post(url, json=data, timeout=60)
+            with (get_scheduler().slot("offline") if get_scheduler else nullcontext()):
+                response = self.session.post(url, json=data, timeout=60)
             if response.status_code == 200:
                 content = response.json()['choices'][0]['message']['content']
                 return _parse_first_json_object(content)
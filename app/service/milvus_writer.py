@@ -0,0 +1,185 @@
+"""Milvus 批量写入缓冲与 flush / compaction 策略。
+
+- MilvusWriteBuffer：汇总多篇文档的记录，按条数（MILVUS_WRITE_BATCH_RECORDS）或估计字节数
+  （MILVUS_WRITE_BATCH_BYTES）切成大批次写入，避免每篇文档一次 insert
+- FlushPolicy：写入 / 删除后不再立即 coll.flush()（每次 flush 都会封存 segment，产生大量小 segment），
+  而是距上次 flush 超过 MILVUS_FLUSH_INTERVAL_S 秒或累计变更超过 MILVUS_FLUSH_MAX_PENDING 条时才 flush；
+  未 flush 的写入与删除同样可被检索到，flush 只影响 segment 封存时机
+- 大批量入库结束后（写入条数 >= MILVUS_COMPACT_MIN_RECORDS）统一 flush 并触发一次 compaction，合并小 segment
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.service.env_utils import get_env_float
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_record_bytes(record: Dict[str, Any]) -> int:
+    """估计单条记录的写入字节数：字符串按 UTF-8 长度，向量按 float32，其余按 8 字节。"""
+    size = 0
+    for value in record.values():
+        if isinstance(value, str):
+            size += len(value.encode("utf-8"))
+        elif isinstance(value, (list, tuple)):
+            size += 4 * len(value)
+        elif isinstance(value, dict):
+            size += len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        else:
+            size += 8
+    return size
+
+
+class FlushPolicy:
+    """按集合记录自上次 flush 以来的变更条数与时间，决定是否需要 flush（线程安全）。"""
+
+    def __init__(self, interval_s: float, max_pending: int):
+        self.interval_s = interval_s
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {}
+        self._last_flush: Dict[str, float] = {}
+
+    def note(self, collection: str, count: int = 1) -> bool:
+        """记录 count 条变更，返回此时是否应当 flush（返回 True 时计数已清零）。"""
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending.get(collection, 0) + count
+            last = self._last_flush.setdefault(collection, now)
+            if pending >= self.max_pending or now - last >= self.interval_s:
+                self._pending[collection] = 0
+                self._last_flush[collection] = now
+                return True
+            self._pending[collection] = pending
+            return False
+
+    def reset(self, collection: str) -> None:
+        with self._lock:
+            self._pending[collection] = 0
+            self._last_flush[collection] = time.monotonic()
+
+
+_policy_lock = threading.Lock()
+_policy: Optional[FlushPolicy] = None
+
+
+def get_flush_policy() -> FlushPolicy:
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = FlushPolicy(
+                    interval_s=get_env_float("MILVUS_FLUSH_INTERVAL_S", 60.0),
+                    max_pending=int(get_env_float("MILVUS_FLUSH_MAX_PENDING", 50000)),
+                )
+    return _policy
+
+
+def note_mutation(collection: str, count: int, get_collection: Callable[[str], Any]) -> None:
+    """写入 / 删除后调用：满足 flush 策略时才 flush 集合（失败只记日志）。"""
+    if not get_flush_policy().note(collection, count):
+        return
+    try:
+        get_collection(collection).flush()
+        logger.info(f"[milvus_writer] 集合 {collection} 按策略 flush")
+    except Exception as e:
+        logger.warning(f"[milvus_writer] 集合 {collection} flush 失败: {e}")
+
+
+def flush_and_compact(collection: str, get_collection: Callable[[str], Any], compact: bool) -> None:
+    """批量入库结束：flush 封存剩余数据，按需触发 compaction（异步执行，不等待完成）。"""
+    try:
+        coll = get_collection(collection)
+        coll.flush()
+        get_flush_policy().reset(collection)
+        if compact:
+            coll.compact()
+            logger.info(f"[milvus_writer] 集合 {collection} 已触发 compaction")
+    except Exception as e:
+        logger.warning(f"[milvus_writer] 集合 {collection} flush/compaction 失败: {e}")
+
+
+def write_batch_records() -> int:
+    return max(1, int(get_env_float("MILVUS_WRITE_BATCH_RECORDS", 5000)))
+
+
+def write_batch_bytes() -> int:
+    return max(1, int(get_env_float("MILVUS_WRITE_BATCH_BYTES", 64 * 1024 * 1024)))
+
+
+class MilvusWriteBuffer:
+    """
+    单个集合的写入缓冲：add 按文件累积记录，达到条数或字节上限时写出一批；write_pending 写出剩余记录。
+    insert_fn(collection, records) 负责实际写入（如 StorageService.insert）。
+    同一个文件（owner）的记录总在同一批写入，不会被拆到两次 insert 中：某批写入失败时不抛出，
+    批内所有 owner 记入失败列表（failed() 取快照），由调用方按文件隔离失败，不会残留半个文件。
+    缓冲面向单次调用：并发写入时每个调用方各建一个缓冲，避免一个调用方写出 / 读取另一个调用方的记录。
+    """
+
+    def __init__(
+        self,
+        collection: str,
+        insert_fn: Callable[[str, List[Dict[str, Any]]], Any],
+        max_records: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.collection = collection
+        self.insert_fn = insert_fn
+        self.max_records = max_records or write_batch_records()
+        self.max_bytes = max_bytes or write_batch_bytes()
+        self.total_records = 0
+        self._lock = threading.Lock()
+        self._failed: Dict[Any, BaseException] = {}
+        self._pending: List[Tuple[Dict[str, Any], Any]] = []
+        self._pending_bytes = 0
+
+    def add(self, records: List[Dict[str, Any]], owner: Any = None) -> None:
+        """加入一个文件的全部记录；加入后会超出条数或字节上限时，先把已缓冲的记录写出一批。"""
+        if not records:
+            return
+        size = sum(estimate_record_bytes(rec) for rec in records)
+        with self._lock:
+            if self._pending and (
+                len(self._pending) + len(records) > self.max_records or self._pending_bytes + size > self.max_bytes
+            ):
+                batch = self._take_locked()
+            else:
+                batch = []
+            self._pending.extend((rec, owner) for rec in records)
+            self._pending_bytes += size
+        if batch:
+            self._insert(batch)
+
+    def write_pending(self) -> None:
+        with self._lock:
+            batch = self._take_locked()
+        if batch:
+            self._insert(batch)
+
+    def failed(self) -> Dict[Any, BaseException]:
+        """写入失败的 owner -> 异常（快照）。"""
+        with self._lock:
+            return dict(self._failed)
+
+    def _take_locked(self) -> List[Tuple[Dict[str, Any], Any]]:
+        batch, self._pending, self._pending_bytes = self._pending, [], 0
+        return batch
+
+    def _insert(self, batch: List[Tuple[Dict[str, Any], Any]]) -> None:
+        try:
+            self.insert_fn(self.collection, [rec for rec, _ in batch])
+        except Exception as e:
+            logger.error(f"[MilvusWriteBuffer] 集合 {self.collection} 批量写入 {len(batch)} 条失败: {e}", exc_info=True)
+            with self._lock:
+                for _, owner in batch:
+                    self._failed.setdefault(owner, e)
+            return
+        with self._lock:
+            self.total_records += len(batch)
+        logger.info(f"[MilvusWriteBuffer] 集合 {self.collection} 批量写入 {len(batch)} 条")
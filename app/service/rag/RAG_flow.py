@@ -6,19 +6,26 @@ RAG流程实现
 根据提供的流程图，实现完整的检索增强生成流程
 """
 
+import atexit
 import logging
+import logging.handlers
 import json
 import os
+import queue
+import random
 import time
 import re
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 import concurrent.futures
 import requests
 
 # 导入项目的retrieval_service模块
-from app.service import retrieval_service
+from app.service import anchor_index, chunk_features, instrumentation, llm_hedging, llm_scheduler, retrieval_service
+from app.service.env_utils import get_env_float, get_env_int, is_truthy_env
+from app.service.rag import context_packer, evidence_selector, latency_budget, near_dedup, query_decomposer
 
 # 终端颜色支持（重要信息高亮）
 try:
@@ -31,8 +38,20 @@ except Exception:
     _COLOR_ENABLED = False
 
 
+# 终端逐步输出开关：命令行调试默认开启，服务模式下由 app.main 关闭（RAG_CONSOLE_ECHO 可覆盖）
+_CONSOLE_ECHO = is_truthy_env("RAG_CONSOLE_ECHO", True)
+
+
+def set_console_echo(enabled: bool) -> None:
+    """开启/关闭 _print_info/_print_warning 的终端输出。"""
+    global _CONSOLE_ECHO
+    _CONSOLE_ECHO = bool(enabled)
+
+
 def _print_info(text: str) -> None:
     """普通信息输出（默认白色）。"""
+    if not _CONSOLE_ECHO:
+        return
     if _COLOR_ENABLED:
         print(Fore.WHITE + str(text) + Style.RESET_ALL)
     else:
@@ -41,6 +60,8 @@ def _print_info(text: str) -> None:
 
 def _print_warning(text: str) -> None:
     """重要/告警信息输出（红色高亮）。"""
+    if not _CONSOLE_ECHO:
+        return
     if _COLOR_ENABLED:
         print(Fore.RED + str(text) + Style.RESET_ALL)
     else:
@@ -54,36 +75,143 @@ RAG_FLOW_LOG_PATH = _CURRENT_DIR / "rag_flow.log"
 
 # chunk summary 最大并发数，降低 API 限流/失败，缓解多跳多论文指标下降
 _SUMMARY_MAX_WORKERS = 4
-# 回退为原文时进入融合的最大字符数，避免长原文主导融合导致 Judge 误判不足
-_FALLBACK_CONTENT_MAX_CHARS = 800
-
-# 设置日志（仅写入 test 目录下的 rag_flow.log）
-logger = logging.getLogger("RAGFlow")
-logger.setLevel(logging.INFO)
-if not logger.handlers:
-    file_handler = logging.FileHandler(RAG_FLOW_LOG_PATH, encoding="utf-8")
-    formatter = logging.Formatter("%(asctime)s - RAGFlow - %(levelname)s - %(message)s")
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+# 回退为原文时进入融合的最大 token 数，避免长原文主导融合导致 Judge 误判不足
+_FALLBACK_CONTENT_MAX_TOKENS = 512
+# 单条证据句的最大 token 数
+_EVIDENCE_SENTENCE_MAX_TOKENS = 256
+# 延迟预算用尽时尽力生成的上下文 / 输出 token 上限
+_BEST_EFFORT_CONTEXT_TOKENS = 1500
+_BEST_EFFORT_MAX_TOKENS = 512
+_GENERATION_FAILED_RESPONSE = "抱歉，无法生成响应。"
+
+# 推测式 query 改写的全局并发上限（跨请求共享），超过上限时本次运行不做推测
+_speculation_lock = threading.Lock()
+_speculation_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_speculation_slots: Optional[threading.BoundedSemaphore] = None
+
+# trace 采样率（0~1），仅影响写入 rag_flow.log 的 TRACE 记录，不影响 return_trace 返回值
+_TRACE_SAMPLE_RATE = min(1.0, max(0.0, get_env_float("RAG_TRACE_SAMPLE_RATE", 1.0)))
+# trace 载荷策略：preview 仅保留 chunk_id 与预览，full 保留 content_full/summary_full 等完整文本
+_TRACE_PAYLOAD_MODE = os.getenv("RAG_TRACE_PAYLOAD", "preview").strip().lower() or "preview"
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时直接丢弃记录，保证请求线程永不因写日志阻塞。"""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            instrumentation.metrics.incr("trace_log.dropped")
+
+
+def _trim_trace_payload(value: Any) -> Any:
+    """递归去掉 *_full 字段（content_full、summary_full 等），仅保留 chunk_id 与预览。"""
+    if isinstance(value, dict):
+        return {k: _trim_trace_payload(v) for k, v in value.items() if not str(k).endswith("_full")}
+    if isinstance(value, list):
+        return [_trim_trace_payload(v) for v in value]
+    return value
+
+
+class _TraceFormatter(logging.Formatter):
+    """
+    在 QueueListener 线程中序列化 TRACE 记录：请求线程只把 trace 字典挂在记录上入队，
+    按 RAG_TRACE_PAYLOAD 去掉完整文本与 json.dumps 都在这里完成，不占用请求线程。
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        trace = getattr(record, "trace", None)
+        if trace is not None:
+            try:
+                payload = trace if _TRACE_PAYLOAD_MODE == "full" else _trim_trace_payload(trace)
+                record.msg = "TRACE " + json.dumps(payload, ensure_ascii=False)
+            except Exception as e:
+                record.msg = f"写入RAG流程trace日志失败: {str(e)}"
+                record.levelname = "ERROR"
+            record.args = None
+            record.trace = None
+        return super().format(record)
+
+
+def _setup_logger() -> logging.Logger:
+    """
+    设置日志（仅写入当前目录下的 rag_flow.log）。
+    请求线程只把记录放入有界队列，由后台 QueueListener 线程写入按大小轮转的日志文件。
+    """
+    rag_logger = logging.getLogger("RAGFlow")
+    rag_logger.setLevel(logging.INFO)
+    if rag_logger.handlers:
+        return rag_logger
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        RAG_FLOW_LOG_PATH,
+        maxBytes=get_env_int("RAG_TRACE_MAX_BYTES", 50 * 1024 * 1024),
+        backupCount=get_env_int("RAG_TRACE_BACKUP_COUNT", 5),
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(_TraceFormatter("%(asctime)s - RAGFlow - %(levelname)s - %(message)s"))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=get_env_int("RAG_LOG_QUEUE_SIZE", 10000))
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    # 进程退出时把队列中剩余记录写完
+    atexit.register(listener.stop)
+
+    rag_logger.addHandler(_DroppingQueueHandler(log_queue))
+    rag_logger.propagate = False
+    return rag_logger
+
+
+logger = _setup_logger()
+
 
 def _append_trace_log(trace: Dict[str, Any]) -> None:
     """
-    将本次 RAG 流程的完整 trace 以结构化形式写入统一的 rag_flow.log 中。
+    将本次 RAG 流程的 trace 以结构化形式写入统一的 rag_flow.log 中。
     使用一条 TRACE 级别的JSON记录，便于后续程序和人工同时分析。
+    按 RAG_TRACE_SAMPLE_RATE 采样；裁剪与序列化由日志线程中的 _TraceFormatter 完成。
     """
+    if _TRACE_SAMPLE_RATE < 1.0 and random.random() >= _TRACE_SAMPLE_RATE:
+        return
     try:
-        logger.info("TRACE %s", json.dumps(trace, ensure_ascii=False))
+        logger.info("TRACE", extra={"trace": trace})
     except Exception as e:
         # 不影响主流程
         logger.error(f"写入RAG流程trace日志失败: {str(e)}")
 
 
-def _truncate_for_fusion(text: str, max_chars: int = _FALLBACK_CONTENT_MAX_CHARS) -> str:
-    """回退为原文时截断后再送入融合，避免超长原文主导上下文。"""
-    s = str(text).strip() if text is not None else ""
-    if len(s) <= max_chars:
-        return s
-    return s[:max_chars]
+def _get_speculation_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """懒加载推测式改写使用的共享线程池与全局并发槽位（RAG_SPECULATIVE_MAX_INFLIGHT）。"""
+    global _speculation_executor, _speculation_slots
+    with _speculation_lock:
+        if _speculation_executor is None:
+            max_inflight = max(1, get_env_int("RAG_SPECULATIVE_MAX_INFLIGHT", 4) or 4)
+            _speculation_slots = threading.BoundedSemaphore(max_inflight)
+            _speculation_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_inflight,
+                thread_name_prefix="rag-speculate",
+            )
+        return _speculation_executor
+
+
+def _try_acquire_speculation_slot() -> bool:
+    """非阻塞获取推测槽位：槽位耗尽时直接放弃推测，不排队等待。"""
+    _get_speculation_executor()
+    return bool(_speculation_slots and _speculation_slots.acquire(blocking=False))
+
+
+def _release_speculation_slot() -> None:
+    if _speculation_slots is not None:
+        try:
+            _speculation_slots.release()
+        except ValueError:
+            pass
+
+
+def _truncate_for_fusion(text: str, max_tokens: int = _FALLBACK_CONTENT_MAX_TOKENS) -> str:
+    """回退为原文时按 token 截断后再送入融合，避免超长原文主导上下文。"""
+    return context_packer.truncate_to_tokens(text, max_tokens)
 
 
 # DeepSeek API配置
@@ -91,6 +219,24 @@ API_KEY = "sk-9e728482e15f4cecba9ead88ff7e9cc8"
 BASE_URL = "https://api.deepseek.com"
 MODEL = "deepseek-chat"
 
+# 对冲请求（主请求 + 重复请求）所用线程池，按需创建、跨请求共享
+_hedge_executor_lock = threading.Lock()
+_hedge_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+
+def _get_hedge_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                # 每个在途请求（含已落败、尚未结束的）都占用一个调度名额，线程数不会超过并发上限
+                _hedge_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=llm_scheduler.get_scheduler().max_concurrency,
+                    thread_name_prefix="llm-hedge",
+                )
+    return _hedge_executor
+
+
 class DeepSeekClient:
     """DeepSeek API客户端"""
 
@@ -98,32 +244,130 @@ class DeepSeekClient:
         self.api_key = api_key
         self.base_url = base_url
         self.model = model
+        # 复用 HTTP 连接池（requests.Session 可跨线程并发发送请求），连接数与全局 LLM 并发上限对齐
+        self._session = requests.Session()
+        pool_size = llm_scheduler.get_scheduler().max_concurrency
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def _post_chat(
+        self,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        timeout_s: float,
+        session: Optional[requests.Session] = None,
+    ) -> Dict[str, Any]:
+        """发送一次 /chat/completions 请求并返回响应 JSON（未指定 session 时使用共享连接池）。"""
+        post = (session if session is not None else self._session).post
+        response = post(
+            f"{self.base_url}/chat/completions",
+            headers=headers,
+            json=payload,
+            timeout=timeout_s
+        )
+        response.raise_for_status()
+        return response.json()
 
-    def chat_completion(self, messages: List[Dict[str, str]]) -> Optional[str]:
+    def _slot_attempt(
+        self,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        timeout_s: float,
+        session: Optional[requests.Session] = None,
+    ) -> Dict[str, Any]:
+        """持有一个调度名额的请求：请求真正结束（成功、失败或被中断）时才归还名额。"""
+        try:
+            return self._post_chat(headers, payload, timeout_s, session)
+        finally:
+            llm_scheduler.get_scheduler().release()
+
+    def _post_with_hedging(
+        self,
+        stage: str,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        timeout_s: float,
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         """
-        调用DeepSeek API进行对话完成
+        发送请求；若该阶段启用对冲且超过其 p90 仍未返回，在预算与调度名额允许时发出重复请求，
+        取先成功返回者。返回 (响应 JSON, 对冲信息)。
+        调用前须已为本次调用取得一个调度名额，由本方法负责归还：每个请求各持有一个名额，直到该请求
+        真正结束才归还。主请求走共享连接池；对冲请求使用独立的临时 Session，主请求先返回时关闭它以尽力取消。
+        对冲胜出时主请求无法单独中断（共享连接池不能关闭），在其响应或超时前继续计入 LLM_MAX_CONCURRENCY。
         """
-        # 通过环境变量提供可控采样参数，默认尽量确定性以提升复现性
-        def _get_env_float(name: str, default: float) -> float:
+        scheduler = llm_scheduler.get_scheduler()
+        policy = llm_hedging.get_hedge_policy()
+        delay = policy.hedge_delay_seconds(stage)
+        if delay is None:
             try:
-                v = os.getenv(name, "").strip()
-                return float(v) if v != "" else float(default)
-            except Exception:
-                return float(default)
+                return self._post_chat(headers, payload, timeout_s), {}
+            finally:
+                scheduler.release()
 
-        def _get_env_int(name: str) -> Optional[int]:
+        executor = _get_hedge_executor()
+        try:
+            primary = executor.submit(self._slot_attempt, headers, payload, timeout_s)
+        except BaseException:
+            scheduler.release()
+            raise
+        hedge_session: Optional[requests.Session] = None
+        hedge_info: Dict[str, Any] = {"hedged": False}
+        try:
+            done, _ = concurrent.futures.wait([primary], timeout=delay)
+            if primary in done or not policy.try_spend(stage):
+                return primary.result(), hedge_info
+            priority = llm_scheduler.STAGE_PRIORITIES.get(stage, llm_scheduler.PRIORITY_INTERACTIVE)
+            if not scheduler.try_acquire(priority):
+                return primary.result(), hedge_info
+
+            logger.info(f"LLM调用超过阶段 {stage} 的 p90（{delay * 1000:.0f}ms），发出对冲请求")
+            hedge_session = requests.Session()
             try:
-                v = os.getenv(name, "").strip()
-                if v == "":
-                    return None
-                return int(v)
-            except Exception:
-                return None
+                hedge = executor.submit(self._slot_attempt, headers, payload, timeout_s, hedge_session)
+            except BaseException:
+                scheduler.release()
+                raise
+            hedge_info = {"hedged": True, "hedge_delay_ms": round(delay * 1000.0, 3), "hedge_won": False}
+
+            pending = {primary, hedge}
+            first_error: Optional[BaseException] = None
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in done:
+                    if fut.exception() is None:
+                        hedge_info["hedge_won"] = fut is hedge
+                        if fut is hedge:
+                            instrumentation.metrics.incr(f"llm.{stage}.hedge_wins")
+                        return fut.result(), hedge_info
+                    first_error = first_error or fut.exception()
+            raise first_error  # type: ignore[misc]
+        finally:
+            # 关闭对冲请求的临时 Session：对冲胜出时已读完响应，未完成时尽力中断连接（其名额在请求退出时归还）
+            if hedge_session is not None:
+                try:
+                    hedge_session.close()
+                except Exception:
+                    pass
 
-        temperature = _get_env_float("DEEPSEEK_TEMPERATURE", 0.0)
-        top_p = _get_env_float("DEEPSEEK_TOP_P", 1.0)
-        seed = _get_env_int("DEEPSEEK_SEED")
-        timeout_s = _get_env_float("DEEPSEEK_TIMEOUT_SECONDS", 30.0)
+    def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        stage: str = "llm",
+        max_tokens: Optional[int] = None,
+    ) -> Optional[str]:
+        """
+        调用DeepSeek API进行对话完成
+        Args:
+            messages: 对话消息
+            stage: 调用所属阶段（rewrite/evidence/fusion/judge/generation 等），用于耗时与 token 埋点
+            max_tokens: 输出 token 上限，缺省不发送（由服务端决定）
+        """
+        # 通过环境变量提供可控采样参数，默认尽量确定性以提升复现性
+        temperature = get_env_float("DEEPSEEK_TEMPERATURE", 0.0)
+        top_p = get_env_float("DEEPSEEK_TOP_P", 1.0)
+        seed = get_env_int("DEEPSEEK_SEED")
+        timeout_s = get_env_float("DEEPSEEK_TIMEOUT_SECONDS", 30.0)
 
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -139,26 +383,114 @@ class DeepSeekClient:
         # seed 兼容性不保证：仅在显式配置时发送
         if seed is not None:
             payload["seed"] = seed
+        if max_tokens is not None:
+            payload["max_tokens"] = int(max_tokens)
+
+        # 延迟预算：收紧单次调用超时与排队等待；截止时间已过时跳过非生成类调用（调用方均有降级路径）
+        queue_timeout: Optional[float] = None
+        budget = latency_budget.get_current_budget()
+        if budget is not None:
+            if stage != "generation" and budget.expired():
+                logger.warning(f"延迟预算已用尽，跳过 {stage} 阶段的LLM调用")
+                budget.record("skip_llm_call", stage=stage)
+                return None
+            timeout_s = budget.llm_timeout(timeout_s)
+            if stage != "generation":
+                queue_timeout = budget.queue_timeout()
+
+        # 进程级调度：全局并发/限速，按阶段优先级排队（生成 > Judge/改写 > 证据抽取 > 离线）；
+        # 名额交给 _post_with_hedging，在请求真正结束时归还
+        try:
+            queue_info = llm_scheduler.get_scheduler().acquire_stage(stage, timeout=queue_timeout)
+        except llm_scheduler.SchedulerTimeout as e:
+            instrumentation.record_llm_call(stage, 0.0, None, success=False, error=str(e))
+            logger.warning(f"DeepSeek API调用排队超时: {str(e)}")
+            return None
 
+        t0 = time.perf_counter()
         try:
             logger.info("调用DeepSeek API进行对话完成")
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=timeout_s
-            )
-            response.raise_for_status()
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
+            result, hedge_info = self._post_with_hedging(stage, headers, payload, timeout_s)
+            content = result["choices"][0]["message"]["content"]
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            llm_hedging.get_hedge_policy().observe(stage, elapsed_ms)
+            instrumentation.record_llm_call(stage, elapsed_ms, result.get("usage"), **queue_info, **hedge_info)
+            return content
         except Exception as e:
+            instrumentation.record_llm_call(
+                stage, (time.perf_counter() - t0) * 1000.0, None, success=False, error=str(e)[:200], **queue_info
+            )
             logger.error(f"DeepSeek API调用失败: {str(e)}")
             print(f"DeepSeek API调用失败: {str(e)}")
             return None
 
 
+class EvidenceStore:
+    """
+    单次 RAG 运行内的证据缓存，按 (chunk_id, query) 记录证据抽取结果。
+    后续轮次对已抽取过的 chunk 直接复用，仅对新 chunk 调用 LLM；
+    同时保存上一轮融合结果，供融合阶段在已有结论上增量合并新证据。
+    """
+
+    def __init__(self, reuse_across_queries: bool = True):
+        # 改写后的 query 保留原问题锚点与语义，默认允许跨 query 复用同一 chunk 的证据
+        self.reuse_across_queries = reuse_across_queries
+        self._entries: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+        self._latest_by_chunk: Dict[Any, Dict[str, Any]] = {}
+        self.fused_info: Optional[str] = None
+        self.fused_chunk_ids: set = set()
+        self.last_round_stats: Dict[str, Any] = {}
+
+    def get(self, chunk_id: Any, query: str) -> Optional[Dict[str, Any]]:
+        if chunk_id is None:
+            return None
+        hit = self._entries.get((chunk_id, query))
+        if hit is None and self.reuse_across_queries:
+            hit = self._latest_by_chunk.get(chunk_id)
+        return hit
+
+    def put(self, chunk_id: Any, query: str, evidence: Dict[str, Any]) -> None:
+        if chunk_id is None:
+            return
+        self._entries[(chunk_id, query)] = evidence
+        self._latest_by_chunk[chunk_id] = evidence
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RunContext:
+    """
+    单次 RAG 运行的可变状态：证据缓存、本轮 evidence、Judge 输出与埋点记录器。
+    每次 run 新建一个，不挂在 RAGFlow 实例上，使同一实例可安全服务并发请求。
+    """
+
+    def __init__(
+        self,
+        evidence_store: Optional[EvidenceStore] = None,
+        recorder: Optional[instrumentation.TraceRecorder] = None,
+        budget: Optional[latency_budget.LatencyBudget] = None,
+    ):
+        self.evidence_store = evidence_store if evidence_store is not None else EvidenceStore()
+        self.recorder = recorder
+        self.budget = budget
+        # 本轮之后是否还能继续迭代（轮数、改写次数与延迟预算均允许）；不能继续时 LLM Judge 的结论不影响流程
+        self.can_continue = True
+        # 本轮 evidence 抽取结果，供 Judge 规则与 trace 使用
+        self.evidence_items: List[Dict[str, Any]] = []
+        # 本轮证据扇出的选择统计，写入 trace
+        self.evidence_selection: Dict[str, Any] = {}
+        # 锚点索引命中：str(chunk_id) -> 入库时抽取的事实句与等式事实，直接作为证据，不走 LLM 抽取
+        self.anchor_hits: Dict[str, Dict[str, Any]] = {}
+        # 问题中的标题只模糊匹配到的文档（str(doc_id)）：不作为 doc_id 过滤，只在证据排序时加分（RAG_TITLE_FUZZY_BOOST）
+        self.title_boost_doc_ids: set = set()
+        # 本轮 Judge 原始输出与规则判定原因，写入 trace
+        self.judge_raw: Optional[str] = None
+        self.judge_rule: Optional[str] = None
+
+
 class RAGFlow:
-    """RAG流程实现类"""
+    """RAG流程实现类（无请求级状态，可作为长驻引擎被并发请求共享，见 get_rag_engine）"""
 
     def __init__(self):
         # 初始化DeepSeek客户端
@@ -169,8 +501,10 @@ class RAGFlow:
         # 最多允许的 query 改写轮数
         self.max_rewrite_rounds = 2
 
-        # 记录上一轮 evidence 抽取结果，供 Judge 规则与 trace 使用
-        self._last_evidence_items: List[Dict[str, Any]] = []
+        # 推测式改写：首轮检索/证据抽取的同时并发执行 query 改写，并可预取改写后 query 的检索结果；
+        # 首轮判定足够时直接丢弃。默认关闭，全局并发由 RAG_SPECULATIVE_MAX_INFLIGHT 限制
+        self.speculative_rewrite = is_truthy_env("RAG_SPECULATIVE_REWRITE", False)
+        self.speculative_prefetch = is_truthy_env("RAG_SPECULATIVE_PREFETCH", True)
 
     def _safe_json_loads(self, text: str) -> Optional[Dict[str, Any]]:
         """尽力解析 LLM 输出的 JSON。"""
@@ -195,7 +529,7 @@ class RAGFlow:
         """
         if not query:
             return []
-        anchors = re.findall(r"[A-Za-z][A-Za-z0-9_.\-]{1,}", query)
+        anchors = anchor_index.ANCHOR_RE.findall(query)
         seen = set()
         out: List[str] = []
         for a in anchors:
@@ -267,7 +601,7 @@ class RAGFlow:
             }
         ]
 
-        rewritten_query = self.deepseek.chat_completion(messages)
+        rewritten_query = self.deepseek.chat_completion(messages, stage="rewrite")
 
         if not rewritten_query:
             logger.warning("查询改写失败，使用原始查询")
@@ -297,6 +631,141 @@ class RAGFlow:
 
         return rewritten_query
 
+    def _speculative_rewrite_task(
+        self,
+        original_query: str,
+        base_query: str,
+        round1_results: Any,
+        cancel_event: threading.Event,
+        doc_id: Union[int, List[int], None] = None,
+        kb_id: Union[int, List[int], None] = None,
+        security_level: Union[int, List[int], None] = None,
+    ) -> Dict[str, Any]:
+        """
+        推测式改写任务（后台线程执行，与首轮证据抽取 / Judge 并发）：
+        按首轮检索结果构造与串行改写相同的上下文（无结果时按未检索到文档改写）并改写 query，
+        若开启预取且改写结果与首轮 query 不同，则继续预取改写后 query 的检索结果。
+        首轮判定足够时 cancel_event 被置位，未开始的预取直接跳过。
+        """
+        try:
+            if not round1_results:
+                context = (
+                    f"当前查询: {base_query}\n"
+                    f"检索结果: 未找到任何相关文档，请在不改变问题核心语义的前提下，"
+                    f"尝试从不同表述方式、补充关键信息等角度改写查询，以提高检索召回。"
+                )
+            else:
+                # 融合结果此时尚未产出，用首轮检索结果的原文片段代替
+                snippets = "\n".join(
+                    (getattr(r, "content", "") or "").strip() for r in list(round1_results)[:3]
+                )
+                context = (
+                    f"当前查询: {base_query}\n"
+                    f"已检索到的信息片段（截断）: {snippets[:200]}...\n"
+                    f"当前信息可能不足以完全回答问题，请在不改变问题核心含义的前提下，"
+                    f"适度调整或扩展查询表达，以获取更相关的文献片段。"
+                )
+            new_query = self.understand_and_rewrite_query(original_query, context)
+            outcome: Dict[str, Any] = {"query": new_query, "results": None, "retrieval_record": None}
+            if (
+                self.speculative_prefetch
+                and new_query
+                and new_query != base_query
+                and not cancel_event.is_set()
+            ):
+                with instrumentation.stage("speculative_prefetch"):
+                    results, retrieval_record = self.retrieve_documents(
+                        new_query,
+                        collect_trace=True,
+                        doc_id=doc_id,
+                        kb_id=kb_id,
+                        security_level=security_level,
+                    )
+                outcome["results"] = results
+                outcome["retrieval_record"] = retrieval_record
+            return outcome
+        finally:
+            _release_speculation_slot()
+
+    def _start_speculative_rewrite(
+        self,
+        original_query: str,
+        base_query: str,
+        round1_results: Any,
+        cancel_event: threading.Event,
+        doc_id: Union[int, List[int], None] = None,
+        kb_id: Union[int, List[int], None] = None,
+        security_level: Union[int, List[int], None] = None,
+    ) -> Optional[concurrent.futures.Future]:
+        """在允许推测且存在后续改写轮次时提交推测任务；全局槽位耗尽时返回 None。"""
+        if not self.speculative_rewrite:
+            return None
+        if self.max_rewrite_rounds <= 0 or self.max_iterations <= 1:
+            return None
+        if not _try_acquire_speculation_slot():
+            logger.info("推测式改写槽位已满，本次运行不做推测")
+            return None
+        try:
+            return instrumentation.submit_with_context(
+                _get_speculation_executor(),
+                self._speculative_rewrite_task,
+                original_query,
+                base_query,
+                round1_results,
+                cancel_event,
+                doc_id,
+                kb_id,
+                security_level,
+            )
+        except Exception as e:
+            _release_speculation_slot()
+            logger.warning(f"提交推测式改写任务失败: {str(e)}")
+            return None
+
+    def _take_speculative_rewrite(
+        self,
+        future: Optional[concurrent.futures.Future],
+        speculation: Dict[str, Any],
+    ) -> Tuple[Optional[str], Optional[Tuple[str, Any, Dict[str, Any]]]]:
+        """
+        等待并取用推测式改写结果。
+        返回 (改写后的 query, 预取结果)；推测不可用时返回 (None, None)，由调用方回退为串行改写。
+        预取结果格式为 (query, results, retrieval_record)。
+        """
+        if future is None:
+            return None, None
+        try:
+            outcome = future.result()
+        except Exception as e:
+            logger.warning(f"推测式改写失败，回退为串行改写: {str(e)}")
+            return None, None
+
+        new_query = outcome.get("query") if isinstance(outcome, dict) else None
+        if not new_query:
+            return None, None
+        speculation["used"] = True
+        prefetched = None
+        if outcome.get("results") is not None:
+            prefetched = (new_query, outcome.get("results"), outcome.get("retrieval_record") or {})
+        logger.info(f"使用推测式改写结果: {new_query}（预取检索: {prefetched is not None}）")
+        return new_query, prefetched
+
+    def _discard_speculation(
+        self,
+        future: Optional[concurrent.futures.Future],
+        cancel_event: threading.Event,
+        speculation: Dict[str, Any],
+    ) -> None:
+        """丢弃未使用的推测任务：未开始的直接取消并归还槽位，已开始的通过 cancel_event 跳过预取。"""
+        if future is None:
+            return
+        cancel_event.set()
+        if future.cancel():
+            # 任务从未运行，其 finally 不会执行，由这里归还槽位
+            _release_speculation_slot()
+        speculation["discarded"] = True
+        logger.info("首轮信息足够或流程结束，丢弃推测式改写结果")
+
     def _extract_doc_info_from_result(self, result: Any) -> Dict[str, Optional[str]]:
         """
         从检索结果对象中尽可能提取文献信息（doc_id、doc_title）。
@@ -312,56 +781,15 @@ class RAGFlow:
 
         return {"doc_id": doc_id, "doc_title": doc_title}
 
-    def _analyze_chunk_structure(self, content: str) -> Dict[str, float]:
+    def _analyze_chunk_structure(self, content: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, float]:
         """
-        对 chunk 文本做简单结构分析，识别表格 / 引用 / 公式等特征。
-        返回 0~1 之间的启发式得分，用于轻微调整排序与证据权重。
+        获取 chunk 的表格 / 引用 / 公式结构得分（0~1），用于轻微调整排序与证据权重。
+        优先读取入库时预计算并写入 Milvus 的得分；旧集合缺少这些字段时现场计算。
         """
-        text = (content or "").strip()
-        if not text:
-            return {"table_score": 0.0, "citation_score": 0.0, "formula_score": 0.0}
-
-        # 表格特征：多行、包含 | 或 , 或制表符，且数字密集
-        lines = text.splitlines()
-        num_lines = len(lines)
-        table_like_lines = 0
-        digit_lines = 0
-        for line in lines:
-            line_strip = line.strip()
-            if not line_strip:
-                continue
-            if "|" in line_strip or "\t" in line_strip or ("," in line_strip and any(ch.isdigit() for ch in line_strip)):
-                table_like_lines += 1
-            if len(re.findall(r"\d", line_strip)) >= 3:
-                digit_lines += 1
-
-        table_score = 0.0
-        if num_lines >= 2:
-            ratio_table = table_like_lines / num_lines
-            ratio_digit = digit_lines / num_lines
-            table_score = min(1.0, 0.6 * ratio_table + 0.4 * ratio_digit)
-
-        # 引用特征：出现 [1]、[12]、[3,4] 等模式
-        citation_matches = re.findall(r"\[[0-9,\s\-]{1,6}\]", text)
-        citation_score = 0.0
-        if citation_matches:
-            citation_score = min(1.0, len(citation_matches) / 4.0)
-
-        # 公式特征：等号、^、_、LaTeX 命令等
-        formula_score = 0.0
-        if any(sym in text for sym in ["=", "+", "-", "*", "/", "^", "_"]):
-            formula_score += 0.3
-        if any(kw in text for kw in ["\\frac", "\\sum", "\\int", "\\log", "\\exp"]):
-            formula_score += 0.4
-        if re.search(r"\b\d+(\.\d+)?\s*(×|x)\s*\d+(\.\d+)?\b", text):
-            formula_score += 0.3
-        formula_score = min(1.0, formula_score)
-
-        return {
-            "table_score": round(table_score, 3),
-            "citation_score": round(citation_score, 3),
-            "formula_score": round(formula_score, 3),
-        }
+        precomputed = chunk_features.structure_scores_from_metadata(metadata)
+        if precomputed is not None:
+            return precomputed
+        return chunk_features.analyze_chunk_structure(content)
 
     def retrieve_documents(self, query: str, collect_trace: bool = False, doc_id: Union[int, List[int], None] = None,
         kb_id: Union[int, List[int], None] = None,
@@ -400,13 +828,25 @@ class RAGFlow:
             logger.info("尝试混合检索...")
             _print_info("\n1. 尝试混合检索...")
             try:
-                hybrid_results = retrieval_service.hybrid_search(
-                    query=query,
-                    top_k=15,  # 减少返回结果数量，提高性能
-                    doc_id=doc_id,
-                    kb_id=kb_id,
-                    security_level=security_level
-                )
+                if is_truthy_env("RAG_GROUP_BY_DOC", False):
+                    # 按文档分组召回：一次检索覆盖多篇论文，避免 top-k 全部来自最相似的一篇
+                    hybrid_results = retrieval_service.hybrid_search(
+                        query=query,
+                        top_k=get_env_int("RAG_GROUP_DOCS", 5),
+                        doc_id=doc_id,
+                        kb_id=kb_id,
+                        security_level=security_level,
+                        group_by_doc=True,
+                        group_size=get_env_int("RAG_GROUP_SIZE", 3),
+                    )
+                else:
+                    hybrid_results = retrieval_service.hybrid_search(
+                        query=query,
+                        top_k=15,  # 减少返回结果数量，提高性能
+                        doc_id=doc_id,
+                        kb_id=kb_id,
+                        security_level=security_level
+                    )
                 logger.info(f"混合检索结果数: {len(hybrid_results)}")
                 _print_info(f"混合检索结果数: {len(hybrid_results)}")
                 retrieval_record["hybrid"]["count"] = len(hybrid_results)
@@ -500,12 +940,33 @@ class RAGFlow:
                     logger.error(f"关键词检索失败: {str(e)}")
                     _print_warning(f"关键词检索失败: {str(e)}")
 
-            # 4. 对合并结果做轻量结构感知排序（不修改原始 score，仅调整 rank）
+            # 4. 近重复折叠：重复入库的论文、父子 chunk 重叠等产生的近似相同片段只保留分数最高者
+            if is_truthy_env("RAG_NEAR_DUP_COLLAPSE", True) and len(all_results) > 1:
+                try:
+                    keep, merged = near_dedup.collapse_near_duplicates(
+                        [getattr(r, "content", "") or "" for r in all_results],
+                        [float(getattr(r, "score", 0.0) or 0.0) for r in all_results],
+                        threshold=get_env_float("RAG_NEAR_DUP_THRESHOLD", 0.85),
+                    )
+                    if merged:
+                        retrieval_record["near_duplicates"] = [
+                            {
+                                "kept": getattr(all_results[rep_idx], "chunk_id", None),
+                                "merged": [getattr(all_results[j], "chunk_id", None) for j in members],
+                            }
+                            for rep_idx, members in merged.items()
+                        ]
+                        logger.info(f"近重复折叠: {len(all_results)} -> {len(keep)}")
+                        all_results = [all_results[i] for i in keep]
+                except Exception as e:
+                    logger.warning(f"近重复折叠失败，保留原结果: {str(e)}")
+
+            # 5. 对合并结果做轻量结构感知排序（不修改原始 score，仅调整 rank）
             scored_results: List[Dict[str, Any]] = []
             for result in all_results:
                 base_score = getattr(result, "score", 0.0) or 0.0
                 content = getattr(result, "content", "") if hasattr(result, "content") else ""
-                struct_scores = self._analyze_chunk_structure(content)
+                struct_scores = self._analyze_chunk_structure(content, getattr(result, "metadata", None))
                 # 轻微加权：表格 > 引用 > 公式
                 boost = (
                     0.25 * struct_scores.get("table_score", 0.0)
@@ -565,6 +1026,124 @@ class RAGFlow:
                 return [], retrieval_record
             return []
 
+    def decompose_query(self, query: str) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        多论文 / 多实体问题拆分为子查询。RAG_DECOMPOSE_MODE：
+        - off：不拆分
+        - rule：仅规则拆分（多个《》标题、并列的锚点实体）
+        - auto（默认）：规则未拆开且问题带有对比/分别等信号时，再用 LLM 拆分
+        Returns:
+            (子查询列表 [{"query", "entity"}]，不足两条表示不拆分; 拆分记录)
+        """
+        mode = os.getenv("RAG_DECOMPOSE_MODE", "auto").strip().lower()
+        max_subqueries = get_env_int("RAG_DECOMPOSE_MAX_SUBQUERIES", 4) or 4
+        record: Dict[str, Any] = {"mode": mode, "method": None, "subqueries": []}
+        if mode not in ("rule", "auto"):
+            return [], record
+
+        subqueries = query_decomposer.rule_based_split(query, max_subqueries=max_subqueries)
+        if subqueries:
+            record["method"] = "rule"
+        elif mode == "auto" and query_decomposer.needs_llm_split(query):
+            messages = [
+                {
+                    "role": "system",
+                    "content": "你是一个学术检索问题拆分助手。若问题涉及多篇论文或多个方法/实体，请拆分为每个论文/实体一条的子查询，便于分别检索。要求：\n1. 每条子查询只针对一个论文或实体，保留原问题中与其相关的锚点（方法名/缩写/符号/标题）\n2. 不要引入原问题没有的新问题\n3. 问题只涉及一个对象时返回空列表\n4. 只输出 JSON：{\"subqueries\": [{\"query\": \"...\", \"entity\": \"...\"}]}"
+                },
+                {"role": "user", "content": f"问题: {query}\n\n输出 JSON:"},
+            ]
+            raw = self.deepseek.chat_completion(messages, stage="decompose")
+            subqueries = query_decomposer.parse_llm_subqueries(self._safe_json_loads(raw or ""), max_subqueries=max_subqueries)
+            if subqueries:
+                record["method"] = "llm"
+        record["subqueries"] = subqueries
+        if subqueries:
+            logger.info(f"问题拆分为 {len(subqueries)} 条子查询（{record['method']}）: {[sq['query'] for sq in subqueries]}")
+            _print_info(f"问题拆分为 {len(subqueries)} 条子查询（{record['method']}）")
+        return subqueries, record
+
+    def retrieve_subqueries(
+        self,
+        subqueries: List[Dict[str, str]],
+        doc_id: Union[int, List[int], None] = None,
+        kb_id: Union[int, List[int], None] = None,
+        security_level: Union[int, List[int], None] = None,
+        title_scoped: bool = False,
+    ) -> Tuple[List[Any], Dict[str, Any]]:
+        """
+        并发检索各子查询，并按子查询配额合并结果，使每个论文/实体在同一轮都有候选进入证据抽取。
+        title_scoped 为 True 时（doc_id 来自问题中的标题解析），子查询提及的标题单独解析为该子查询的 doc_id 过滤。
+        """
+        sub_doc_ids: List[Union[int, List[int], None]] = []
+        for sq in subqueries:
+            scoped = doc_id
+            if title_scoped:
+                try:
+                    scoped = retrieval_service.resolve_query_titles(sq["query"])["doc_ids"] or doc_id
+                except Exception:
+                    scoped = doc_id
+            sub_doc_ids.append(scoped)
+
+        outputs: List[Tuple[List[Any], Dict[str, Any]]] = [([], {}) for _ in subqueries]
+        max_workers = max(1, min(len(subqueries), get_env_int("RAG_DECOMPOSE_MAX_WORKERS", 4) or 4))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                instrumentation.submit_with_context(
+                    executor,
+                    self.retrieve_documents,
+                    sq["query"],
+                    collect_trace=True,
+                    doc_id=sub_doc_ids[i],
+                    kb_id=kb_id,
+                    security_level=security_level,
+                ): i
+                for i, sq in enumerate(subqueries)
+            }
+            for future in concurrent.futures.as_completed(futures):
+                i = futures[future]
+                try:
+                    outputs[i] = future.result()
+                except Exception as e:
+                    logger.warning(f"子查询检索失败: {subqueries[i]['query']}: {str(e)}")
+
+        merged = query_decomposer.merge_with_quotas(
+            [results for results, _ in outputs],
+            total=get_env_int("RAG_DECOMPOSE_MERGE_TOP_K", 20) or 20,
+            key=lambda r: getattr(r, "chunk_id", None),
+            score=lambda r: float(getattr(r, "score", 0.0) or 0.0),
+        )
+
+        # trace：保留各子查询的检索记录，merged_results 按合并顺序重新编号（与单查询检索的格式一致）
+        entries_by_chunk: Dict[Any, Dict[str, Any]] = {}
+        for _, sub_record in outputs:
+            for entry in sub_record.get("merged_results", []):
+                entries_by_chunk.setdefault(entry.get("chunk_id"), entry)
+        merged_ids = [getattr(r, "chunk_id", None) for r in merged]
+        merged_results: List[Dict[str, Any]] = []
+        for rank, chunk_id in enumerate(merged_ids, start=1):
+            entry = entries_by_chunk.get(chunk_id)
+            if entry is not None:
+                merged_results.append({**entry, "rank": rank})
+        merged_set = set(merged_ids)
+        retrieval_record: Dict[str, Any] = {
+            "query": [sq["query"] for sq in subqueries],
+            "subqueries": [
+                {
+                    "query": sq["query"],
+                    "entity": sq.get("entity"),
+                    "doc_id": sub_doc_ids[i],
+                    "count": len(outputs[i][0]),
+                    "taken": sum(1 for r in outputs[i][0] if getattr(r, "chunk_id", None) in merged_set),
+                    "retrieval": outputs[i][1],
+                }
+                for i, sq in enumerate(subqueries)
+            ],
+            "merged_results": merged_results,
+        }
+        logger.info(f"子查询检索合并: {[len(r) for r, _ in outputs]} -> {len(merged)}")
+        _print_info(f"\n子查询检索合并后结果数: {len(merged)}")
+        return merged, retrieval_record
+
     def summarize_single_chunk(self, chunk_content: str) -> str:
         """
         兼容旧接口：保留该方法名，但内部改为“证据抽取”（仅返回可用于融合的短文本）。
@@ -610,7 +1189,7 @@ class RAGFlow:
             },
         ]
 
-        raw = self.deepseek.chat_completion(messages) or ""
+        raw = self.deepseek.chat_completion(messages, stage="evidence") or ""
         obj = self._safe_json_loads(raw)
         if obj is None:
             evidence = _truncate_for_fusion(content)
@@ -639,7 +1218,7 @@ class RAGFlow:
         ev_clean: List[str] = []
         for s in evidence_sentences[:3]:
             if isinstance(s, str) and s.strip():
-                ev_clean.append(_truncate_for_fusion(s.strip(), max_chars=400))
+                ev_clean.append(_truncate_for_fusion(s.strip(), max_tokens=_EVIDENCE_SENTENCE_MAX_TOKENS))
 
         kf_clean: List[str] = []
         for k in key_facts[:8]:
@@ -651,14 +1230,19 @@ class RAGFlow:
 
         return {"evidence_sentences": ev_clean, "key_facts": kf_clean, "relevance": relevance.strip(), "raw": raw.strip()}
 
-    def _rule_based_sufficiency(self, query: str, fused_info: str) -> tuple[bool, str]:
+    def _rule_based_sufficiency(
+        self,
+        query: str,
+        fused_info: str,
+        evidence_items: Optional[List[Dict[str, Any]]] = None,
+    ) -> tuple[bool, str]:
         """
         不依赖题型标签的规则优先 sufficiency 判定：
         - 若 evidence 已抽出 key_facts 或命中锚点+数值/等式，则直接判足够，避免 LLM Judge 误判触发改写。
         返回 (sufficient, reason)。
         """
         anchors = self._extract_anchors(query)
-        evidence_items = getattr(self, "_last_evidence_items", []) or []
+        evidence_items = evidence_items or []
 
         # 1) 只要抽取到了 key_facts（如 s=5），通常就足够尝试回答
         for it in evidence_items:
@@ -670,7 +1254,7 @@ class RAGFlow:
         text = (fused_info or "").strip()
         if text:
             has_anchor = any(a in text for a in anchors) if anchors else False
-            has_number_or_eq = bool(re.search(r"(\b\d+(\.\d+)?\b|=|×|x|帧|epoch|mAP|EAO|IoU)", text))
+            has_number_or_eq = bool(anchor_index.NUMBER_OR_EQ_RE.search(text))
             if has_anchor and has_number_or_eq:
                 return True, "rule:anchor_and_number"
 
@@ -683,21 +1267,63 @@ class RAGFlow:
             if not joined.strip():
                 continue
             has_anchor = any(a in joined for a in anchors) if anchors else False
-            has_number_or_eq = bool(re.search(r"(\b\d+(\.\d+)?\b|=|×|x|帧|epoch|mAP|EAO|IoU)", joined))
+            has_number_or_eq = bool(anchor_index.NUMBER_OR_EQ_RE.search(joined))
             if has_anchor and has_number_or_eq:
                 return True, "rule:evidence_anchor_and_number"
 
         return False, "rule:no_strong_signal"
 
-    def summarize_and_aggregate(self, query: str, results: List[Any]) -> str:
+    def _lookup_anchor_facts(
+        self,
+        query: str,
+        doc_id: Union[int, List[int], None] = None,
+        kb_id: Union[int, List[int], None] = None,
+        security_level: Union[int, List[int], None] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        用 query 锚点查询入库时构建的锚点/关键事实倒排索引（过滤条件与检索一致）。
+        返回 str(chunk_id) -> 命中记录；未启用或查询失败时返回空字典。
+        """
+        if not anchor_index.is_enabled():
+            return {}
+        anchors = self._extract_anchors(query)
+        if not anchors:
+            return {}
+        try:
+            with instrumentation.stage("anchor_lookup", anchors=len(anchors)):
+                hits = anchor_index.get_anchor_index().lookup(
+                    retrieval_service._get_collection_name(),
+                    anchors,
+                    doc_id=doc_id,
+                    kb_id=kb_id,
+                    security_level=security_level,
+                    limit=get_env_int("RAG_ANCHOR_MAX_HITS", 3),
+                )
+        except Exception as e:
+            logger.warning(f"锚点索引查询失败，跳过: {str(e)}")
+            return {}
+        if hits:
+            logger.info(f"锚点索引命中 {len(hits)} 个chunk: {[h['chunk_id'] for h in hits]}")
+        return {str(h["chunk_id"]): h for h in hits}
+
+    def summarize_and_aggregate(
+        self,
+        query: str,
+        results: List[Any],
+        ctx: Optional["RunContext"] = None,
+    ) -> str:
         """
         对检索结果进行summary/排序/过滤/聚合
         Args:
             query: 查询文本
             results: 检索结果列表
+            ctx: 本次运行的上下文；其证据缓存用于复用已抽取证据，并在上一轮融合结果上增量融合，
+                 本轮 evidence 写回 ctx.evidence_items 供 Judge 规则与 trace 使用
         Returns:
             聚合后的信息
         """
+        ctx = ctx if ctx is not None else RunContext()
+        evidence_store = ctx.evidence_store
         logger.info(f"开始对检索结果进行summary/排序/过滤/聚合，查询: {query}")
         _print_info("\n=== summary/排序/过滤/聚合 ===")
 
@@ -723,14 +1349,14 @@ class RAGFlow:
             _print_warning(f"排序失败: {str(e)}")
             sorted_results = results
 
-        # 2. 过滤（限制处理的chunk数量以提高性能，取前10个最相关的chunk）
+        # 2. 过滤（限制处理的chunk数量以提高性能，自适应选取至多10个最相关的chunk）
         #    在原始 score 基础上加入结构感知加权，让表格/引用chunk略微优先。
         scored_for_summary: List[Dict[str, Any]] = []
         for result in sorted_results:
             try:
                 base_score = getattr(result, "score", 0.0) or 0.0
                 content = getattr(result, "content", "") if hasattr(result, "content") else ""
-                struct_scores = self._analyze_chunk_structure(content)
+                struct_scores = self._analyze_chunk_structure(content, getattr(result, "metadata", None))
                 boost = (
                     0.3 * struct_scores.get("table_score", 0.0)
                     + 0.2 * struct_scores.get("citation_score", 0.0)
@@ -738,6 +1364,8 @@ class RAGFlow:
                 )
                 adjusted_score = float(base_score) + float(boost)
                 meta = self._extract_doc_info_from_result(result)
+                if ctx.title_boost_doc_ids and str(meta.get("doc_id")) in ctx.title_boost_doc_ids:
+                    adjusted_score += get_env_float("RAG_TITLE_FUZZY_BOOST", 0.2)
                 scored_for_summary.append(
                     {
                         "result": result,
@@ -753,7 +1381,57 @@ class RAGFlow:
                 logger.warning(f"为summary构造结构感知得分时出错: {str(e)}")
 
         scored_for_summary.sort(key=lambda x: x["adjusted_score"], reverse=True)
-        filtered_items = scored_for_summary[:10]  # 减少处理的数量，提高性能
+        # 减少处理的数量，提高性能；延迟预算可进一步收紧证据扇出
+        fanout = ctx.budget.evidence_fanout() if ctx.budget is not None else 10
+        if is_truthy_env("RAG_ADAPTIVE_FANOUT", True):
+            # 自适应扇出：按分数断层、最低相关性与文档覆盖决定实际抽取的 chunk 数
+            selected_indices, selection_stats = evidence_selector.select_evidence(
+                [it["adjusted_score"] for it in scored_for_summary],
+                [it["doc_id"] if it["doc_id"] is not None else ("chunk", it["chunk_id"]) for it in scored_for_summary],
+                max_k=fanout,
+            )
+            filtered_items = [scored_for_summary[i] for i in selected_indices]
+        else:
+            filtered_items = scored_for_summary[:fanout]
+            selection_stats = {"candidates": len(scored_for_summary), "max_k": fanout, "selected": len(filtered_items), "cut": "fixed"}
+        ctx.evidence_selection = selection_stats
+
+        # 锚点索引命中但不在本轮候选中的 chunk 直接补入（内容为索引中的事实句，分数取候选最高分）
+        if ctx.anchor_hits:
+            present = {str(it["chunk_id"]) for it in filtered_items}
+            top_score = max((float(it["base_score"]) for it in filtered_items), default=0.0)
+            for key, hit in ctx.anchor_hits.items():
+                if key in present:
+                    continue
+                filtered_items.append(
+                    {
+                        "result": None,
+                        "content": "\n".join(hit["sentences"]),
+                        "base_score": top_score,
+                        "adjusted_score": top_score,
+                        "struct_scores": {},
+                        "doc_id": hit.get("doc_id"),
+                        "doc_title": hit.get("doc_title"),
+                        "chunk_id": hit["chunk_id"],
+                    }
+                )
+            selection_stats["anchor_added"] = len(filtered_items) - len(present)
+
+            # 命中覆盖 query 全部锚点且规则判定已足够时，只用锚点 chunk 的事实，省去其余候选的 LLM 证据抽取
+            if is_truthy_env("RAG_ANCHOR_SHORT_CIRCUIT", True):
+                query_anchors = {a for a in self._extract_anchors(query) if anchor_index.is_anchor_token(a)}
+                strong_keys = {
+                    key for key, hit in ctx.anchor_hits.items() if query_anchors <= set(hit["matched_anchors"])
+                }
+                strong_items = [
+                    {"key_facts": ctx.anchor_hits[key]["key_facts"], "evidence_sentences": ctx.anchor_hits[key]["sentences"]}
+                    for key in strong_keys
+                ]
+                if strong_items and self._rule_based_sufficiency(query, "", strong_items)[0]:
+                    filtered_items = [it for it in filtered_items if str(it["chunk_id"]) in strong_keys]
+                    selection_stats["cut"] = "anchor_short_circuit"
+                    selection_stats["selected"] = len(filtered_items)
+                    logger.info(f"锚点索引事实已足够，跳过其余候选的证据抽取，保留 {len(filtered_items)} 个chunk")
         logger.info(f"过滤后结果数: {len(filtered_items)}")
         _print_info(f"过滤后结果数: {len(filtered_items)}")
 
@@ -766,7 +1444,7 @@ class RAGFlow:
             try:
                 result = item["result"]
                 score = float(item.get("base_score", getattr(result, "score", 0.0) or 0.0))
-                content = getattr(result, "content", "")
+                content = item.get("content") or getattr(result, "content", "")
                 chunk_id = item.get("chunk_id", getattr(result, "chunk_id", None))
                 doc_id = item.get("doc_id")
                 doc_title = item.get("doc_title")
@@ -792,96 +1470,134 @@ class RAGFlow:
             _print_warning("警告: 所有检索结果在预处理阶段即为空")
             return "检索结果处理后为空"
 
+        index_to_evidence: Dict[int, Dict[str, Any]] = {}
+        index_to_score: Dict[int, float] = {}
+        index_to_meta: Dict[int, Dict[str, Any]] = {}
+        index_to_struct_scores: Dict[int, Dict[str, float]] = {}
+
+        # 先命中本次运行的证据缓存：已抽取过的 chunk 不再调用 LLM；锚点索引命中的 chunk 直接用索引中的事实
+        pending_chunks: List[Dict[str, Any]] = []
+        reused_indices: set = set()
+        anchor_seeded = 0
+        for item in indexed_chunks:
+            idx = item["index"]
+            index_to_score[idx] = item["score"]
+            index_to_meta[idx] = {
+                "chunk_id": item.get("chunk_id"),
+                "doc_id": item.get("doc_id"),
+                "doc_title": item.get("doc_title"),
+            }
+            index_to_struct_scores[idx] = item.get("structure_scores", {})
+            cached = evidence_store.get(item.get("chunk_id"), query)
+            anchor_hit = ctx.anchor_hits.get(str(item.get("chunk_id"))) if cached is None else None
+            if cached is not None:
+                index_to_evidence[idx] = cached
+                reused_indices.add(idx)
+                logger.info(f"第{idx + 1}个chunk复用已抽取证据，跳过LLM调用")
+            elif anchor_hit is not None:
+                index_to_evidence[idx] = {
+                    "evidence_sentences": list(anchor_hit["sentences"]),
+                    "key_facts": list(anchor_hit["key_facts"]),
+                    "relevance": "anchor_index",
+                    "raw": "",
+                }
+                anchor_seeded += 1
+                logger.info(f"第{idx + 1}个chunk命中锚点索引，使用入库时抽取的事实，跳过LLM调用")
+            else:
+                pending_chunks.append(item)
+
         # 计算合适的并发线程数，避免过多并发压垮外部API
-        max_workers = min(len(indexed_chunks), _SUMMARY_MAX_WORKERS)
+        max_workers = max(1, min(len(pending_chunks), _SUMMARY_MAX_WORKERS))
         logger.info(
-            f"开始并发summary处理，共 {len(indexed_chunks)} 个chunk，使用线程数: {max_workers}"
+            f"开始并发summary处理，共 {len(indexed_chunks)} 个chunk（复用 {len(reused_indices)} 个），"
+            f"使用线程数: {max_workers}"
         )
         _print_info(
-            f"\n开始并发summary处理，共 {len(indexed_chunks)} 个chunk，使用线程数: {max_workers}"
+            f"\n开始并发summary处理，共 {len(indexed_chunks)} 个chunk（复用 {len(reused_indices)} 个），"
+            f"使用线程数: {max_workers}"
         )
 
-        index_to_evidence: Dict[int, Dict[str, Any]] = {}
-        index_to_score: Dict[int, float] = {}
-        index_to_meta: Dict[int, Dict[str, Any]] = {}
-        index_to_struct_scores: Dict[int, Dict[str, float]] = {}
-
         # 使用线程池并发调用 extract_evidence_single_chunk
-        try:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_index: Dict[concurrent.futures.Future, int] = {}
-
-                for item in indexed_chunks:
-                    idx = item["index"]
-                    score = item["score"]
-                    content = item["content"]
-                    index_to_score[idx] = score
-                    index_to_meta[idx] = {
-                        "chunk_id": item.get("chunk_id"),
-                        "doc_id": item.get("doc_id"),
-                        "doc_title": item.get("doc_title"),
-                    }
-                    index_to_struct_scores[idx] = item.get("structure_scores", {})
+        with instrumentation.stage(
+            "evidence_extraction", chunks=len(indexed_chunks), reused=len(reused_indices), anchor_seeded=anchor_seeded
+        ):
+            try:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    future_to_index: Dict[concurrent.futures.Future, int] = {}
 
-                    logger.info(f"提交第{idx + 1}个chunk进行证据抽取，分数: {score:.3f}")
-                    _print_info(f"提交第{idx + 1}个chunk进行证据抽取，分数: {score:.3f}...")
+                    for item in pending_chunks:
+                        idx = item["index"]
+                        score = item["score"]
+                        content = item["content"]
 
-                    future = executor.submit(self.extract_evidence_single_chunk, query, content)
-                    future_to_index[future] = idx
+                        logger.info(f"提交第{idx + 1}个chunk进行证据抽取，分数: {score:.3f}")
+                        _print_info(f"提交第{idx + 1}个chunk进行证据抽取，分数: {score:.3f}...")
 
-                for future in concurrent.futures.as_completed(future_to_index):
-                    idx = future_to_index[future]
-                    score = index_to_score.get(idx, 0.0)
-                    try:
-                        ev_obj = future.result()
-                        if isinstance(ev_obj, dict) and ev_obj.get("evidence_sentences"):
-                            index_to_evidence[idx] = ev_obj
-                        else:
-                            original_content = next((it["content"] for it in indexed_chunks if it["index"] == idx), "")
+                        future = instrumentation.submit_with_context(
+                            executor, self.extract_evidence_single_chunk, query, content
+                        )
+                        future_to_index[future] = idx
+
+                    for future in concurrent.futures.as_completed(future_to_index):
+                        idx = future_to_index[future]
+                        score = index_to_score.get(idx, 0.0)
+                        try:
+                            ev_obj = future.result()
+                            if isinstance(ev_obj, dict) and ev_obj.get("evidence_sentences"):
+                                index_to_evidence[idx] = ev_obj
+                                # 仅缓存 LLM 实际返回的抽取结果；失败回退的原文留给后续轮次重试
+                                if ev_obj.get("raw"):
+                                    evidence_store.put(index_to_meta.get(idx, {}).get("chunk_id"), query, ev_obj)
+                            else:
+                                original_content = next((it["content"] for it in indexed_chunks if it["index"] == idx), "")
+                                index_to_evidence[idx] = {
+                                    "evidence_sentences": [_truncate_for_fusion(original_content)],
+                                    "key_facts": [],
+                                    "relevance": "",
+                                    "raw": "",
+                                }
+                                logger.warning(f"第{idx + 1}个chunk证据抽取为空，使用原始内容回退")
+                        except Exception as e:
+                            # 并发层异常，记录日志并回退为原文（截断后进融合）
+                            original_content = next(
+                                (item["content"] for item in indexed_chunks if item["index"] == idx),
+                                "",
+                            )
                             index_to_evidence[idx] = {
                                 "evidence_sentences": [_truncate_for_fusion(original_content)],
                                 "key_facts": [],
                                 "relevance": "",
                                 "raw": "",
                             }
-                            logger.warning(f"第{idx + 1}个chunk证据抽取为空，使用原始内容回退")
-                    except Exception as e:
-                        # 并发层异常，记录日志并回退为原文（截断后进融合）
-                        original_content = next(
-                            (item["content"] for item in indexed_chunks if item["index"] == idx),
-                            "",
-                        )
-                        index_to_evidence[idx] = {
-                            "evidence_sentences": [_truncate_for_fusion(original_content)],
-                            "key_facts": [],
-                            "relevance": "",
-                            "raw": "",
-                        }
-                        logger.warning(
-                            f"第{idx + 1}个chunk并发证据抽取任务失败，使用原始内容回退: {str(e)}"
-                        )
-        except Exception as e:
-            # 线程池整体异常，记录日志并全部回退为原文（截断后进融合）
-            logger.error(f"并发证据抽取整体失败，将全部使用原始内容回退: {str(e)}")
-            _print_warning("并发证据抽取整体失败，将使用原始内容回退")
-            for item in indexed_chunks:
-                idx = item["index"]
-                index_to_evidence[idx] = {
-                    "evidence_sentences": [_truncate_for_fusion(item.get("content", ""))],
-                    "key_facts": [],
-                    "relevance": "",
-                    "raw": "",
-                }
-                index_to_score[idx] = float(item.get("score", 0.0))
-                index_to_meta[idx] = {
-                    "chunk_id": item.get("chunk_id"),
-                    "doc_id": item.get("doc_id"),
-                    "doc_title": item.get("doc_title"),
-                }
-                index_to_struct_scores[idx] = item.get("structure_scores", {})
+                            logger.warning(
+                                f"第{idx + 1}个chunk并发证据抽取任务失败，使用原始内容回退: {str(e)}"
+                            )
+            except Exception as e:
+                # 线程池整体异常，记录日志并全部回退为原文（截断后进融合）
+                logger.error(f"并发证据抽取整体失败，将全部使用原始内容回退: {str(e)}")
+                _print_warning("并发证据抽取整体失败，将使用原始内容回退")
+                for item in pending_chunks:
+                    idx = item["index"]
+                    index_to_evidence[idx] = {
+                        "evidence_sentences": [_truncate_for_fusion(item.get("content", ""))],
+                        "key_facts": [],
+                        "relevance": "",
+                        "raw": "",
+                    }
+                    index_to_score[idx] = float(item.get("score", 0.0))
+                    index_to_meta[idx] = {
+                        "chunk_id": item.get("chunk_id"),
+                        "doc_id": item.get("doc_id"),
+                        "doc_title": item.get("doc_title"),
+                    }
+                    index_to_struct_scores[idx] = item.get("structure_scores", {})
 
         # 按原始顺序构造 chunk_evidences，保持算法行为一致
         evidence_items_for_judge: List[Dict[str, Any]] = []
+        # 送入融合 prompt 的证据块（按分数装入 token 预算）；增量融合时只用本轮新增（上一轮融合中未出现过）的部分
+        evidence_blocks: List[Dict[str, Any]] = []
+        new_evidence_blocks: List[Dict[str, Any]] = []
+        current_chunk_ids: set = set()
         for i in range(len(filtered_items)):
             if i in index_to_evidence and i in index_to_score:
                 score = index_to_score.get(i, 0.0)
@@ -947,32 +1663,77 @@ class RAGFlow:
                     }
                 )
 
-                chunk_evidences.append(
+                block_header = (
                     f"[结果{i + 1} 相关性分数: {score:.3f}]\n"
                     f"doc_title: {doc_title}\n"
                     f"chunk_id: {chunk_id}\n"
                     f"tags: {tags_str}\n"
                     f"key_facts: {key_facts_str}\n"
-                    f"evidence:\n{ev_text}\n"
+                    f"evidence:\n"
                 )
-
-        # 存储上一轮 evidence，供 Judge 规则与 trace 使用
-        self._last_evidence_items = evidence_items_for_judge
+                evidence_block = f"{block_header}{ev_text}\n"
+                block = {"score": score, "header": block_header, "body": ev_text}
+                chunk_evidences.append(evidence_block)
+                evidence_blocks.append(block)
+                current_chunk_ids.add(chunk_id)
+                if chunk_id is None or chunk_id not in evidence_store.fused_chunk_ids:
+                    new_evidence_blocks.append(block)
+
+        # 存储本轮 evidence，供 Judge 规则与 trace 使用
+        ctx.evidence_items = evidence_items_for_judge
+
+        previous_fused = evidence_store.fused_info
+        evidence_store.last_round_stats = {
+            "reused": len(reused_indices),
+            "anchor_seeded": anchor_seeded,
+            "extracted": len(pending_chunks),
+            "new_evidence": len(new_evidence_blocks),
+            "incremental_fusion": bool(previous_fused),
+        }
 
         if not chunk_evidences:
             logger.warning("所有检索结果处理后为空")
             _print_warning("警告: 所有检索结果处理后为空")
             return "检索结果处理后为空"
 
-        # 4. 整合所有chunk的summary
-        combined_summaries = "\n".join(chunk_evidences)
-        logger.info(f"整合后的证据长度: {len(combined_summaries)} 字符")
-        _print_info(f"\n整合后的证据长度: {len(combined_summaries)} 字符")
+        # 增量融合：上一轮已有融合结果且本轮没有新增证据时，直接复用，省去一次 LLM 调用
+        if previous_fused and not new_evidence_blocks:
+            logger.info("本轮无新增证据，复用上一轮融合结果")
+            _print_info("\n本轮无新增证据，复用上一轮融合结果")
+            return previous_fused
+
+        # 4. 整合所有chunk的summary（增量融合时只送入新增证据）
+        # 按分数装入融合 token 预算并去除重复句子；已有整合信息最多占用一半预算
+        fusion_budget = context_packer.FUSION_TOKEN_BUDGET
+        if previous_fused:
+            previous_fused, _ = context_packer.fit_text(previous_fused, fusion_budget // 2)
+            fusion_budget -= context_packer.count_tokens(previous_fused)
+        combined_summaries, pack_stats = context_packer.pack_evidence(
+            new_evidence_blocks if previous_fused else evidence_blocks,
+            fusion_budget,
+        )
+        logger.info(f"整合后的证据长度: {len(combined_summaries)} 字符，打包统计: {pack_stats}")
+        _print_info(f"\n整合后的证据长度: {len(combined_summaries)} 字符（约 {pack_stats['tokens']} tokens）")
+
+        # 延迟预算：证据很少或时间不足时跳过 LLM 融合，直接把打包后的证据交给生成
+        if ctx.budget is not None and not ctx.budget.allow_fusion(pack_stats["packed_blocks"]):
+            ctx.budget.record("skip_fusion", ctx.recorder.iteration if ctx.recorder else None, evidence=pack_stats["packed_blocks"])
+            logger.info("延迟预算：跳过LLM融合，直接使用打包后的证据")
+            return f"{previous_fused}\n{combined_summaries}" if previous_fused else combined_summaries
 
         # 5. 使用DeepSeek进行最终信息融合
         logger.info("使用DeepSeek API进行最终信息融合...")
         _print_info("\n使用DeepSeek API进行最终信息融合...")
 
+        if previous_fused:
+            user_content = (
+                f"学术查询: {query}\n\n"
+                f"已有整合信息（来自前几轮检索）：\n{previous_fused}\n\n"
+                f"以下是本轮新增的论文内容证据与关键事实，请将其与已有整合信息合并，整合出完整回答：\n"
+                f"{combined_summaries}\n\n整合后的回答："
+            )
+        else:
+            user_content = f"学术查询: {query}\n\n以下是各段论文内容的证据与关键事实，请基于这些信息整合出完整回答：\n{combined_summaries}\n\n整合后的回答："
         messages = [
             {
                 "role": "system",
@@ -980,11 +1741,14 @@ class RAGFlow:
             },
             {
                 "role": "user",
-                "content": f"学术查询: {query}\n\n以下是各段论文内容的证据与关键事实，请基于这些信息整合出完整回答：\n{combined_summaries}\n\n整合后的回答："
+                "content": user_content
             }
         ]
-        fused_info = self.deepseek.chat_completion(messages)
+        with instrumentation.stage("fusion", incremental=bool(previous_fused), packing=pack_stats):
+            fused_info = self.deepseek.chat_completion(messages, stage="fusion")
         if fused_info and fused_info.strip() and fused_info.strip() != "未找到相关信息":
+            evidence_store.fused_info = fused_info
+            evidence_store.fused_chunk_ids |= {cid for cid in current_chunk_ids if cid is not None}
             logger.info(f"信息融合成功，融合后信息长度: {len(fused_info)} 字符")
             _print_info("信息融合成功:")
             _print_info(f"融合后信息长度: {len(fused_info)} 字符")
@@ -1005,12 +1769,13 @@ class RAGFlow:
             _print_info(f"备用方案信息长度: {len(backup_info)} 字符")
             return backup_info
 
-    def judge_information_sufficiency(self, query: str, fused_info: str) -> bool:
+    def judge_information_sufficiency(self, query: str, fused_info: str, ctx: Optional["RunContext"] = None) -> bool:
         """
         判断信息是否足够回答查询
         Args:
             query: 查询文本
             fused_info: 融合后的信息
+            ctx: 本次运行的上下文（读取本轮 evidence，写入 Judge 原始输出与规则判定原因）
         Returns:
             True: 信息足够；False: 信息不足
         """
@@ -1020,20 +1785,14 @@ class RAGFlow:
         _print_info(f"可用信息长度: {len(fused_info)} 字符")
 
         # 默认清空本轮 Judge 原始输出记录
-        try:
-            self._last_judge_raw = None  # type: ignore[attr-defined]
-        except Exception:
-            # 如果属性设置失败，不影响主流程
-            pass
+        ctx = ctx if ctx is not None else RunContext()
+        ctx.judge_raw = None
 
         # 只对完全空的信息进行过滤，允许短答案
         if not fused_info or fused_info.strip() == "":
             logger.warning("判断结果: 信息为空，不足")
             _print_warning("判断结果: 信息为空，不足")
-            try:
-                self._last_judge_raw = "信息为空，被直接判定为不足"  # type: ignore[attr-defined]
-            except Exception:
-                pass
+            ctx.judge_raw = "信息为空，被直接判定为不足"
             return False
 
         # 特殊情况：如果信息非常短但可能是有效答案
@@ -1044,22 +1803,22 @@ class RAGFlow:
 
         # 规则优先判定：减少 LLM Judge 误判触发改写
         try:
-            sufficient_rule, rule_reason = self._rule_based_sufficiency(query, fused_info)
-            try:
-                self._last_judge_rule = rule_reason  # type: ignore[attr-defined]
-            except Exception:
-                pass
+            sufficient_rule, rule_reason = self._rule_based_sufficiency(query, fused_info, ctx.evidence_items)
+            ctx.judge_rule = rule_reason
             if sufficient_rule:
                 logger.info(f"Judge规则判定为足够: {rule_reason}")
                 _print_info(f"Judge规则判定为足够: {rule_reason}")
-                try:
-                    self._last_judge_raw = f"规则判定: 足够 ({rule_reason})"  # type: ignore[attr-defined]
-                except Exception:
-                    pass
+                ctx.judge_raw = f"规则判定: 足够 ({rule_reason})"
                 return True
         except Exception as e:
             logger.warning(f"Judge规则判定异常，将回退到LLM Judge: {str(e)}")
 
+        # 已无法继续迭代时（轮数/改写次数/延迟预算用尽），无论 LLM Judge 结论如何都会基于当前信息生成，跳过该调用
+        if not ctx.can_continue:
+            logger.info("无法继续迭代，跳过LLM Judge，直接基于当前信息生成")
+            ctx.judge_raw = "跳过LLM Judge: 无法继续迭代，基于当前信息生成"
+            return True
+
         # 使用LLM进行智能语义判断（兜底）
         try:
             messages = [
@@ -1073,15 +1832,12 @@ class RAGFlow:
                 }
             ]
 
-            judgment = self.deepseek.chat_completion(messages)
+            judgment = self.deepseek.chat_completion(messages, stage="judge")
 
             if judgment:
                 # 保留原始输出，便于后续在trace中展示
                 raw_judgment = str(judgment).strip()
-                try:
-                    self._last_judge_raw = raw_judgment  # type: ignore[attr-defined]
-                except Exception:
-                    pass
+                ctx.judge_raw = raw_judgment
 
                 # 清理和标准化返回结果用于逻辑分支
                 normalized = raw_judgment.strip().lower()
@@ -1101,34 +1857,43 @@ class RAGFlow:
             else:
                 logger.warning("LLM判断失败，默认认为信息足够，尝试生成响应")
                 _print_warning("LLM判断失败，默认认为信息足够，尝试生成响应")
-                try:
-                    self._last_judge_raw = "LLM调用失败，按默认策略判定为足够"  # type: ignore[attr-defined]
-                except Exception:
-                    pass
+                ctx.judge_raw = "LLM调用失败，按默认策略判定为足够"
                 # API调用失败时，默认认为信息足够，不中断流程
                 return True
         except Exception as e:
             logger.error(f"判断环节出错: {str(e)}")
             _print_warning(f"判断环节出错: {str(e)}")
             # 出错时默认认为信息足够，不中断流程
-            try:
-                self._last_judge_raw = f"Judge环节异常: {str(e)}"  # type: ignore[attr-defined]
-            except Exception:
-                pass
+            ctx.judge_raw = f"Judge环节异常: {str(e)}"
             return True
 
-    def generate_response(self, query: str, fused_info: str) -> str:
+    def generate_response(
+        self,
+        query: str,
+        fused_info: str,
+        context_tokens: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
         """
         生成最终响应
         Args:
             query: 查询文本
             fused_info: 融合后的信息
+            context_tokens: 上下文 token 上限，缺省为 RAG_GENERATION_TOKEN_BUDGET
+            max_tokens: 输出 token 上限，缺省不限制
         Returns:
             最终响应
         """
         logger.info(f"开始生成最终响应，查询: {query}")
         _print_info("\n=== 生成响应 ===")
 
+        # 生成 prompt 的上下文按 token 预算去重、截断
+        fused_info, pack_stats = context_packer.fit_text(
+            fused_info, context_tokens or context_packer.GENERATION_TOKEN_BUDGET
+        )
+        if pack_stats["truncated"] or pack_stats["duplicate_sentences"]:
+            logger.info(f"生成上下文打包统计: {pack_stats}")
+
         system_prompt = """
         你是一位顶级知识库引擎，擅长将复杂知识以清晰、严谨、结构化的方式呈现。
             任务：整合、提炼、结构化知识库信息。
@@ -1150,7 +1915,7 @@ class RAGFlow:
             }
         ]
 
-        response = self.deepseek.chat_completion(messages)
+        response = self.deepseek.chat_completion(messages, stage="generation", max_tokens=max_tokens)
 
         if response:
             logger.info(f"最终响应生成成功，响应长度: {len(response)} 字符")
@@ -1160,7 +1925,25 @@ class RAGFlow:
         else:
             logger.error("响应生成失败")
             _print_warning("响应生成失败")
-            return "抱歉，无法生成响应。"
+            return _GENERATION_FAILED_RESPONSE
+
+    def _best_effort_response(self, query: str, fused_info: str, ctx: "RunContext") -> str:
+        """
+        延迟预算用尽时的回答：本轮融合成功时直接返回融合结果；融合被跳过或失败时 fused_info 是打包后的
+        原始证据，不能直接作为回答，改为在截断后的证据上做一次限制输出长度的生成，生成失败时退回最近一次融合结果。
+        """
+        last_fused = ctx.evidence_store.fused_info
+        if last_fused and fused_info == last_fused:
+            return fused_info
+        response = self.generate_response(
+            query,
+            fused_info,
+            context_tokens=_BEST_EFFORT_CONTEXT_TOKENS,
+            max_tokens=_BEST_EFFORT_MAX_TOKENS,
+        )
+        if response == _GENERATION_FAILED_RESPONSE and last_fused:
+            return last_fused
+        return response
 
     def run(
         self,
@@ -1170,6 +1953,8 @@ class RAGFlow:
         doc_id: Union[int, List[int], None] = None,
         kb_id: Union[int, List[int], None] = None,
         security_level: Union[int, List[int], None] = None,
+        deadline_ms: Optional[float] = None,
+        latency_tier: Optional[str] = None,
     ):
         """
         执行完整的RAG流程
@@ -1180,8 +1965,43 @@ class RAGFlow:
             kb_id: 知识库分类
             security_level: 访问级别
             return_trace: 是否返回本次流程的完整trace结构
+            deadline_ms: 本次运行的截止时间（毫秒），据此裁剪迭代轮数、证据扇出、融合与 Judge
+            latency_tier: 延迟档位 interactive/standard/thorough，缺省时按 deadline_ms 或 RAG_DEFAULT_LATENCY_TIER
         """
+        budget = latency_budget.LatencyBudget(deadline_ms=deadline_ms, latency_tier=latency_tier)
+        with latency_budget.activate(budget):
+            return self._run(
+                original_query,
+                budget,
+                sample_id=sample_id,
+                return_trace=return_trace,
+                doc_id=doc_id,
+                kb_id=kb_id,
+                security_level=security_level,
+            )
+
+    def _run(
+        self,
+        original_query: str,
+        budget: latency_budget.LatencyBudget,
+        sample_id: Optional[str] = None,
+        return_trace: bool = False,
+        doc_id: Union[int, List[int], None] = None,
+        kb_id: Union[int, List[int], None] = None,
+        security_level: Union[int, List[int], None] = None,
+    ):
+        """run 的主体，在已启用的延迟预算下执行。"""
         start_time = datetime.now()
+        start_perf = time.perf_counter()
+        # 本次运行的全部可变状态放在 ctx 上，RAGFlow 实例本身可被并发请求共享
+        ctx = RunContext(
+            evidence_store=EvidenceStore(
+                reuse_across_queries=is_truthy_env("RAG_EVIDENCE_REUSE_ACROSS_QUERIES", True)
+            ),
+            recorder=instrumentation.start_recording(),
+            budget=budget,
+        )
+        recorder = ctx.recorder
         logger.info(f"RAG流程启动，原始查询: {original_query}")
         _print_info("\n" + "=" * 60)
         _print_info("RAG流程启动")
@@ -1203,9 +2023,55 @@ class RAGFlow:
         rewrite_rounds = 0
         rewrite_history: List[Dict[str, Any]] = []
 
+        # 推测式改写状态：首轮启动，多轮时取用，首轮足够时丢弃
+        speculation: Dict[str, Any] = {
+            "enabled": self.speculative_rewrite,
+            "launched": False,
+            "used": False,
+            "prefetch_used": False,
+            "discarded": False,
+        }
+        spec_cancel = threading.Event()
+        spec_future: Optional[concurrent.futures.Future] = None
+        prefetched: Optional[Tuple[str, Any, Dict[str, Any]]] = None
+
+        # 标题解析：问题中《》/引号提及的论文标题映射为 doc_id 过滤（调用方已指定 doc_id 时不覆盖）；
+        # 只有精确 / 归一化 / 前缀匹配作为过滤，模糊匹配只给对应文档的证据加分，误匹配时不会把正确文档排除在外
+        if doc_id is None:
+            try:
+                title_resolution = retrieval_service.resolve_query_titles(original_query)
+            except Exception as e:
+                logger.warning(f"标题解析失败，按全库检索: {str(e)}")
+                title_resolution = {"mentions": [], "doc_ids": [], "fuzzy_doc_ids": []}
+            if title_resolution["mentions"]:
+                trace["title_resolution"] = title_resolution
+            if title_resolution["doc_ids"]:
+                doc_id = list(title_resolution["doc_ids"])
+                logger.info(f"问题中的论文标题解析为 doc_id 过滤: {doc_id}")
+                _print_info(f"论文标题解析为 doc_id 过滤: {doc_id}")
+            ctx.title_boost_doc_ids = {str(x) for x in title_resolution.get("fuzzy_doc_ids") or []}
+
+        # 子查询拆分：多论文 / 多实体问题在首轮并发检索各子查询，按配额合并
+        subqueries, decomposition = self.decompose_query(original_query)
+        trace["decomposition"] = decomposition
+        title_scoped = "title_resolution" in trace and doc_id is not None and bool(trace["title_resolution"]["doc_ids"])
+
+        # 锚点/关键事实索引：按原问题锚点取回带事实句的 chunk（改写会保留锚点，整个运行只查一次）
+        ctx.anchor_hits = self._lookup_anchor_facts(
+            original_query, doc_id=doc_id, kb_id=kb_id, security_level=security_level
+        )
+        trace["anchor_index"] = {
+            "hits": [
+                {"chunk_id": h["chunk_id"], "doc_id": h.get("doc_id"), "matched_anchors": h["matched_anchors"]}
+                for h in ctx.anchor_hits.values()
+            ]
+        }
+
         # 实现真正的多轮迭代，支持最多 max_iterations 轮
         while iteration < self.max_iterations:
             iteration += 1
+            recorder.iteration = iteration
+            budget.begin_iteration()
             logger.info(f"开始第 {iteration} 轮迭代，当前查询: {current_query}")
             _print_info(f"\n--- 第 {iteration} 轮迭代 ---")
 
@@ -1217,16 +2083,46 @@ class RAGFlow:
                 "judge_sufficient": None,
             }
 
-            # 1. 检索文档（第一轮使用原始 query，后续轮次可能使用改写后的 query）
-            results, retrieval_record = self.retrieve_documents(current_query, collect_trace=True, doc_id=doc_id, kb_id=kb_id, security_level=security_level)
+            # 1. 检索文档（第一轮使用原始 query，后续轮次可能使用改写后的 query；命中推测预取时直接复用）
+            if prefetched is not None and prefetched[0] == current_query:
+                results, retrieval_record = prefetched[1], prefetched[2]
+                retrieval_record["prefetched"] = True
+                speculation["prefetch_used"] = True
+                logger.info("复用推测式预取的检索结果")
+            elif iteration == 1 and len(subqueries) >= 2:
+                with instrumentation.stage("retrieval", subqueries=len(subqueries)):
+                    results, retrieval_record = self.retrieve_subqueries(
+                        subqueries,
+                        doc_id=doc_id,
+                        kb_id=kb_id,
+                        security_level=security_level,
+                        title_scoped=title_scoped,
+                    )
+            else:
+                with instrumentation.stage("retrieval"):
+                    results, retrieval_record = self.retrieve_documents(current_query, collect_trace=True, doc_id=doc_id, kb_id=kb_id, security_level=security_level)
+            prefetched = None
             iteration_record["retrieval"] = retrieval_record
 
+            # 首轮：检索完成后按首轮结果启动推测式改写，与证据抽取 / Judge 并发（档位只允许单轮时不启动）
+            if iteration == 1 and budget.policy["max_iterations"] > 1:
+                spec_future = self._start_speculative_rewrite(
+                    original_query,
+                    current_query,
+                    results,
+                    spec_cancel,
+                    doc_id=doc_id,
+                    kb_id=kb_id,
+                    security_level=security_level,
+                )
+                speculation["launched"] = spec_future is not None
+
             if not results:
                 logger.warning("未检索到任何文档")
                 _print_warning("\n未检索到任何文档，可能的原因：")
                 _print_warning("1. 可能集合中没有数据或连接失败")
 
-                if rewrite_rounds < self.max_rewrite_rounds:
+                if rewrite_rounds < self.max_rewrite_rounds and budget.can_iterate(iteration):
                     # 尝试基于当前查询和上下文进行适度改写
                     rewrite_before = current_query
                     context = (
@@ -1234,13 +2130,20 @@ class RAGFlow:
                         f"检索结果: 未找到任何相关文档，请在不改变问题核心语义的前提下，"
                         f"尝试从不同表述方式、补充关键信息等角度改写查询，以提高检索召回。"
                     )
-                    new_query = self.understand_and_rewrite_query(original_query, context)
+                    with instrumentation.stage("rewrite") as rewrite_info:
+                        new_query, prefetched = self._take_speculative_rewrite(spec_future, speculation)
+                        speculative = new_query is not None
+                        spec_future = None
+                        if new_query is None:
+                            new_query = self.understand_and_rewrite_query(original_query, context)
+                        rewrite_info["speculative"] = speculative
                     rewrite_rounds += 1
                     rewrite_history.append(
                         {
                             "round": rewrite_rounds,
                             "before": rewrite_before,
                             "after": new_query,
+                            "speculative": speculative,
                         }
                     )
                     current_query = new_query
@@ -1261,7 +2164,10 @@ class RAGFlow:
                     break
 
             # 2. summary/排序/过滤/聚合
-            fused_info = self.summarize_and_aggregate(current_query, results)
+            with instrumentation.stage("summarize"):
+                fused_info = self.summarize_and_aggregate(current_query, results, ctx=ctx)
+            iteration_record["evidence_reuse"] = dict(ctx.evidence_store.last_round_stats)
+            iteration_record["evidence_selection"] = dict(ctx.evidence_selection)
             iteration_record["summary_preview"] = {
                 "length": len(fused_info),
                 "preview": fused_info[:200],
@@ -1283,24 +2189,42 @@ class RAGFlow:
                             else ""
                         ),
                     }
-                    for it in (getattr(self, "_last_evidence_items", []) or [])[:10]
+                    for it in ctx.evidence_items[:10]
                 ]
             except Exception:
                 iteration_record["evidence"] = None
 
+            # 延迟预算已用尽：不再判定，基于当前已有的最佳信息尽力作答
+            if budget.expired():
+                budget.degraded = True
+                budget.record("return_best_effort", iteration)
+                logger.warning("延迟预算已用尽，基于当前已有的最佳信息尽力作答")
+                _print_warning("延迟预算已用尽，基于当前已有的最佳信息尽力作答")
+                trace["iterations"].append(iteration_record)
+                with instrumentation.stage("generation", best_effort=True):
+                    final_response = self._best_effort_response(current_query, fused_info, ctx)
+                break
+
+            # 本轮之后能否继续迭代；不能时 Judge 跳过 LLM 调用
+            within_limits = rewrite_rounds < self.max_rewrite_rounds and iteration < self.max_iterations
+            ctx.can_continue = within_limits and budget.can_iterate(iteration)
+            if within_limits and not ctx.can_continue:
+                budget.record("stop_iterations", iteration)
+
             # 3. Judge环节 - 使用智能语义判断
             logger.info("开始Judge环节")
             _print_info("\nJudge环节：")
-            sufficient = self.judge_information_sufficiency(current_query, fused_info)
+            with instrumentation.stage("judge"):
+                sufficient = self.judge_information_sufficiency(current_query, fused_info, ctx=ctx)
             iteration_record["judge_sufficient"] = sufficient
             # 记录Judge原始输出文本（如果有）
             try:
-                iteration_record["judge_raw"] = getattr(self, "_last_judge_raw", None)
+                iteration_record["judge_raw"] = ctx.judge_raw
             except Exception:
                 iteration_record["judge_raw"] = None
             # 记录Judge规则判定原因（如果有）
             try:
-                iteration_record["judge_rule"] = getattr(self, "_last_judge_rule", None)
+                iteration_record["judge_rule"] = ctx.judge_rule
             except Exception:
                 iteration_record["judge_rule"] = None
 
@@ -1310,15 +2234,18 @@ class RAGFlow:
             if sufficient:
                 logger.info("信息足够，生成最终响应")
                 _print_info("信息足够，生成最终响应")
+                self._discard_speculation(spec_future, spec_cancel, speculation)
+                spec_future = None
                 # 4. 生成响应
-                final_response = self.generate_response(current_query, fused_info)
+                with instrumentation.stage("generation"):
+                    final_response = self.generate_response(current_query, fused_info)
                 break  # 信息足够，退出循环
             else:
                 # 信息不足，准备下一轮迭代
                 logger.info(f"第 {iteration} 轮信息不足")
                 _print_warning(f"第 {iteration} 轮信息不足")
 
-                if rewrite_rounds < self.max_rewrite_rounds and iteration < self.max_iterations:
+                if ctx.can_continue:
                     # 更新上下文，包含当前轮的信息，并尝试新的改写
                     rewrite_before = current_query
                     context = (
@@ -1327,13 +2254,20 @@ class RAGFlow:
                         f"当前信息不足以完全回答问题，请在不改变问题核心含义的前提下，"
                         f"适度调整或扩展查询表达，以获取更相关的文献片段。"
                     )
-                    new_query = self.understand_and_rewrite_query(original_query, context)
+                    with instrumentation.stage("rewrite") as rewrite_info:
+                        new_query, prefetched = self._take_speculative_rewrite(spec_future, speculation)
+                        speculative = new_query is not None
+                        spec_future = None
+                        if new_query is None:
+                            new_query = self.understand_and_rewrite_query(original_query, context)
+                        rewrite_info["speculative"] = speculative
                     rewrite_rounds += 1
                     rewrite_history.append(
                         {
                             "round": rewrite_rounds,
                             "before": rewrite_before,
                             "after": new_query,
+                            "speculative": speculative,
                         }
                     )
                     current_query = new_query
@@ -1349,18 +2283,28 @@ class RAGFlow:
                     # 达到最大改写轮数或最大迭代次数，使用当前信息生成尽力回答
                     logger.info("已达到最大迭代次数或查询改写次数，基于当前信息生成最终响应")
                     _print_warning("已达到最大迭代次数或查询改写次数，基于当前信息生成最终响应")
-                    final_response = self.generate_response(current_query, fused_info)
+                    with instrumentation.stage("generation"):
+                        final_response = self.generate_response(current_query, fused_info)
                     break
 
+        # 其余退出路径（如达到最大轮数）同样丢弃未取用的推测任务
+        self._discard_speculation(spec_future, spec_cancel, speculation)
+
         # 确保无论如何都有最终响应
         if not final_response:
             final_response = "抱歉，经过多轮检索，仍无法获取足够的信息来回答您的查询。"
 
         end_time = datetime.now()
+        elapsed_seconds = time.perf_counter() - start_perf
+        instrumentation.metrics.observe("stage.run.ms", elapsed_seconds * 1000.0)
         trace["end_time"] = end_time.isoformat()
-        trace["elapsed_seconds"] = (end_time - start_time).total_seconds()
+        trace["elapsed_seconds"] = elapsed_seconds
+        # 各阶段与每次 LLM 调用的耗时/token 明细（单调时钟）
+        trace["timings"] = recorder.to_dict()
         trace["rewrite_rounds"] = rewrite_rounds
         trace["rewrite_history"] = rewrite_history
+        trace["speculation"] = speculation
+        trace["budget"] = budget.to_dict()
         trace["final_response_preview"] = final_response[:200] if isinstance(final_response, str) else None
         trace["final_query"] = current_query
         trace["status"] = "success"
@@ -1377,6 +2321,28 @@ class RAGFlow:
             return final_response, trace
         return final_response
 
+    def warm_up(self) -> None:
+        """预加载查询向量模型与分词器，避免首个请求承担加载耗时；失败不影响服务启动。"""
+        try:
+            retrieval_service.warm_up()
+            context_packer.get_tokenizer()
+        except Exception as e:
+            logger.warning(f"RAG引擎预热失败: {str(e)}")
+
+
+_engine_lock = threading.Lock()
+_engine: Optional[RAGFlow] = None
+
+
+def get_rag_engine() -> RAGFlow:
+    """获取进程内共享的 RAG 引擎（线程安全的懒加载单例），所有请求复用其客户端连接池与缓存。"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RAGFlow()
+    return _engine
+
 
 if __name__ == "__main__":
     print("欢迎使用RAG问答系统！")
@@ -1394,7 +2360,7 @@ if __name__ == "__main__":
             continue
 
         # 执行RAG流程
-        rag = RAGFlow()
+        rag = get_rag_engine()
         response = rag.run(query)
 
         print("\n" + "=" * 80)
@@ -276,7 +276,8 @@ class CorrectedRAGEvaluator:
                 [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt},
-                ]
+                ],
+                stage="eval",
             )
         except Exception as e:
             logger.error(f"调用DeepSeek进行chunk对齐判断失败: {e}")
@@ -498,7 +499,8 @@ class CorrectedRAGEvaluator:
                 [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt},
-                ]
+                ],
+                stage="eval",
             )
             text = str(decision).strip()
             scores = json.loads(text)
@@ -548,7 +550,8 @@ class CorrectedRAGEvaluator:
                 [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt},
-                ]
+                ],
+                stage="eval",
             )
             text = str(decision).strip()
             scores = json.loads(text)
@@ -603,7 +606,8 @@ class CorrectedRAGEvaluator:
                 [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt},
-                ]
+                ],
+                stage="eval",
             )
         except Exception as e:
             logger.error(f"调用DeepSeek进行问答匹配判定失败: {e}")
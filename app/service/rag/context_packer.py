@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+上下文打包：按 token 预算组织送入融合/生成 prompt 的证据。
+
+- token 计数使用缓存的分词器（RAG_TOKENIZER 指定 Hugging Face 分词器 id 或本地路径），
+  未配置或加载失败时退化为启发式估计（CJK 字符按 1 token，其余字符约 4 个 1 token）
+- 证据块按分数从高到低装入预算，跨块去除重复句子，最后一个放不下的块按剩余预算截断
+"""
+
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.service.env_utils import get_env_int
+
+logger = logging.getLogger("RAGFlow")
+
+# 单次计数缓存的文本条数（证据句/证据块会在多轮迭代中被重复计数）
+_COUNT_CACHE_SIZE = 4096
+# 截断后剩余预算不足该值时不再装入半截证据块，避免噪声片段
+_MIN_PARTIAL_TOKENS = 48
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+# 句子切分：中文句末标点、英文句末标点后接空白、换行
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[。！？；!?;])|(?<=[.])\s+|\n+")
+_WS_RE = re.compile(r"\s+")
+
+
+FUSION_TOKEN_BUDGET = get_env_int("RAG_FUSION_TOKEN_BUDGET", 6000)
+GENERATION_TOKEN_BUDGET = get_env_int("RAG_GENERATION_TOKEN_BUDGET", 4000)
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer() -> Optional[Any]:
+    """加载并缓存分词器；未配置 RAG_TOKENIZER 或加载失败时返回 None（使用启发式计数）。"""
+    name = os.getenv("RAG_TOKENIZER", "").strip()
+    if not name:
+        return None
+    try:
+        from transformers import AutoTokenizer
+
+        return AutoTokenizer.from_pretrained(name, trust_remote_code=True)
+    except Exception as e:
+        logger.warning(f"加载分词器失败（{name}），改用启发式 token 估计: {str(e)}")
+        return None
+
+
+def _heuristic_tokens(text: str) -> int:
+    cjk = len(_CJK_RE.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+@lru_cache(maxsize=_COUNT_CACHE_SIZE)
+def count_tokens(text: str) -> int:
+    """统计文本 token 数（结果按文本缓存）。"""
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        try:
+            return len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception:
+            pass
+    return _heuristic_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按 token 数截断文本，不超过 max_tokens。"""
+    s = str(text).strip() if text is not None else ""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(s) <= max_tokens:
+        return s
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        try:
+            ids = tokenizer.encode(s, add_special_tokens=False)[:max_tokens]
+            return tokenizer.decode(ids, skip_special_tokens=True).strip()
+        except Exception:
+            pass
+    # 启发式：逐字符累计开销，直到超出预算
+    used = 0.0
+    for i, ch in enumerate(s):
+        used += 1.0 if _CJK_RE.match(ch) else 0.25
+        if used > max_tokens:
+            return s[:i].rstrip()
+    return s
+
+
+def split_sentences(text: str) -> List[str]:
+    return [p.strip() for p in _SENTENCE_SPLIT_RE.split(text or "") if p and p.strip()]
+
+
+def _sentence_key(sentence: str) -> str:
+    return _WS_RE.sub("", sentence).lower()
+
+
+def dedupe_sentences(text: str, seen: Optional[set] = None) -> Tuple[str, int]:
+    """
+    去除文本中已出现过的句子（忽略空白与大小写），保留行结构。
+    seen 为跨文本共享的已见句子集合；返回 (去重后文本, 去掉的句子数)。
+    """
+    seen = seen if seen is not None else set()
+    removed = 0
+    kept_lines: List[str] = []
+    for line in (text or "").split("\n"):
+        kept: List[str] = []
+        line_removed = 0
+        for sent in split_sentences(line):
+            key = _sentence_key(sent)
+            # 过短的片段（编号、单个符号）不参与去重
+            if len(key) >= 6:
+                if key in seen:
+                    line_removed += 1
+                    continue
+                seen.add(key)
+            kept.append(sent)
+        removed += line_removed
+        if not line_removed:
+            if line.strip():
+                kept_lines.append(line)
+        elif kept:
+            kept_lines.append(" ".join(kept) if _CJK_RE.search(line) is None else "".join(kept))
+    return "\n".join(kept_lines), removed
+
+
+def pack_evidence(
+    blocks: List[Dict[str, Any]],
+    budget: int,
+    separator: str = "\n",
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    按分数把证据块装入 token 预算。
+    blocks 中每项包含 score、header（标题/元信息，不去重）、body（证据正文，跨块句子去重）。
+    输出保持块的原始相对顺序；返回 (打包文本, 统计信息)。
+    """
+    stats: Dict[str, Any] = {
+        "budget": budget,
+        "input_blocks": len(blocks),
+        "packed_blocks": 0,
+        "truncated_blocks": 0,
+        "dropped_blocks": 0,
+        "duplicate_sentences": 0,
+        "tokens": 0,
+    }
+    order = sorted(range(len(blocks)), key=lambda i: float(blocks[i].get("score") or 0.0), reverse=True)
+    seen: set = set()
+    sep_tokens = count_tokens(separator) if separator.strip() else 0
+    remaining = budget
+    packed: Dict[int, str] = {}
+    for i in order:
+        header = str(blocks[i].get("header") or "")
+        body, removed = dedupe_sentences(str(blocks[i].get("body") or ""), seen)
+        stats["duplicate_sentences"] += removed
+        if not body.strip():
+            stats["dropped_blocks"] += 1
+            continue
+        text = f"{header}{body}\n"
+        cost = count_tokens(text) + sep_tokens
+        if cost <= remaining:
+            packed[i] = text
+            remaining -= cost
+            continue
+        body_room = remaining - count_tokens(header) - sep_tokens
+        if body_room >= _MIN_PARTIAL_TOKENS:
+            packed[i] = f"{header}{truncate_to_tokens(body, body_room)}\n"
+            remaining -= count_tokens(packed[i]) + sep_tokens
+            stats["truncated_blocks"] += 1
+        else:
+            stats["dropped_blocks"] += 1
+    texts = [packed[i] for i in sorted(packed)]
+    stats["packed_blocks"] = len(texts)
+    stats["tokens"] = budget - remaining
+    return separator.join(texts), stats
+
+
+def fit_text(text: str, budget: int) -> Tuple[str, Dict[str, Any]]:
+    """单段文本（如融合结果）去重句子后截断到 token 预算。"""
+    deduped, removed = dedupe_sentences(text or "")
+    fitted = truncate_to_tokens(deduped, budget)
+    return fitted, {
+        "budget": budget,
+        "duplicate_sentences": removed,
+        "truncated": count_tokens(deduped) > budget,
+        "tokens": count_tokens(fitted),
+    }
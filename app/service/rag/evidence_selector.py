@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+自适应证据扇出：根据候选 chunk 的分数分布决定送入 LLM 证据抽取的数量，替代固定 top-10。
+
+- 最低相关性：分数低于 top 分数 × RAG_EVIDENCE_FLOOR_RATIO 的候选视为噪声
+- 分数断层：在 [min_k, max_k] 范围内寻找最大分数落差，落差显著（超过中位落差的 RAG_EVIDENCE_GAP_FACTOR 倍）时在此截断
+- 文档覆盖：通过相关性下限的每篇文档至少保留其最高分 chunk，保证多文档问题的覆盖
+全部计算在 numpy 数组上向量化完成。
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.service.env_utils import get_env_float
+
+
+def select_evidence(
+    scores: Sequence[float],
+    doc_keys: Sequence[Any],
+    max_k: int = 10,
+    min_k: Optional[int] = None,
+    floor_ratio: Optional[float] = None,
+    gap_factor: Optional[float] = None,
+) -> Tuple[List[int], Dict[str, Any]]:
+    """
+    从按分数降序排列的候选中选出需要做证据抽取的下标。
+    Args:
+        scores: 候选分数（降序）
+        doc_keys: 候选所属文档标识（与 scores 对齐），用于文档覆盖
+        max_k: 选取上限
+        min_k / floor_ratio / gap_factor: 缺省时读取 RAG_EVIDENCE_MIN_K / RAG_EVIDENCE_FLOOR_RATIO / RAG_EVIDENCE_GAP_FACTOR
+    Returns:
+        (升序排列的选中下标, 选择统计)
+    """
+    # 至少保留 1 条：min_k <= 0 时 lo = min_k - 1 为负，切片会从末尾取落差
+    min_k = max(1, int(min_k if min_k is not None else get_env_float("RAG_EVIDENCE_MIN_K", 2)))
+    floor_ratio = floor_ratio if floor_ratio is not None else get_env_float("RAG_EVIDENCE_FLOOR_RATIO", 0.5)
+    gap_factor = gap_factor if gap_factor is not None else get_env_float("RAG_EVIDENCE_GAP_FACTOR", 2.0)
+
+    n = min(len(scores), max(0, int(max_k)))
+    stats: Dict[str, Any] = {"candidates": len(scores), "max_k": int(max_k), "selected": n, "cut": "max_k"}
+    if n <= min_k:
+        return list(range(n)), stats
+
+    s = np.asarray(scores[:n], dtype=np.float64)
+    top = s[0]
+
+    # 1) 最低相关性：分数 >= top * floor_ratio（top 非正时不做下限过滤）
+    above_floor = s >= top * floor_ratio if top > 0 else np.ones(n, dtype=bool)
+    n_floor = int(np.argmin(above_floor)) if not above_floor.all() else n
+
+    # 2) 分数断层：在 [min_k, n_floor] 内找最大落差
+    k = max(min_k, n_floor)
+    gaps = s[:-1] - s[1:]
+    lo, hi = min_k - 1, max(min_k, n_floor) - 1
+    if hi > lo:
+        window = gaps[lo:hi]
+        pos = int(np.argmax(window))
+        median_gap = float(np.median(gaps)) if gaps.size else 0.0
+        if window[pos] > 0 and window[pos] > gap_factor * max(median_gap, 1e-12):
+            k = lo + pos + 1
+            stats["cut"] = "score_gap"
+            stats["gap"] = round(float(window[pos]), 6)
+    if k == n_floor and k < n and stats["cut"] == "max_k":
+        stats["cut"] = "relevance_floor"
+    k = int(np.clip(k, min_k, n))
+
+    selected = np.zeros(n, dtype=bool)
+    selected[:k] = True
+
+    # 3) 文档覆盖：相关性下限内每篇文档的最高分 chunk 必选
+    codes = {}
+    doc_codes = np.fromiter((codes.setdefault(d, len(codes)) for d in doc_keys[:n]), dtype=np.int64, count=n)
+    _, first_idx = np.unique(doc_codes, return_index=True)
+    coverage = np.zeros(n, dtype=bool)
+    coverage[first_idx] = True
+    added = coverage & above_floor & ~selected
+    selected |= added
+
+    indices = np.flatnonzero(selected).tolist()
+    stats.update(
+        {
+            "selected": len(indices),
+            "relevance_floor": round(float(top * floor_ratio), 6) if top > 0 else None,
+            "coverage_added": int(added.sum()),
+            "docs_covered": int(len(set(doc_codes[selected].tolist()))),
+        }
+    )
+    return indices, stats
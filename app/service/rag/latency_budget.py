@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RAG 运行的延迟预算：按截止时间（deadline_ms）或延迟档位（latency_tier）决定各阶段是否执行。
+
+档位：
+- interactive：单轮、少量证据，证据很少时跳过融合，时间不足时基于已有证据做一次限长生成（或直接返回已有的融合结果）
+- standard：最多两轮，中等证据扇出
+- thorough：与原流程一致（最多三轮、10 条证据），适合批量/评估
+
+当前运行的预算通过 contextvars 传递，DeepSeekClient 据此收紧单次调用超时与排队等待。
+"""
+
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+TIER_INTERACTIVE = "interactive"
+TIER_STANDARD = "standard"
+TIER_THOROUGH = "thorough"
+
+# 各档位策略：
+# max_iterations 最大迭代轮数；evidence_fanout 证据抽取的 chunk 上限；
+# skip_fusion_max_evidence 证据块数不超过该值时跳过 LLM 融合（0 表示不跳过）；
+# generation_reserve_ms 为最终生成预留的时间；default_deadline_ms 未显式给出截止时间时的默认值
+TIER_POLICIES: Dict[str, Dict[str, Any]] = {
+    TIER_INTERACTIVE: {
+        "max_iterations": 1,
+        "evidence_fanout": 5,
+        "skip_fusion_max_evidence": 2,
+        "generation_reserve_ms": 3000,
+        "default_deadline_ms": 10000,
+    },
+    TIER_STANDARD: {
+        "max_iterations": 2,
+        "evidence_fanout": 8,
+        "skip_fusion_max_evidence": 1,
+        "generation_reserve_ms": 5000,
+        "default_deadline_ms": 30000,
+    },
+    TIER_THOROUGH: {
+        "max_iterations": 3,
+        "evidence_fanout": 10,
+        "skip_fusion_max_evidence": 0,
+        "generation_reserve_ms": 0,
+        "default_deadline_ms": None,
+    },
+}
+
+# 预算紧张时单次 LLM 调用的最短超时（秒），避免超时过短必然失败
+_MIN_LLM_TIMEOUT_S = 2.0
+
+
+def _resolve_tier(latency_tier: Optional[str], deadline_ms: Optional[float]) -> str:
+    if latency_tier in TIER_POLICIES:
+        return latency_tier
+    if deadline_ms is not None:
+        # 只给截止时间时按时长选择档位
+        if deadline_ms <= TIER_POLICIES[TIER_INTERACTIVE]["default_deadline_ms"]:
+            return TIER_INTERACTIVE
+        if deadline_ms <= TIER_POLICIES[TIER_STANDARD]["default_deadline_ms"]:
+            return TIER_STANDARD
+        return TIER_THOROUGH
+    default_tier = os.getenv("RAG_DEFAULT_LATENCY_TIER", TIER_THOROUGH).strip().lower()
+    return default_tier if default_tier in TIER_POLICIES else TIER_THOROUGH
+
+
+class LatencyBudget:
+    """单次运行的延迟预算与阶段决策记录。"""
+
+    def __init__(self, deadline_ms: Optional[float] = None, latency_tier: Optional[str] = None):
+        self.tier = _resolve_tier(latency_tier, deadline_ms)
+        self.policy = dict(TIER_POLICIES[self.tier])
+        self.deadline_ms: Optional[float] = (
+            float(deadline_ms) if deadline_ms is not None else self.policy["default_deadline_ms"]
+        )
+        self.started_at = time.perf_counter()
+        self._iteration_started_at = self.started_at
+        self.decisions: List[Dict[str, Any]] = []
+        self.degraded = False
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000.0
+
+    def remaining_ms(self) -> Optional[float]:
+        """剩余时间（毫秒）；无截止时间时返回 None。"""
+        if self.deadline_ms is None:
+            return None
+        return self.deadline_ms - self.elapsed_ms()
+
+    def expired(self) -> bool:
+        remaining = self.remaining_ms()
+        return remaining is not None and remaining <= 0
+
+    def record(self, action: str, iteration: Optional[int] = None, **extra: Any) -> None:
+        """记录一次由预算触发的阶段决策（写入 trace）。"""
+        item: Dict[str, Any] = {"action": action, "iteration": iteration, "elapsed_ms": round(self.elapsed_ms(), 3)}
+        item.update(extra)
+        self.decisions.append(item)
+
+    def begin_iteration(self) -> None:
+        self._iteration_started_at = time.perf_counter()
+
+    def can_iterate(self, iteration: int) -> bool:
+        """是否还能再跑一轮：受档位轮数限制，且剩余时间需容纳一轮（按本轮耗时估计）加最终生成。"""
+        if iteration >= self.policy["max_iterations"]:
+            return False
+        remaining = self.remaining_ms()
+        if remaining is None:
+            return True
+        iteration_cost_ms = (time.perf_counter() - self._iteration_started_at) * 1000.0
+        return remaining - iteration_cost_ms - self.policy["generation_reserve_ms"] > 0
+
+    def evidence_fanout(self) -> int:
+        return int(self.policy["evidence_fanout"])
+
+    def allow_fusion(self, evidence_count: int) -> bool:
+        """证据很少（可直接送入生成）或已无时间时跳过 LLM 融合。"""
+        if evidence_count <= int(self.policy["skip_fusion_max_evidence"]):
+            return False
+        remaining = self.remaining_ms()
+        return remaining is None or remaining > self.policy["generation_reserve_ms"]
+
+    def llm_timeout(self, default_s: float) -> float:
+        """单次 LLM 调用超时：不超过默认值与剩余时间，且不低于最短超时。"""
+        remaining = self.remaining_ms()
+        if remaining is None:
+            return default_s
+        return max(_MIN_LLM_TIMEOUT_S, min(default_s, remaining / 1000.0))
+
+    def queue_timeout(self) -> Optional[float]:
+        """在 LLM 调度队列中最多等待的秒数；无截止时间时不限。"""
+        remaining = self.remaining_ms()
+        if remaining is None:
+            return None
+        return max(0.0, remaining / 1000.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        remaining = self.remaining_ms()
+        return {
+            "tier": self.tier,
+            "deadline_ms": self.deadline_ms,
+            "elapsed_ms": round(self.elapsed_ms(), 3),
+            "remaining_ms": round(remaining, 3) if remaining is not None else None,
+            "degraded": self.degraded,
+            "decisions": list(self.decisions),
+        }
+
+
+_current_budget: contextvars.ContextVar[Optional[LatencyBudget]] = contextvars.ContextVar(
+    "rag_latency_budget", default=None
+)
+
+
+def get_current_budget() -> Optional[LatencyBudget]:
+    return _current_budget.get()
+
+
+@contextmanager
+def activate(budget: Optional[LatencyBudget]) -> Iterator[Optional[LatencyBudget]]:
+    """在当前上下文中启用预算（线程池任务需通过 instrumentation.submit_with_context 继承）。"""
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
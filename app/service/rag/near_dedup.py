@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+查询时近重复片段折叠：对检索结果内容做字符 shingle + MinHash，签名与两两相似度在 numpy 上向量化计算。
+
+同一论文重复入库、父子 chunk 内容重叠等情况会产生近乎相同的片段，各自消耗一次证据抽取调用与 prompt token；
+按估计 Jaccard 相似度合并后只保留分数最高的代表片段，并记录被并入的片段。
+"""
+
+import re
+import zlib
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# MinHash 使用的梅森素数（2^31 - 1），保证 a * h + b 在 uint64 内不溢出
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_WS_RE = re.compile(r"\s+")
+
+
+def _perm_params(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, (1 << 31) - 1, size=num_perm).astype(np.uint64)
+    b = rng.randint(0, (1 << 31) - 1, size=num_perm).astype(np.uint64)
+    return a, b
+
+
+def _shingle_hashes(text: str, shingle_size: int) -> np.ndarray:
+    norm = _WS_RE.sub(" ", text or "").strip().lower()
+    if not norm:
+        return np.empty(0, dtype=np.uint64)
+    if len(norm) <= shingle_size:
+        shingles = {norm}
+    else:
+        shingles = {norm[i:i + shingle_size] for i in range(len(norm) - shingle_size + 1)}
+    hashes = np.fromiter(
+        (zlib.crc32(sh.encode("utf-8")) for sh in shingles), dtype=np.uint64, count=len(shingles)
+    )
+    return hashes % _MERSENNE_PRIME
+
+
+def minhash_signatures(texts: Sequence[str], shingle_size: int = 5, num_perm: int = 64) -> np.ndarray:
+    """
+    计算 MinHash 签名矩阵，形状 (len(texts), num_perm)。
+    空文本的签名置为全 -1（与任何文本都不相似）。
+    """
+    a, b = _perm_params(num_perm)
+    signatures = np.full((len(texts), num_perm), -1, dtype=np.int64)
+    for row, text in enumerate(texts):
+        hashes = _shingle_hashes(text, shingle_size)
+        if hashes.size == 0:
+            continue
+        # (num_perm, n_shingles) 上一次性求每个置换的最小哈希
+        permuted = (hashes[None, :] * a[:, None] + b[:, None]) % _MERSENNE_PRIME
+        signatures[row] = permuted.min(axis=1).astype(np.int64)
+    return signatures
+
+
+def collapse_near_duplicates(
+    texts: Sequence[str],
+    scores: Sequence[float],
+    threshold: float = 0.85,
+    shingle_size: int = 5,
+    num_perm: int = 64,
+) -> Tuple[List[int], Dict[int, List[int]]]:
+    """
+    折叠近重复文本：估计 Jaccard 相似度 >= threshold 的文本归为一组，保留组内分数最高者（同分取靠前者）。
+    Returns:
+        (保留的下标（保持原顺序）, {代表下标: [被并入的下标, ...]})
+    """
+    n = len(texts)
+    if n < 2:
+        return list(range(n)), {}
+
+    sig = minhash_signatures(texts, shingle_size=shingle_size, num_perm=num_perm)
+    valid = sig[:, 0] >= 0
+    # 两两估计 Jaccard：签名逐位相等的比例
+    sim = (sig[:, None, :] == sig[None, :, :]).mean(axis=2)
+    sim[~valid, :] = 0.0
+    sim[:, ~valid] = 0.0
+    np.fill_diagonal(sim, 0.0)
+    dup = sim >= threshold
+
+    # 按分数从高到低贪心：尚未被合并的文本作为代表，吸收与其相似的其余文本
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")
+    absorbed = np.zeros(n, dtype=bool)
+    merged: Dict[int, List[int]] = {}
+    for i in order:
+        if absorbed[i] or not dup[i].any():
+            continue
+        members = np.flatnonzero(dup[i] & ~absorbed)
+        members = members[members != i]
+        if members.size:
+            absorbed[members] = True
+            merged[int(i)] = members.tolist()
+    keep = np.flatnonzero(~absorbed).tolist()
+    return keep, merged
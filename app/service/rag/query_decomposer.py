@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多论文 / 多实体问题的子查询拆分，以及子查询检索结果的配额合并。
+
+- 规则拆分（零成本，优先）：多个《》标题提及，或由“和/与/、/vs/and”等连接的多个锚点实体（ACAttack 和 ISSU-Train），
+  把并列部分替换为单个实体，得到每个实体一条子查询
+- LLM 拆分（兜底）：规则未拆开但问题带有对比/分别等多对象信号时，由 RAGFlow 调用 LLM 输出子查询列表
+- 合并：每条子查询按分数取不超过配额的结果，轮转交织、按 chunk_id 去重，保证每个实体都有证据进入同一轮
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.service import anchor_index
+
+_TITLE_MENTION_RE = re.compile(r"《[^《》]{2,300}》")
+# 并列连接词：实体之间只允许出现这些连接符（及空白）
+_CONJ = r"(?:\s*(?:和|与|及|以及|跟|同|、|,|，|/|vs\.?|VS\.?|versus|and)\s*)"
+_TITLE_RUN_RE = re.compile(rf"《[^《》]{{2,300}}》(?:{_CONJ}《[^《》]{{2,300}}》)+")
+_ANCHOR_TOKEN = r"[A-Za-z][A-Za-z0-9_.\-]{1,}"
+_ANCHOR_RUN_RE = re.compile(rf"(?<![A-Za-z0-9_.\-]){_ANCHOR_TOKEN}(?:{_CONJ}{_ANCHOR_TOKEN})+")
+# 规则未拆开时才考虑 LLM 兜底的多对象信号
+_MULTI_ENTITY_CUES = ("分别", "各自", "对比", "比较", "相比", "区别", "异同", "两篇", "几篇", "多篇", "哪个更", "哪篇", "compare", "versus")
+
+
+def _split_run(query: str, run: "re.Match[str]", entities: Sequence[str]) -> List[Dict[str, str]]:
+    head, tail = query[: run.start()], query[run.end():]
+    return [{"query": f"{head}{entity}{tail}".strip(), "entity": entity} for entity in entities]
+
+
+def rule_based_split(query: str, max_subqueries: int = 4) -> List[Dict[str, str]]:
+    """
+    规则拆分。返回 [{"query": 子查询, "entity": 对应实体}]；少于两个实体时返回空列表。
+    """
+    text = (query or "").strip()
+    if not text:
+        return []
+
+    run = _TITLE_RUN_RE.search(text)
+    if run:
+        entities = list(dict.fromkeys(_TITLE_MENTION_RE.findall(run.group(0))))
+        if len(entities) >= 2:
+            return _split_run(text, run, entities[:max_subqueries])
+
+    for run in _ANCHOR_RUN_RE.finditer(text):
+        tokens = re.findall(_ANCHOR_TOKEN, re.sub(r"\b(?:vs|VS|versus|and)\b\.?", " ", run.group(0)))
+        entities = [t for t in dict.fromkeys(tokens) if anchor_index.is_anchor_token(t)]
+        if len(entities) >= 2:
+            return _split_run(text, run, entities[:max_subqueries])
+    return []
+
+
+def needs_llm_split(query: str) -> bool:
+    """问题带有多对象信号（对比 / 分别 / 多篇等）时才值得让 LLM 尝试拆分。"""
+    lowered = (query or "").lower()
+    return any(cue in lowered for cue in _MULTI_ENTITY_CUES)
+
+
+def parse_llm_subqueries(obj: Optional[Dict[str, Any]], max_subqueries: int = 4) -> List[Dict[str, str]]:
+    """解析 LLM 输出的 {"subqueries": [...]}；不足两条视为无需拆分。"""
+    if not isinstance(obj, dict):
+        return []
+    items = obj.get("subqueries")
+    if not isinstance(items, list):
+        return []
+    out: List[Dict[str, str]] = []
+    for it in items:
+        if isinstance(it, str) and it.strip():
+            out.append({"query": it.strip(), "entity": ""})
+        elif isinstance(it, dict) and isinstance(it.get("query"), str) and it["query"].strip():
+            out.append({"query": it["query"].strip(), "entity": str(it.get("entity") or "").strip()})
+    return out[:max_subqueries] if len(out) >= 2 else []
+
+
+def merge_with_quotas(
+    result_lists: Sequence[Sequence[Any]],
+    total: int,
+    key: Callable[[Any], Any],
+    score: Callable[[Any], float],
+) -> List[Any]:
+    """
+    按子查询配额合并检索结果：每条子查询先按分数降序，配额为 total // 子查询数（至少 3），
+    各列表轮转取结果并按 key 去重；配额用不完的名额由剩余结果按分数补齐。
+    """
+    lists = [sorted(lst, key=score, reverse=True) for lst in result_lists if lst]
+    if not lists:
+        return []
+    quota = max(3, total // len(lists))
+    merged: List[Any] = []
+    seen: set = set()
+    cursors = [0] * len(lists)
+    taken = [0] * len(lists)
+    progress = True
+    while progress and len(merged) < total:
+        progress = False
+        for i, lst in enumerate(lists):
+            while cursors[i] < len(lst) and taken[i] < quota:
+                item = lst[cursors[i]]
+                cursors[i] += 1
+                k = key(item)
+                if k is not None and k in seen:
+                    continue
+                seen.add(k)
+                merged.append(item)
+                taken[i] += 1
+                progress = True
+                break
+    if len(merged) < total:
+        rest = [lst[c:] for lst, c in zip(lists, cursors)]
+        for item in sorted((it for r in rest for it in r), key=score, reverse=True):
+            if len(merged) >= total:
+                break
+            k = key(item)
+            if k is not None and k in seen:
+                continue
+            seen.add(k)
+            merged.append(item)
+    return merged
@@ -1,11 +1,18 @@
 """检索服务，封装 BaseVector-Core RetrieverService。"""
 
+import asyncio
+import heapq
 import logging
 import os
+import threading
+import time
 from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Union
 
+from app.service import doc_metadata, instrumentation, title_index
+from app.service.chunk_features import STRUCTURE_SCORE_FIELDS
+from app.service.env_utils import get_env_int, is_truthy_env
 from base_db import DocumentClient, DocumentChunkClient
 from base_db.abstract.abstract_base_core import AbstractBaseCore
 from milvus_service import (
@@ -18,6 +25,8 @@ from milvus_service import (
     TextMatchSearchRequest,
 )
 
+logger = logging.getLogger(__name__)
+
 
 def _configure_embedding_logging() -> None:
     """降低 embedding/transformers 加载噪音，避免每次请求刷屏。"""
@@ -280,18 +289,39 @@ def _get_embedding_model():
         )
 
 
+def warm_up() -> None:
+    """预加载查询向量模型，并在后台开始加载标题索引与核对文档级集合覆盖情况，避免首个请求承担加载耗时。"""
+    _get_embedding_model()
+    _get_title_index()
+    if _coarse_to_fine_enabled(None):
+        _docs_collection_covers_chunks(_get_collection_name())
+
+
 def _encode_query(query: str) -> list[float]:
     """将查询文本编码为向量（已 L2 归一化）。"""
     model = _get_embedding_model()
-    vec = model.encode(
-        [query],
-        task="retrieval",
-        show_progress_bar=False,
-        normalize_embeddings=True,
-    )[0].tolist()
+    with instrumentation.stage("retrieval.encode"):
+        vec = model.encode(
+            [query],
+            task="retrieval",
+            show_progress_bar=False,
+            normalize_embeddings=True,
+        )[0].tolist()
     return vec
 
 
+def _milvus_stage(mode: str, req_kwargs: dict[str, Any]):
+    """
+    Milvus 检索阶段计时。重排在 BaseVector-Core 内部与检索一起执行，无法单独计时，
+    启用重排时记为 retrieval.milvus_rerank，与 retrieval.milvus 的直方图对比即可得到重排开销。
+    """
+    rerank_enabled = req_kwargs.get("rerank_enabled")
+    if rerank_enabled is None:
+        rerank_enabled = is_truthy_env("RERANK_ENABLED", False)
+    name = "retrieval.milvus_rerank" if rerank_enabled else "retrieval.milvus"
+    return instrumentation.stage(name, mode=mode)
+
+
 def _get_collection_name() -> str:
     """从 .env 获取检索集合名称。"""
     return os.getenv("COLLECTION_NAME", "papers_chunks_collection")
@@ -325,6 +355,404 @@ async def get_parent_content_by_chunk_id(chunk_id: int) -> str:
     return getattr(chunk, "parent_content", "") or ""
 
 
+def _load_title_entries(collection_name: str):
+    """
+    从 Milvus 读取 (doc_id, title) 供标题索引加载：默认布局扫描 chunk 集合并按 doc_id 去重（只取 doc_id 与 title 两列），
+    文档级集合可能是后建的、缺少升级前入库的论文，不能代替 chunk 集合；
+    规范化布局下 chunk 不含标题，文档级记录先于 chunk 写入，扫描文档级集合（每篇文档一条）。
+    """
+    from pymilvus import Collection
+
+    params = _get_milvus_connection_params()
+    if params:
+        _ensure_milvus_default_connection(params)
+    if doc_metadata.is_normalized_layout():
+        coll = Collection(doc_metadata.docs_collection_name(collection_name), using="default")
+        key = "id"
+    else:
+        coll = Collection(collection_name, using="default")
+        key = "doc_id"
+    seen: set[int] = set()
+    for row in doc_metadata.iter_query_rows(coll, f"{key} >= 0", [key, "title"]):
+        doc_id = row.get(key)
+        if doc_id is not None and doc_id not in seen:
+            seen.add(doc_id)
+            yield doc_id, row.get("title") or ""
+
+
+def _get_title_index() -> title_index.TitleIndex | None:
+    """标题索引（后台加载，首次加载完成前返回 None，调用方回退为 title like 过滤或不做标题解析）。"""
+    if not title_index.is_enabled():
+        return None
+    collection = _get_collection_name()
+    try:
+        return title_index.get_title_index(collection, lambda: _load_title_entries(collection))
+    except Exception as e:
+        logger.warning(f"加载标题索引失败，回退为 title like 过滤: {e}")
+        return None
+
+
+def resolve_title_doc_ids(paper_title: str) -> list[int]:
+    """
+    通过标题索引把论文标题解析为 doc_id 列表，只采用精确 / 归一化 / 前缀匹配；
+    模糊匹配、未命中或索引不可用时返回空列表，由调用方保留 title like 过滤。
+    """
+    index = _get_title_index()
+    if index is None:
+        return []
+    with instrumentation.stage("retrieval.title_lookup"):
+        doc_ids, match = index.lookup(paper_title)
+    return doc_ids if match in title_index.STRICT_MATCHES else []
+
+
+def resolve_query_titles(query: str) -> dict[str, Any]:
+    """
+    解析查询中《》/引号括起的论文标题提及，返回 {"mentions": [...], "doc_ids": [...], "fuzzy_doc_ids": [...]}；
+    doc_ids 可直接用作过滤，fuzzy_doc_ids（模糊匹配）只适合用于排序加权。
+    """
+    if not title_index.extract_title_mentions(query):
+        return {"mentions": [], "doc_ids": [], "fuzzy_doc_ids": []}
+    index = _get_title_index()
+    if index is None:
+        return {"mentions": [], "doc_ids": [], "fuzzy_doc_ids": []}
+    with instrumentation.stage("retrieval.title_lookup"):
+        return index.resolve_query(query)
+
+
+_DEFAULT_GROUP_COUNT = 10
+_DEFAULT_GROUP_SIZE = 3
+_MAX_GROUP_CANDIDATES = 200
+
+
+@lru_cache(maxsize=None)
+def _supports_native_grouping(request_cls: type) -> bool:
+    """检索请求模型是否支持 Milvus 原生 group_by_field（取决于所装 BaseVector-Core 版本）。"""
+    fields = getattr(request_cls, "model_fields", None) or getattr(request_cls, "__fields__", None) or {}
+    return "group_by_field" in fields
+
+
+def _result_doc_id(result: Any) -> Any:
+    doc_id = getattr(result, "document_id", None)
+    if doc_id is None:
+        doc_id = getattr(result, "doc_id", None)
+    if doc_id is None:
+        metadata = getattr(result, "metadata", None)
+        if isinstance(metadata, dict):
+            doc_id = metadata.get("doc_id")
+    return doc_id
+
+
+def _prepare_doc_grouping(
+    req_kwargs: dict[str, Any],
+    request_cls: type,
+    top_k: int | None,
+    group_size: int | None,
+) -> tuple[int, int, bool]:
+    """
+    按文档分组检索的请求参数：支持原生分组时交给 Milvus 按 doc_id 分组，
+    否则把 top_k 放大为过采样候选数，由 _group_results_by_doc 在客户端合并。
+    Returns:
+        (文档数 K, 每文档 chunk 数 M, 是否原生分组)
+    """
+    group_count = top_k or _DEFAULT_GROUP_COUNT
+    size = group_size or _DEFAULT_GROUP_SIZE
+    if _supports_native_grouping(request_cls):
+        req_kwargs["group_by_field"] = "doc_id"
+        req_kwargs["group_size"] = size
+        req_kwargs["top_k"] = group_count
+        return group_count, size, True
+    oversample = max(1, get_env_int("RETRIEVAL_GROUP_OVERSAMPLE", 3))
+    req_kwargs["top_k"] = min(_MAX_GROUP_CANDIDATES, group_count * size * oversample)
+    return group_count, size, False
+
+
+def _group_results_by_doc(results: Any, group_count: int, group_size: int) -> list[Any]:
+    """
+    客户端按 doc_id 分组：每篇文档用大小为 M 的最小堆保留最高分 chunk，
+    再按文档最高分取前 K 篇，输出按文档排名、文档内按分数排列。
+    """
+    groups: dict[Any, list[tuple[float, int, Any]]] = {}
+    for seq, r in enumerate(results or []):
+        doc_id = _result_doc_id(r)
+        key = doc_id if doc_id is not None else ("chunk", getattr(r, "chunk_id", seq))
+        heap = groups.setdefault(key, [])
+        item = (float(getattr(r, "score", 0.0) or 0.0), -seq, r)
+        if len(heap) < group_size:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+    top_groups = heapq.nlargest(group_count, groups.values(), key=lambda h: max(h, key=lambda x: x[:2])[:2])
+    return [item[2] for heap in top_groups for item in sorted(heap, key=lambda x: x[:2], reverse=True)]
+
+
+_HIGHLIGHT_OPEN = "<mark>"
+_HIGHLIGHT_CLOSE = "</mark>"
+
+
+def _parent_group_key(result: Any) -> tuple[Any, int] | None:
+    """(doc_id, parent_index)；旧集合没有 parent_index 字段时返回 None。"""
+    metadata = getattr(result, "metadata", None)
+    parent_index = metadata.get("parent_index") if isinstance(metadata, dict) else None
+    if parent_index is None or int(parent_index) < 0:
+        return None
+    return _result_doc_id(result), int(parent_index)
+
+
+def _highlight_spans(parent_text: str, child_texts: list[str]) -> tuple[str, list[list[int] | None]]:
+    """在父块中定位各子块文本并用 <mark> 标出（重叠区间合并），返回 (高亮文本, 各子块 [start, end] 或 None)。"""
+    spans: list[list[int] | None] = []
+    for text in child_texts:
+        text = (text or "").strip()
+        pos = parent_text.find(text) if text else -1
+        spans.append([pos, pos + len(text)] if pos >= 0 else None)
+    merged: list[list[int]] = []
+    for start, end in sorted(sp for sp in spans if sp is not None):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    parts: list[str] = []
+    cursor = 0
+    for start, end in merged:
+        parts.extend([parent_text[cursor:start], _HIGHLIGHT_OPEN, parent_text[start:end], _HIGHLIGHT_CLOSE])
+        cursor = end
+    parts.append(parent_text[cursor:])
+    return "".join(parts), spans
+
+
+async def aggregate_results_by_parent(results: Any, scoring: str = "max") -> list[dict[str, Any]]:
+    """
+    父块级结果：把命中的子块按 (doc_id, parent_index) 聚合，父块得分取子块得分的 max 或 sum，
+    每个父块只查询一次 parent_content，并在父块文本中高亮命中的子块。
+    旧集合没有 parent_index 时逐个子块查询父块，再按父块文本去重。
+    """
+    groups: dict[Any, list[Any]] = {}
+    ungrouped: list[Any] = []
+    for r in results or []:
+        key = _parent_group_key(r)
+        if key is None:
+            ungrouped.append(r)
+        else:
+            groups.setdefault(key, []).append(r)
+
+    async def _fetch(chunk_id: Any) -> str:
+        return await get_parent_content_by_chunk_id(chunk_id=chunk_id) if isinstance(chunk_id, int) else ""
+
+    with instrumentation.stage("retrieval.parent_fetch", parents=len(groups), ungrouped=len(ungrouped)):
+        keyed = list(groups.items())
+        fetched = await asyncio.gather(*(_fetch(getattr(children[0], "chunk_id", None)) for _, children in keyed))
+        fallback = await asyncio.gather(*(_fetch(getattr(r, "chunk_id", None)) for r in ungrouped))
+
+    parents: dict[Any, dict[str, Any]] = {}
+    for (key, children), text in zip(keyed, fetched):
+        parents[key] = {"parent_text": text, "children": children, "parent_index": key[1]}
+    for r, text in zip(ungrouped, fallback):
+        # 无 parent_index：按父块文本去重（取不到父块时子块自成一组）
+        key = (_result_doc_id(r), hash(text)) if text else ("chunk", getattr(r, "chunk_id", id(r)))
+        parents.setdefault(key, {"parent_text": text, "children": [], "parent_index": None})["children"].append(r)
+
+    out: list[dict[str, Any]] = []
+    for group in parents.values():
+        children = sorted(group["children"], key=lambda c: float(getattr(c, "score", 0.0) or 0.0), reverse=True)
+        scores = [float(getattr(c, "score", 0.0) or 0.0) for c in children]
+        parent_text = group["parent_text"] or ""
+        highlighted, spans = _highlight_spans(parent_text, [getattr(c, "content", "") or "" for c in children])
+        out.append(
+            {
+                "doc_id": _result_doc_id(children[0]),
+                "parent_index": group["parent_index"],
+                "score": sum(scores) if scoring == "sum" else max(scores),
+                "parent_chunk": parent_text,
+                "highlighted": highlighted if parent_text else "",
+                "metadata": getattr(children[0], "metadata", {}) or {},
+                "children": [
+                    {
+                        "chunk_id": getattr(c, "chunk_id", None),
+                        "score": sc,
+                        "content": getattr(c, "content", ""),
+                        "span": span,
+                    }
+                    for c, sc, span in zip(children, scores, spans)
+                ],
+            }
+        )
+    out.sort(key=lambda p: p["score"], reverse=True)
+    return out
+
+
+_loaded_doc_collections: set[str] = set()
+
+
+def _get_docs_collection():
+    """已加载的文档级伴随集合（{集合名}_docs）；集合不存在时返回 None。"""
+    from pymilvus import Collection, utility
+
+    params = _get_milvus_connection_params()
+    if params:
+        _ensure_milvus_default_connection(params)
+    docs_collection = doc_metadata.docs_collection_name(_get_collection_name())
+    if docs_collection not in _loaded_doc_collections:
+        if not utility.has_collection(docs_collection, using="default"):
+            return None
+        Collection(docs_collection, using="default").load()
+        _loaded_doc_collections.add(docs_collection)
+    return Collection(docs_collection, using="default")
+
+
+def _fetch_doc_fields(doc_ids: list[int]) -> dict[int, dict[str, Any]]:
+    """按 doc_id 批量读取文档级字段（规范化布局回填用）。"""
+    coll = _get_docs_collection()
+    if coll is None:
+        return {}
+    rows = coll.query(
+        expr=_ids_to_milvus_expr("id", doc_ids),
+        output_fields=["id", *doc_metadata.DOC_LEVEL_FIELDS],
+        limit=len(doc_ids),
+    )
+    return {int(row["id"]): {f: row.get(f) or "" for f in doc_metadata.DOC_LEVEL_FIELDS} for row in rows}
+
+
+def _hydrate_doc_fields(results: Any) -> Any:
+    """规范化布局下为检索结果回填标题、摘要、作者等文档级字段（失败时原样返回）。"""
+    if not results or not doc_metadata.is_normalized_layout():
+        return results
+    with instrumentation.stage("retrieval.hydrate_doc_fields"):
+        try:
+            return doc_metadata.hydrate_results(results, _get_collection_name(), _fetch_doc_fields, _result_doc_id)
+        except Exception as e:
+            logger.warning(f"回填文档级字段失败: {e}")
+            return results
+
+
+def _doc_ids_matching(field: str, escaped_value: str) -> list[int]:
+    """规范化布局下把文档级字段的 like 过滤改为在文档级集合上解析出 doc_id（分页读取全部命中）。"""
+    coll = _get_docs_collection()
+    if coll is None:
+        return []
+    with instrumentation.stage("retrieval.doc_field_filter", field=field):
+        rows = doc_metadata.iter_query_rows(coll, f'{field} like "%{escaped_value}%"', ["id"])
+        return [int(row["id"]) for row in rows]
+
+
+def _coarse_to_fine_enabled(flag: bool | None) -> bool:
+    if flag is not None:
+        return flag
+    return is_truthy_env("RETRIEVAL_COARSE_TO_FINE", False)
+
+
+# 文档级集合是否覆盖 chunk 集合全部 doc_id 的核对结果：集合名 -> (核对时间, 是否覆盖)
+_docs_coverage: dict[str, tuple[float, bool]] = {}
+_docs_coverage_checking: set[str] = set()
+_docs_coverage_lock = threading.Lock()
+
+
+def _check_docs_coverage(collection_name: str) -> bool:
+    """扫描核对文档级集合是否含 chunk 集合中每个 doc_id 的记录（找到第一个缺失即返回 False）。"""
+    from pymilvus import Collection, utility
+
+    params = _get_milvus_connection_params()
+    if params:
+        _ensure_milvus_default_connection(params)
+    docs_collection = doc_metadata.docs_collection_name(collection_name)
+    if not utility.has_collection(docs_collection, using="default"):
+        return False
+    missing = doc_metadata.doc_ids_missing_from_docs(
+        Collection(collection_name, using="default"), Collection(docs_collection, using="default"), limit=1
+    )
+    if missing:
+        logger.warning(
+            f"文档级集合 {docs_collection} 缺少部分文档（如 doc_id={missing[0]}），两阶段检索暂不启用；"
+            f"请运行 backfill_doc_vectors.py 补写"
+        )
+    return not missing
+
+
+def _refresh_docs_coverage(collection_name: str) -> None:
+    try:
+        covered = _check_docs_coverage(collection_name)
+    except Exception as e:
+        logger.warning(f"核对文档级集合覆盖情况失败，按未覆盖处理: {e}")
+        covered = False
+    with _docs_coverage_lock:
+        _docs_coverage[collection_name] = (time.monotonic(), covered)
+        _docs_coverage_checking.discard(collection_name)
+
+
+def _docs_collection_covers_chunks(collection_name: str) -> bool:
+    """
+    文档级集合是否覆盖 chunk 集合的全部文档：升级前入库的论文没有文档级记录，此时粗筛会把它们排除在外。
+    结果缓存 RETRIEVAL_COARSE_COVERAGE_TTL_S 秒（默认 600），过期后在后台重新核对，核对完成前沿用上次结果；
+    首次核对完成前按未覆盖处理（单阶段检索）。
+    """
+    ttl = float(get_env_int("RETRIEVAL_COARSE_COVERAGE_TTL_S", 600))
+    with _docs_coverage_lock:
+        checked = _docs_coverage.get(collection_name)
+        if checked is not None and time.monotonic() - checked[0] < ttl:
+            return checked[1]
+        if collection_name not in _docs_coverage_checking:
+            _docs_coverage_checking.add(collection_name)
+            threading.Thread(
+                target=_refresh_docs_coverage, args=(collection_name,), name="docs-coverage", daemon=True
+            ).start()
+    return checked[1] if checked is not None else False
+
+
+def _coarse_doc_ids(
+    query_vector: list[float],
+    top_n: int,
+    doc_id: Union[int, List[int], None] = None,
+    kb_id: Union[int, List[int], None] = None,
+    security_level: Union[int, List[int], None] = None,
+) -> list[int]:
+    """
+    第一阶段：在文档级向量集合（{集合名}_docs，入库时写入）上检索与查询最相近的 top_n 篇文档，
+    kb_id / security_level / doc_id 过滤与 chunk 检索一致。集合不存在时返回空列表。
+    """
+    coll = _get_docs_collection()
+    if coll is None:
+        return []
+    conditions: list[str] = []
+    for field, val in (("id", doc_id), ("kb_id", kb_id), ("security_level", security_level)):
+        ids = _int_list_to_ids(val)
+        if ids is not None:
+            conditions.append(_ids_to_milvus_expr(field, ids))
+    hits = coll.search(
+        data=[query_vector],
+        anns_field="vector_content",
+        param={"metric_type": "IP", "params": {"ef": max(64, top_n)}},
+        limit=top_n,
+        expr=" and ".join(conditions) if conditions else None,
+    )
+    return [int(h.id) for h in hits[0]] if hits else []
+
+
+def _restrict_to_coarse_docs(
+    query_vector: list[float],
+    top_n: int | None,
+    doc_id: Union[int, List[int], None],
+    kb_id: Union[int, List[int], None],
+    security_level: Union[int, List[int], None],
+) -> Union[int, List[int], None]:
+    """
+    两阶段检索的 doc_id 过滤：返回第一阶段选出的候选文档；调用方给定的 doc_id 不多于 top_n 时无需粗筛，
+    文档级集合缺失、未覆盖全部文档、检索失败或无结果时原样返回 doc_id（退回单阶段检索）。
+    """
+    top_n = top_n or max(1, get_env_int("RETRIEVAL_COARSE_TOP_N", 50))
+    explicit = _int_list_to_ids(doc_id)
+    if explicit is not None and len(explicit) <= top_n:
+        return doc_id
+    if not _docs_collection_covers_chunks(_get_collection_name()):
+        return doc_id
+    with instrumentation.stage("retrieval.coarse_docs", top_n=top_n) as info:
+        try:
+            doc_ids = _coarse_doc_ids(query_vector, top_n, explicit, kb_id, security_level)
+        except Exception as e:
+            logger.warning(f"文档级粗筛失败，回退为单阶段检索: {e}")
+            doc_ids = []
+        info["doc_count"] = len(doc_ids)
+    return doc_ids or doc_id
+
+
 def _build_extra_params(**params: Any) -> dict[str, Any]:
     """组装 extra_params，过滤 None 值。"""
     return {k: v for k, v in params.items() if v is not None}
@@ -349,11 +777,35 @@ def _int_list_to_ids(val: Union[int, List[int], None]) -> None | list[int]:
 
 def _ids_to_milvus_expr(field: str, ids: list[int]) -> str:
     """将 doc_id/kb_id/security_level 的 ID 列表转为 Milvus 表达式。"""
+    if not ids:
+        return f"{field} in []"
     if len(ids) == 1:
         return f"{field} == {ids[0]}"
     return f"{field} in [{', '.join(str(x) for x in ids)}]"
 
 
+_COLLECTION_FIELD_CACHE: Dict[str, frozenset] = {}
+
+
+def _collection_field_names(collection_name: str) -> frozenset:
+    """读取集合 schema 的字段名（按集合缓存）；读取失败时返回空集合，不缓存。"""
+    cached = _COLLECTION_FIELD_CACHE.get(collection_name)
+    if cached is not None:
+        return cached
+    from pymilvus import Collection
+
+    params = _get_milvus_connection_params()
+    if params:
+        _ensure_milvus_default_connection(params)
+    try:
+        cached = frozenset(f.name for f in Collection(collection_name, using="default").schema.fields)
+    except Exception as e:
+        logger.warning(f"[_collection_field_names] 读取集合 {collection_name} schema 失败: {e}")
+        return frozenset()
+    _COLLECTION_FIELD_CACHE[collection_name] = cached
+    return cached
+
+
 def _build_metadata_filter(
     keyword_text: str | None = None,
     author: str | None = None,
@@ -361,19 +813,36 @@ def _build_metadata_filter(
     doc_id: Union[int, List[int], None] = None,
     kb_id: Union[int, List[int], None] = None,
     security_level: Union[int, List[int], None] = None,
+    min_structure_scores: Dict[str, float] | None = None,
 ) -> str | None:
-    """将 keyword_text、author、paper_title、doc_id、kb_id、security_level 组装为 Milvus 过滤表达式。"""
+    """
+    将 keyword_text、author、paper_title、doc_id、kb_id、security_level 组装为 Milvus 过滤表达式。
+    min_structure_scores 形如 {"table_score": 0.5}，按入库时预计算的结构得分下限过滤（未知字段忽略）。
+    """
     conditions: list[str] = []
+    like_filters: list[tuple[str, str]] = []
     if keyword_text and str(keyword_text).strip():
-        v = _escape_like_value(keyword_text.strip())
-        conditions.append(f'keywords_text like "%{v}%"')
+        like_filters.append(("keywords_text", _escape_like_value(keyword_text.strip())))
     if author and str(author).strip():
-        v = _escape_like_value(author.strip())
-        conditions.append(f'authors like "%{v}%"')
-    if paper_title and str(paper_title).strip():
-        v = _escape_like_value(paper_title.strip())
-        conditions.append(f'title like "%{v}%"')
+        like_filters.append(("authors", _escape_like_value(author.strip())))
     doc_ids = _int_list_to_ids(doc_id)
+    if paper_title and str(paper_title).strip():
+        # 标题索引精确 / 归一化 / 前缀命中时解析为 doc_id 整数过滤，模糊命中或未命中时回退为 like 扫描
+        title_doc_ids = resolve_title_doc_ids(paper_title.strip())
+        if title_doc_ids and doc_ids is None:
+            doc_ids = title_doc_ids
+        elif title_doc_ids and set(doc_ids) & set(title_doc_ids):
+            doc_ids = [x for x in doc_ids if x in set(title_doc_ids)]
+        else:
+            like_filters.append(("title", _escape_like_value(paper_title.strip())))
+    normalized = doc_metadata.is_normalized_layout()
+    for field, v in like_filters:
+        if normalized:
+            # 规范化布局下 chunk 不含文档级字段，先在文档级集合上解析为 doc_id
+            matched = set(_doc_ids_matching(field, v))
+            doc_ids = sorted(matched) if doc_ids is None else [x for x in doc_ids if x in matched]
+        else:
+            conditions.append(f'{field} like "%{v}%"')
     if doc_ids is not None:
         conditions.append(_ids_to_milvus_expr("doc_id", doc_ids))
     kb_ids = _int_list_to_ids(kb_id)
@@ -382,6 +851,17 @@ def _build_metadata_filter(
     sec_levels = _int_list_to_ids(security_level)
     if sec_levels is not None:
         conditions.append(_ids_to_milvus_expr("security_level", sec_levels))
+    structure_scores = {
+        field: threshold
+        for field, threshold in (min_structure_scores or {}).items()
+        if field in STRUCTURE_SCORE_FIELDS and threshold is not None
+    }
+    if structure_scores:
+        # 旧集合没有结构得分字段，过滤表达式引用不存在的字段会被 Milvus 拒绝，按 schema 忽略
+        available = _collection_field_names(_get_collection_name())
+        for field, threshold in structure_scores.items():
+            if field in available:
+                conditions.append(f"{field} >= {float(threshold)}")
     return " and ".join(conditions) if conditions else None
 
 
@@ -396,9 +876,17 @@ def semantic_search(
     doc_id: Union[int, List[int], None] = None,
     kb_id: Union[int, List[int], None] = None,
     security_level: Union[int, List[int], None] = None,
+    min_structure_scores: Dict[str, float] | None = None,
+    group_by_doc: bool = False,
+    group_size: int | None = None,
+    coarse_to_fine: bool | None = None,
+    coarse_top_n: int | None = None,
     **kwargs: Any,
 ):
-    """语义检索，Query 由本地嵌入模型自动转为向量，集合名称从 .env 获取。"""
+    """
+    语义检索，Query 由本地嵌入模型自动转为向量，集合名称从 .env 获取。
+    coarse_to_fine 为真时先在文档级向量上选出候选文档，再只在这些文档内检索 chunk。
+    """
     query_vector = _encode_query(query)
     req_kwargs: dict[str, Any] = {
         "query": query,
@@ -412,6 +900,8 @@ def semantic_search(
         req_kwargs["rerank_enabled"] = rerank_enabled
     if similarity_threshold is not None:
         req_kwargs["similarity_threshold"] = similarity_threshold
+    if _coarse_to_fine_enabled(coarse_to_fine) and not paper_title:
+        doc_id = _restrict_to_coarse_docs(query_vector, coarse_top_n, doc_id, kb_id, security_level)
     metadata_filter = _build_metadata_filter(
         keyword_text=keyword_text,
         author=author,
@@ -419,13 +909,24 @@ def semantic_search(
         doc_id=doc_id,
         kb_id=kb_id,
         security_level=security_level,
+        min_structure_scores=min_structure_scores,
     )
     if metadata_filter is not None:
         req_kwargs["milvus_expr"] = metadata_filter
 
+    if group_by_doc:
+        group_count, group_size, native = _prepare_doc_grouping(req_kwargs, SemanticSearchRequest, top_k, group_size)
+
     _apply_runtime_retriever_overrides(req_kwargs)
     req = SemanticSearchRequest(**req_kwargs)
-    return RetrieverService.semantic_search(req)
+    with _milvus_stage("semantic", req_kwargs) as info:
+        results = RetrieverService.semantic_search(req)
+        info["result_count"] = len(results) if results else 0
+    if group_by_doc:
+        # 原生分组结果同样经过一次合并，统一输出顺序并保证每篇文档不超过 M 条
+        with instrumentation.stage("retrieval.group_by_doc", native=native, candidates=len(results or [])):
+            results = _group_results_by_doc(results, group_count, group_size)
+    return _hydrate_doc_fields(results)
 
 
 def keyword_search(
@@ -438,6 +939,7 @@ def keyword_search(
     doc_id: Union[int, List[int], None] = None,
     kb_id: Union[int, List[int], None] = None,
     security_level: Union[int, List[int], None] = None,
+    min_structure_scores: Dict[str, float] | None = None,
     **kwargs: Any,
 ):
     """关键词检索，集合名称从 .env 获取。"""
@@ -455,6 +957,7 @@ def keyword_search(
         doc_id=doc_id,
         kb_id=kb_id,
         security_level=security_level,
+        min_structure_scores=min_structure_scores,
     )
     if metadata_filter is not None:
         req_kwargs["milvus_expr"] = metadata_filter
@@ -464,7 +967,10 @@ def keyword_search(
 
     _apply_runtime_retriever_overrides(req_kwargs)
     req = KeywordSearchRequest(**req_kwargs)
-    return RetrieverService.keyword_search(req)
+    with _milvus_stage("keyword", req_kwargs) as info:
+        results = RetrieverService.keyword_search(req)
+        info["result_count"] = len(results) if results else 0
+    return _hydrate_doc_fields(results)
 
 
 def hybrid_search(
@@ -480,6 +986,11 @@ def hybrid_search(
     doc_id: Union[int, List[int], None] = None,
     kb_id: Union[int, List[int], None] = None,
     security_level: Union[int, List[int], None] = None,
+    min_structure_scores: Dict[str, float] | None = None,
+    group_by_doc: bool = False,
+    group_size: int | None = None,
+    coarse_to_fine: bool | None = None,
+    coarse_top_n: int | None = None,
     **kwargs: Any,
 ):
     """混合检索（语义 + 关键词），Query 由本地嵌入模型自动转为向量，集合名称从 .env 获取，支持重排和阈值过滤。"""
@@ -496,6 +1007,8 @@ def hybrid_search(
         req_kwargs["rerank_enabled"] = rerank_enabled
     if similarity_threshold is not None:
         req_kwargs["similarity_threshold"] = similarity_threshold
+    if _coarse_to_fine_enabled(coarse_to_fine) and not paper_title:
+        doc_id = _restrict_to_coarse_docs(query_vector, coarse_top_n, doc_id, kb_id, security_level)
     metadata_filter = _build_metadata_filter(
         keyword_text=keyword_text,
         author=author,
@@ -503,6 +1016,7 @@ def hybrid_search(
         doc_id=doc_id,
         kb_id=kb_id,
         security_level=security_level,
+        min_structure_scores=min_structure_scores,
     )
     if metadata_filter is not None:
         req_kwargs["milvus_expr"] = metadata_filter
@@ -510,9 +1024,19 @@ def hybrid_search(
     if extra:
         req_kwargs["extra_params"] = extra
 
+    if group_by_doc:
+        group_count, group_size, native = _prepare_doc_grouping(req_kwargs, HybridSearchRequest, top_k, group_size)
+
     _apply_runtime_retriever_overrides(req_kwargs)
     req = HybridSearchRequest(**req_kwargs)
-    return RetrieverService.hybrid_search(req)
+    with _milvus_stage("hybrid", req_kwargs) as info:
+        results = RetrieverService.hybrid_search(req)
+        info["result_count"] = len(results) if results else 0
+    if group_by_doc:
+        # 原生分组结果同样经过一次合并，统一输出顺序并保证每篇文档不超过 M 条
+        with instrumentation.stage("retrieval.group_by_doc", native=native, candidates=len(results or [])):
+            results = _group_results_by_doc(results, group_count, group_size)
+    return _hydrate_doc_fields(results)
 
 
 def fulltext_search(
@@ -526,6 +1050,7 @@ def fulltext_search(
     doc_id: Union[int, List[int], None] = None,
     kb_id: Union[int, List[int], None] = None,
     security_level: Union[int, List[int], None] = None,
+    min_structure_scores: Dict[str, float] | None = None,
     **kwargs: Any,
 ):
     """全文检索，集合名称从 .env 获取。"""
@@ -543,6 +1068,7 @@ def fulltext_search(
         doc_id=doc_id,
         kb_id=kb_id,
         security_level=security_level,
+        min_structure_scores=min_structure_scores,
     )
     if metadata_filter is not None:
         req_kwargs["milvus_expr"] = metadata_filter
@@ -552,7 +1078,10 @@ def fulltext_search(
 
     _apply_runtime_retriever_overrides(req_kwargs)
     req = FulltextSearchRequest(**req_kwargs)
-    return RetrieverService.fulltext_search(req)
+    with _milvus_stage("fulltext", req_kwargs) as info:
+        results = RetrieverService.fulltext_search(req)
+        info["result_count"] = len(results) if results else 0
+    return _hydrate_doc_fields(results)
 
 
 def text_match_search(
@@ -566,6 +1095,7 @@ def text_match_search(
     doc_id: Union[int, List[int], None] = None,
     kb_id: Union[int, List[int], None] = None,
     security_level: Union[int, List[int], None] = None,
+    min_structure_scores: Dict[str, float] | None = None,
     **kwargs: Any,
 ):
     """文本匹配检索，集合名称从 .env 获取。"""
@@ -583,6 +1113,7 @@ def text_match_search(
         doc_id=doc_id,
         kb_id=kb_id,
         security_level=security_level,
+        min_structure_scores=min_structure_scores,
     )
     if metadata_filter is not None:
         req_kwargs["milvus_expr"] = metadata_filter
@@ -592,7 +1123,10 @@ def text_match_search(
 
     _apply_runtime_retriever_overrides(req_kwargs)
     req = TextMatchSearchRequest(**req_kwargs)
-    return RetrieverService.text_match_search(req)
+    with _milvus_stage("text_match", req_kwargs) as info:
+        results = RetrieverService.text_match_search(req)
+        info["result_count"] = len(results) if results else 0
+    return _hydrate_doc_fields(results)
 
 
 def phrase_match_search(
@@ -606,6 +1140,7 @@ def phrase_match_search(
     doc_id: Union[int, List[int], None] = None,
     kb_id: Union[int, List[int], None] = None,
     security_level: Union[int, List[int], None] = None,
+    min_structure_scores: Dict[str, float] | None = None,
     **kwargs: Any,
 ):
     """短语匹配检索，集合名称从 .env 获取。"""
@@ -623,6 +1158,7 @@ def phrase_match_search(
         doc_id=doc_id,
         kb_id=kb_id,
         security_level=security_level,
+        min_structure_scores=min_structure_scores,
     )
     if metadata_filter is not None:
         req_kwargs["milvus_expr"] = metadata_filter
@@ -632,4 +1168,7 @@ def phrase_match_search(
 
     _apply_runtime_retriever_overrides(req_kwargs)
     req = PhraseMatchSearchRequest(**req_kwargs)
-    return RetrieverService.phrase_match_search(req)
+    with _milvus_stage("phrase_match", req_kwargs) as info:
+        results = RetrieverService.phrase_match_search(req)
+        info["result_count"] = len(results) if results else 0
+    return _hydrate_doc_fields(results)
@@ -0,0 +1,294 @@
+"""论文标题解析索引：把查询 / 过滤条件中的论文标题映射为 doc_id。
+
+内存索引，按集合维护，支持：
+- 精确匹配：原始标题
+- 归一化匹配：NFKC、小写、去除空白与标点
+- 前缀匹配：归一化标题上的字典树，处理被截断的标题（《3D-MVP：…》）
+- 模糊匹配：归一化字符 3-gram 倒排，按提及文本的 n-gram 覆盖率打分
+索引在后台线程中由 loader 从 Milvus 全量加载，加载完成前查询不做标题解析；超过 RAG_TITLE_INDEX_TTL_S 后
+在后台重建，重建期间继续使用旧索引。本进程内的文档写入 / 删除通过 note_document_written /
+note_document_deleted 即时更新，重建期间的变更会在新索引替换旧索引前补上。
+模糊匹配只作为弱信号（resolve_query 单独返回 fuzzy_doc_ids），由调用方决定是否加权，不应直接作为硬过滤。
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.service.env_utils import get_env_float, is_truthy_env
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+# 查询中的标题提及：书名号、中文引号、英文引号
+_MENTION_RES = (
+    re.compile(r"《([^《》]{2,300})》"),
+    re.compile(r"“([^“”]{4,300})”"),
+    re.compile(r"\"([^\"]{4,300})\""),
+)
+_ELLIPSIS_RE = re.compile(r"(…+|\.{3,}|⋯+)\s*$")
+
+_NGRAM = 3
+_MIN_PREFIX_LEN = 4
+_MAX_MATCHES = 5
+_TERMINAL = "\0"
+# 精确 / 归一化 / 前缀匹配可以直接作为 doc_id 过滤；模糊匹配只用于排序加权
+STRICT_MATCHES = ("exact", "normalized", "prefix")
+
+
+def normalize_title(title: str) -> str:
+    """NFKC + 小写 + 去除空白与标点，用于归一化 / 前缀 / 模糊匹配。"""
+    return _NON_WORD_RE.sub("", unicodedata.normalize("NFKC", title or "").lower())
+
+
+def _ngrams(text: str) -> Set[str]:
+    if len(text) <= _NGRAM:
+        return {text} if text else set()
+    return {text[i:i + _NGRAM] for i in range(len(text) - _NGRAM + 1)}
+
+
+def extract_title_mentions(query: str) -> List[str]:
+    """提取查询中被书名号 / 引号括起的标题提及（去掉末尾省略号），按出现顺序去重。"""
+    mentions: List[str] = []
+    for pattern in _MENTION_RES:
+        for m in pattern.finditer(query or ""):
+            mention = _ELLIPSIS_RE.sub("", m.group(1)).strip()
+            if mention and mention not in mentions:
+                mentions.append(mention)
+    return mentions
+
+
+class TitleIndex:
+    """单个集合的标题索引（线程安全）。"""
+
+    def __init__(self, fuzzy_threshold: float = 0.6):
+        self.fuzzy_threshold = fuzzy_threshold
+        self._lock = threading.Lock()
+        self._titles: Dict[int, str] = {}
+        self._normalized: Dict[int, str] = {}
+        self._exact: Dict[str, Set[int]] = defaultdict(set)
+        self._by_normalized: Dict[str, Set[int]] = defaultdict(set)
+        self._trie: Dict[str, Any] = {}
+        self._grams: Dict[str, Set[int]] = defaultdict(set)
+        self.loaded_at: float = 0.0
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    def add(self, doc_id: int, title: str) -> None:
+        title = (title or "").strip()
+        if not title:
+            return
+        with self._lock:
+            if doc_id in self._titles:
+                if self._titles[doc_id] == title:
+                    return
+                self._remove_locked(doc_id)
+            norm = normalize_title(title)
+            self._titles[doc_id] = title
+            self._normalized[doc_id] = norm
+            self._exact[title].add(doc_id)
+            if not norm:
+                return
+            self._by_normalized[norm].add(doc_id)
+            node = self._trie
+            for ch in norm:
+                node = node.setdefault(ch, {})
+            node.setdefault(_TERMINAL, set()).add(doc_id)
+            for gram in _ngrams(norm):
+                self._grams[gram].add(doc_id)
+
+    def remove(self, doc_id: int) -> None:
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: int) -> None:
+        title = self._titles.pop(doc_id, None)
+        if title is None:
+            return
+        norm = self._normalized.pop(doc_id, "")
+        self._exact[title].discard(doc_id)
+        if not norm:
+            return
+        self._by_normalized[norm].discard(doc_id)
+        node = self._trie
+        for ch in norm:
+            node = node.get(ch)
+            if node is None:
+                break
+        else:
+            node.get(_TERMINAL, set()).discard(doc_id)
+        for gram in _ngrams(norm):
+            self._grams[gram].discard(doc_id)
+
+    def _prefix_locked(self, prefix: str) -> Set[int]:
+        node = self._trie
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return set()
+        found: Set[int] = set()
+        stack = [node]
+        while stack and len(found) <= _MAX_MATCHES:
+            cur = stack.pop()
+            for key, child in cur.items():
+                if key == _TERMINAL:
+                    found |= child
+                else:
+                    stack.append(child)
+        return found
+
+    def lookup(self, mention: str) -> Tuple[List[int], Optional[str]]:
+        """
+        依次尝试精确、归一化、前缀、模糊匹配，返回 (doc_ids, 匹配方式)；
+        前缀 / 模糊匹配到的文档过多（提及过于宽泛）时视为未命中。
+        """
+        mention = (mention or "").strip()
+        if not mention:
+            return [], None
+        norm = normalize_title(mention)
+        with self._lock:
+            hit = self._exact.get(mention)
+            if hit:
+                return sorted(hit), "exact"
+            if not norm:
+                return [], None
+            hit = self._by_normalized.get(norm)
+            if hit:
+                return sorted(hit), "normalized"
+            if len(norm) >= _MIN_PREFIX_LEN:
+                hit = self._prefix_locked(norm)
+                if 0 < len(hit) <= _MAX_MATCHES:
+                    return sorted(hit), "prefix"
+            grams = _ngrams(norm)
+            counts: Dict[int, int] = defaultdict(int)
+            for gram in grams:
+                for doc_id in self._grams.get(gram, ()):
+                    counts[doc_id] += 1
+        if not counts:
+            return [], None
+        # 覆盖率：提及的 n-gram 有多少出现在标题中（提及通常是标题的一部分）
+        scored = sorted(((c / len(grams), doc_id) for doc_id, c in counts.items()), reverse=True)
+        best = scored[0][0]
+        if best < self.fuzzy_threshold:
+            return [], None
+        matched = [doc_id for score, doc_id in scored if score >= best - 0.05][: _MAX_MATCHES + 1]
+        if len(matched) > _MAX_MATCHES:
+            return [], None
+        return sorted(matched), "fuzzy"
+
+    def resolve_query(self, query: str) -> Dict[str, Any]:
+        """
+        解析查询中的全部标题提及，返回 {"mentions": [{mention, doc_ids, match}], "doc_ids": [...], "fuzzy_doc_ids": [...]}；
+        doc_ids 只含精确 / 归一化 / 前缀匹配的文档，模糊匹配的文档放在 fuzzy_doc_ids。
+        """
+        mentions: List[Dict[str, Any]] = []
+        doc_ids: List[int] = []
+        fuzzy_doc_ids: List[int] = []
+        for mention in extract_title_mentions(query):
+            ids, match = self.lookup(mention)
+            mentions.append({"mention": mention, "doc_ids": ids, "match": match})
+            target = doc_ids if match in STRICT_MATCHES else fuzzy_doc_ids
+            for doc_id in ids:
+                if doc_id not in target:
+                    target.append(doc_id)
+        return {
+            "mentions": mentions,
+            "doc_ids": doc_ids,
+            "fuzzy_doc_ids": [x for x in fuzzy_doc_ids if x not in doc_ids],
+        }
+
+
+_registry_lock = threading.Lock()
+_indexes: Dict[str, TitleIndex] = {}
+# 正在后台重建的集合 -> 重建期间的写入 / 删除（("add", doc_id, title) / ("remove", doc_id, "")），替换前补到新索引
+_refreshing: Dict[str, List[Tuple[str, int, str]]] = {}
+# 首次加载失败的集合 -> 下次允许重试的时间（monotonic）
+_retry_after: Dict[str, float] = {}
+_RETRY_INTERVAL_S = 60.0
+
+
+def is_enabled() -> bool:
+    return is_truthy_env("RAG_TITLE_INDEX", True)
+
+
+def _ttl_seconds() -> float:
+    return get_env_float("RAG_TITLE_INDEX_TTL_S", 600.0)
+
+
+def _fuzzy_threshold() -> float:
+    return get_env_float("RAG_TITLE_FUZZY_THRESHOLD", 0.6)
+
+
+def get_title_index(collection: str, loader: Callable[[], Iterable[Tuple[int, str]]]) -> Optional[TitleIndex]:
+    """
+    获取集合的标题索引；未加载或超过 TTL 时在后台线程中调用 loader 全量重建，不阻塞调用方：
+    重建期间返回旧索引，首次加载完成前返回 None。loader 返回 (doc_id, title) 序列。
+    """
+    index = _indexes.get(collection)
+    now = time.monotonic()
+    if index is not None and now - index.loaded_at < _ttl_seconds():
+        return index
+    with _registry_lock:
+        if collection not in _refreshing and now >= _retry_after.get(collection, 0.0):
+            _refreshing[collection] = []
+            threading.Thread(
+                target=_rebuild, args=(collection, loader), name=f"title-index-{collection}", daemon=True
+            ).start()
+    return index
+
+
+def _rebuild(collection: str, loader: Callable[[], Iterable[Tuple[int, str]]]) -> None:
+    fresh = TitleIndex(fuzzy_threshold=_fuzzy_threshold())
+    try:
+        for doc_id, title in loader():
+            fresh.add(int(doc_id), title)
+    except Exception as e:
+        logger.warning(f"[title_index] 集合 {collection} 标题索引加载失败: {e}")
+        with _registry_lock:
+            _refreshing.pop(collection, None)
+            index = _indexes.get(collection)
+            if index is not None:
+                # 沿用旧索引，TTL 到期后再试
+                index.loaded_at = time.monotonic()
+            else:
+                _retry_after[collection] = time.monotonic() + _RETRY_INTERVAL_S
+        return
+    with _registry_lock:
+        for op, doc_id, title in _refreshing.pop(collection, []):
+            if op == "add":
+                fresh.add(doc_id, title)
+            else:
+                fresh.remove(doc_id)
+        fresh.loaded_at = time.monotonic()
+        _indexes[collection] = fresh
+        _retry_after.pop(collection, None)
+    logger.info(f"[title_index] 集合 {collection} 标题索引已加载: {len(fresh)} 篇")
+
+
+def _note(collection: str, op: str, doc_id: int, title: str) -> None:
+    with _registry_lock:
+        journal = _refreshing.get(collection)
+        if journal is not None:
+            journal.append((op, doc_id, title))
+        index = _indexes.get(collection)
+    if index is not None:
+        if op == "add":
+            index.add(doc_id, title)
+        else:
+            index.remove(doc_id)
+
+
+def note_document_written(collection: str, doc_id: int, title: str) -> None:
+    """文档写入后更新已加载 / 正在重建的索引（未加载时无需处理，首次加载会包含该文档）。"""
+    _note(collection, "add", int(doc_id), title)
+
+
+def note_document_deleted(collection: str, doc_id: int) -> None:
+    _note(collection, "remove", int(doc_id), "")
@@ -0,0 +1,122 @@
+"""上传文件落盘暂存。
+
+索引接口不再把每个上传文件整体读入内存、解码为 str 并在整个入库期间持有：上传内容按
+UPLOAD_SPOOL_CHUNK_BYTES 分块写入临时目录（UPLOAD_SPOOL_DIR，默认系统临时目录），入库流水线在解析阶段
+才按需读取单个文件，处理完即释放。内存峰值取决于流水线并发度与队列长度，而不是一批上传的文件数。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from app.service.env_utils import get_env_int
+
+_SPOOLED_KEY = "__spooled_upload__"
+
+
+class SpooledUpload:
+    """已落盘的上传文件：原始文件名与暂存路径。"""
+
+    def __init__(self, filename: str, path: Path, size: int = 0):
+        self.filename = filename
+        self.path = Path(path)
+        self.size = size
+
+    def read_bytes(self) -> bytes:
+        return self.path.read_bytes()
+
+    def read_text(self) -> str:
+        return self.path.read_text(encoding="utf-8")
+
+    def __repr__(self) -> str:
+        return f"SpooledUpload({self.filename!r}, {self.size} bytes)"
+
+
+def _chunk_bytes() -> int:
+    return max(64 * 1024, get_env_int("UPLOAD_SPOOL_CHUNK_BYTES", 1024 * 1024))
+
+
+class UploadSpool:
+    """
+    一次请求的暂存目录：add 把上传文件分块写入磁盘，close（或退出 with）时删除整个目录。
+    转交给异步索引任务的文件由任务接管（adopt 移入任务目录），不受 close 影响。
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        base = root or os.getenv("UPLOAD_SPOOL_DIR", "").strip() or None
+        if base:
+            Path(base).mkdir(parents=True, exist_ok=True)
+        self.dir = Path(tempfile.mkdtemp(prefix="upload_spool_", dir=base))
+        self._count = 0
+
+    async def add(self, upload: Any, default_name: str = "unknown") -> SpooledUpload:
+        """分块读取 upload（需有 async read(size) 与 filename），写入暂存目录；保留原扩展名以便按格式解析。"""
+        filename = getattr(upload, "filename", None) or default_name
+        path = self.dir / f"{self._count:06d}{Path(filename).suffix.lower()}"
+        self._count += 1
+        chunk_size = _chunk_bytes()
+        size = 0
+        with path.open("wb") as fh:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                await asyncio.to_thread(fh.write, chunk)
+                size += len(chunk)
+        return SpooledUpload(filename, path, size)
+
+    def close(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self) -> "UploadSpool":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def read_text(content: Union[str, SpooledUpload]) -> str:
+    """入库解析阶段读取文件内容：已落盘的上传按 UTF-8 读取，普通字符串原样返回。"""
+    return content.read_text() if isinstance(content, SpooledUpload) else content
+
+
+def adopt(item: Any, directory: Path) -> Any:
+    """把 item 中引用的暂存文件移入 directory（异步索引任务接管上传文件），返回更新路径后的 item。"""
+    if isinstance(item, SpooledUpload):
+        directory.mkdir(parents=True, exist_ok=True)
+        target = directory / item.path.name
+        shutil.move(str(item.path), target)
+        return SpooledUpload(item.filename, target, item.size)
+    if isinstance(item, (list, tuple)):
+        return [adopt(x, directory) for x in item]
+    if isinstance(item, dict):
+        return {k: adopt(v, directory) for k, v in item.items()}
+    return item
+
+
+def to_jsonable(item: Any) -> Any:
+    """序列化入库 item：暂存文件记为 {"__spooled_upload__": [文件名, 路径, 大小]}。"""
+    if isinstance(item, SpooledUpload):
+        return {_SPOOLED_KEY: [item.filename, str(item.path), item.size]}
+    if isinstance(item, (list, tuple)):
+        return [to_jsonable(x) for x in item]
+    if isinstance(item, dict):
+        return {k: to_jsonable(v) for k, v in item.items()}
+    return item
+
+
+def from_jsonable(obj: Any) -> Any:
+    if isinstance(obj, list):
+        return [from_jsonable(x) for x in obj]
+    if isinstance(obj, dict):
+        if set(obj) == {_SPOOLED_KEY}:
+            filename, path, size = obj[_SPOOLED_KEY]
+            return SpooledUpload(filename, Path(path), int(size))
+        return {k: from_jsonable(v) for k, v in obj.items()}
+    return obj
+
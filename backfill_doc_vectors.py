@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+为文档级集合（{COLLECTION_NAME}_docs）补写缺失的文档记录。
+
+文档级集合建在已有数据的 chunk 集合上时（升级到文档级向量之前已入库的论文），这些论文没有文档级记录，
+两阶段检索（RETRIEVAL_COARSE_TO_FINE）在补写完成前退回单阶段检索。
+本脚本从 chunk 集合读取这些论文的 chunk 向量与文档级字段，按入库时相同的规则生成文档记录写入；
+可重复运行，每次只补写仍缺失的文档。
+
+用法：
+    python backfill_doc_vectors.py --collection papers_chunks
+"""
+
+import argparse
+import json
+import logging
+
+from app.service import index_service
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="为文档级集合补写升级前入库文档的记录")
+    parser.add_argument("--collection", type=str, default=None, help="chunk 集合，默认取 COLLECTION_NAME")
+    parser.add_argument("--batch-docs", type=int, default=64, help="每批读取的文档数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    summary = index_service.backfill_doc_vector_collection(args.collection, batch_docs=args.batch_docs)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
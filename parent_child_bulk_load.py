@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+离线批量入库：初次灌库时替代逐批 HTTP 上传（parent_child_index_from_json.py）。
+
+分两步运行，均可中断后重跑续传（进度记录在输出目录的 manifest.json）：
+1. export：在本机完成父子切片、向量编码，写为列式分片（格式见 app/service/bulk_load.py），
+   不连接 Milvus / BaseDB
+2. load：把分片加载到 Milvus 集合
+   - --mode insert（默认）：本地读取分片大批量写入
+   - --mode import：逐个分片在分片目录下生成 Milvus 行式 JSON 后走 Milvus bulk import。
+     输出目录必须是 Milvus 可读取的存储（如挂载到本机的 MinIO / S3 存储桶），
+     --remote-prefix 为输出目录在存储桶中的路径
+
+注意：离线模式不写 BaseDB（文档与切片表），doc_id 由文件名与正文哈希生成。
+
+用法：
+    python parent_child_bulk_load.py export --input-dir ./json --output-dir ./bulk --kb-id 1
+    python parent_child_bulk_load.py load --output-dir ./bulk --collection papers_chunks
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+
+from app.service import index_service
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="离线批量入库：导出列式分片 / 加载到 Milvus")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="本地切片、编码并导出分片")
+    export_parser.add_argument("--input-dir", type=str, required=True, help="JSON 文件所在目录")
+    export_parser.add_argument("--output-dir", type=str, required=True, help="分片与 manifest.json 输出目录")
+    export_parser.add_argument("--kb-id", type=int, default=1, help="知识库 ID")
+    export_parser.add_argument("--pattern", type=str, default="*.json", help="输入文件匹配模式")
+
+    load_parser = sub.add_parser("load", help="把导出的分片加载到 Milvus")
+    load_parser.add_argument("--output-dir", type=str, required=True, help="export 的输出目录")
+    load_parser.add_argument("--collection", type=str, default=None, help="目标集合，默认取 COLLECTION_NAME")
+    load_parser.add_argument("--mode", choices=["insert", "import"], default="insert", help="加载方式")
+    load_parser.add_argument("--remote-prefix", type=str, default="", help="import 模式下输出目录在 Milvus 存储桶中的路径")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "export":
+        summary = asyncio.run(
+            index_service.export_bulk_shards(args.kb_id, args.input_dir, args.output_dir, pattern=args.pattern)
+        )
+    else:
+        summary = index_service.load_bulk_shards(
+            args.output_dir,
+            collection_name=args.collection,
+            mode=args.mode,
+            remote_prefix=args.remote_prefix,
+        )
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
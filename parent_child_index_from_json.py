@@ -11,16 +11,35 @@
 2. 调用 /api/v1/index/build 接口上传
 3. 服务端完成 ChunkerService parent_child 切片、多向量编码及存储
 
+--use-jobs 时改为调用 /api/v1/index/jobs/build_json 提交异步任务，轮询任务进度直至结束，
+请求不再长时间阻塞；任务失败或中断后可调用 /api/v1/index/jobs/{job_id}/resume 续跑。
+
 依赖：
     pip install requests
 """
 
 import argparse
+import time
 from pathlib import Path
 
 import requests
 
 
+def wait_for_job(job_url: str, poll_interval: float) -> dict:
+    """轮询异步任务直到结束，打印进度。"""
+    while True:
+        resp = requests.get(job_url, timeout=60)
+        resp.raise_for_status()
+        job = resp.json()
+        print(
+            f"任务 {job['job_id']} {job['status']}: 文档 {job['done_documents']}/{job['total_documents']}，"
+            f"chunk {job['done_chunks']}，{job.get('docs_per_s')} 篇/秒，预计剩余 {job.get('eta_s')} 秒"
+        )
+        if job["status"] in ("completed", "failed", "cancelled"):
+            return job
+        time.sleep(poll_interval)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="调用 /api/v1/index/build 接口，从本地 JSON 目录构建知识库",
@@ -43,6 +62,17 @@ def main() -> None:
         default="http://192.168.1.5:5010/api/v1/index/build_json",
         help="索引构建接口地址",
     )
+    parser.add_argument(
+        "--use-jobs",
+        action="store_true",
+        help="提交异步索引任务并轮询进度（接口地址中的 /index/build_json 替换为 /index/jobs/build_json）",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=10.0,
+        help="--use-jobs 时查询任务进度的间隔秒数",
+    )
 
     args = parser.parse_args()
 
@@ -71,6 +101,19 @@ def main() -> None:
 
         print(f"正在上传第 {batch_idx + 1}/{len(batches)} 批（{len(batch)} 个文件）...")
         try:
+            if args.use_jobs:
+                jobs_url = args.api_url.replace("/index/build_json", "/index/jobs/build_json")
+                resp = requests.post(jobs_url, data=data, files=files, timeout=600)
+                resp.raise_for_status()
+                job_id = resp.json()["job_id"]
+                job_url = jobs_url.replace("/index/jobs/build_json", f"/index/jobs/{job_id}")
+                result = wait_for_job(job_url, args.poll_interval)
+                if result["status"] != "completed":
+                    raise RuntimeError(f"任务 {job_id} 未完成: {result['status']} {result.get('error')}")
+                print(f"第 {batch_idx + 1} 批构建完成: {result}")
+                if result.get("skipped_files"):
+                    print(f"跳过文件: {result['skipped_files']}")
+                continue
             resp = requests.post(
                 args.api_url,
                 data=data,
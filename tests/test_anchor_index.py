@@ -0,0 +1,20 @@
+"""anchor_index：入库时的锚点与事实句抽取。"""
+
+from app.service.anchor_index import extract_chunk_facts
+
+
+def test_decimal_not_split_into_sentences():
+    facts = extract_chunk_facts("ACAttack reaches 85.3 mAP on the benchmark. Other methods lag behind.")
+    assert facts["sentences"] == ["ACAttack reaches 85.3 mAP on the benchmark."]
+
+
+def test_version_anchor_kept_with_its_value():
+    facts = extract_chunk_facts("SAM2.1 achieves 0.75 IoU on DAVIS; the baseline reaches 0.61 IoU.")
+    assert "SAM2.1" in facts["anchors"]
+    assert facts["sentences"][0] == "SAM2.1 achieves 0.75 IoU on DAVIS;"
+
+
+def test_chinese_punctuation_splits_without_space():
+    facts = extract_chunk_facts("ACAttack 的 s = 5。其余参数沿用默认值。")
+    assert facts["sentences"] == ["ACAttack 的 s = 5。"]
+    assert facts["key_facts"] == ["s = 5"]
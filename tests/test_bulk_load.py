@@ -0,0 +1,53 @@
+"""bulk_load：列式分片的写出、读回与行式 JSON。"""
+
+import json
+
+import pytest
+
+from app.service import bulk_load
+
+
+def _records():
+    return [
+        {"id": 1, "doc_id": 10, "content": "短", "score": 0.5, "flag": True, "vector_content": [0.1, 0.2]},
+        {"id": 2, "doc_id": 10, "content": "很长的正文 " * 50, "score": 0.25, "flag": False, "vector_content": [0.3, 0.4]},
+        {"id": 3, "doc_id": 11, "content": "", "score": 1.0, "flag": True, "vector_content": [0.5, 0.6]},
+    ]
+
+
+def test_shard_round_trip(tmp_path):
+    manifest = bulk_load.BulkManifest(tmp_path)
+    writer = bulk_load.ShardWriter(manifest, max_records=100)
+    docs = [{"id": 10, "title": "论文 A", "meta": {"k": 1}}, {"id": 11, "title": "B", "meta": {"k": 2}}]
+    writer.add("a.json", _records()[:2], docs[0])
+    writer.add("b.json", _records()[2:], docs[1])
+    writer.flush()
+
+    shard_dir = tmp_path / "shard_00000"
+    records = bulk_load.read_shard_records(shard_dir)
+    assert [r["content"] for r in records] == [r["content"] for r in _records()]
+    assert [r["id"] for r in records] == [1, 2, 3]
+    assert records[1]["flag"] is False
+    assert records[0]["vector_content"] == pytest.approx([0.1, 0.2])
+    assert bulk_load.read_shard_records(shard_dir, bulk_load.DOC_PART) == docs
+    assert manifest.shards()[0]["state"] == bulk_load.SHARD_PENDING
+    assert manifest.is_file_done("a.json") and manifest.is_file_done("b.json")
+
+
+def test_strings_stored_variable_length(tmp_path):
+    """字符串列按实际 UTF-8 字节存储，不按最长值补齐。"""
+    records = [{"id": i, "content": "x"} for i in range(99)] + [{"id": 99, "content": "y" * 10000}]
+    bulk_load._write_columns(tmp_path, records)
+    data = (tmp_path / "content.utf8.npy").stat().st_size
+    assert data < 11000
+
+
+def test_attach_doc_fields_and_rows_json(tmp_path):
+    records = bulk_load.attach_doc_fields(_records(), [{"id": 10, "title": "A"}, {"id": 11, "title": "B"}], ["title"])
+    assert [r["title"] for r in records] == ["A", "A", "B"]
+
+    path = tmp_path / "chunks.rows.json"
+    assert bulk_load.write_rows_json(path, records, {"id", "title"}) == 3
+    rows = json.loads(path.read_text(encoding="utf-8"))["rows"]
+    assert rows == [{"id": 1, "title": "A"}, {"id": 2, "title": "A"}, {"id": 3, "title": "B"}]
+
@@ -0,0 +1,43 @@
+"""两阶段检索：文档级集合只覆盖部分文档时不做粗筛。"""
+
+import time
+
+import pytest
+
+from app.service import doc_metadata, retrieval_service
+
+
+class FakeCollection:
+    """按 offset / limit 翻页的 query（不提供 query_iterator）。"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def query(self, expr, output_fields, offset=0, limit=16384):
+        return [{k: r[k] for k in output_fields} for r in self.rows[offset:offset + limit]]
+
+
+CHUNKS = FakeCollection([{"doc_id": d} for d in (1, 1, 2, 2, 3)])
+DOCS_PARTIAL = FakeCollection([{"id": 3}])  # 只有升级后入库的文档
+DOCS_FULL = FakeCollection([{"id": d} for d in (1, 2, 3)])
+
+
+def test_doc_ids_missing_from_docs():
+    assert doc_metadata.doc_ids_missing_from_docs(CHUNKS, DOCS_PARTIAL) == [1, 2]
+    assert len(doc_metadata.doc_ids_missing_from_docs(CHUNKS, DOCS_PARTIAL, limit=1)) == 1
+    assert doc_metadata.doc_ids_missing_from_docs(CHUNKS, DOCS_FULL) == []
+
+
+@pytest.mark.parametrize("docs, covered", [(DOCS_PARTIAL, False), (DOCS_FULL, True)])
+def test_partly_populated_docs_collection_disables_coarse(monkeypatch, docs, covered):
+    collections = {"papers": CHUNKS, doc_metadata.docs_collection_name("papers"): docs}
+    monkeypatch.setattr("pymilvus.Collection", lambda name, using=None: collections[name])
+    monkeypatch.setattr("pymilvus.utility.has_collection", lambda name, using=None: name in collections)
+    monkeypatch.setattr(retrieval_service, "_get_milvus_connection_params", lambda: None)
+    monkeypatch.setattr(retrieval_service, "_get_collection_name", lambda: "papers")
+    monkeypatch.setattr(retrieval_service, "_coarse_doc_ids", lambda *a, **k: [3])
+
+    assert retrieval_service._check_docs_coverage("papers") is covered
+    monkeypatch.setitem(retrieval_service._docs_coverage, "papers", (time.monotonic(), covered))
+    restricted = retrieval_service._restrict_to_coarse_docs([0.0], 10, None, None, None)
+    assert restricted == ([3] if covered else None)
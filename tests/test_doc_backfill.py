@@ -0,0 +1,57 @@
+"""backfill_doc_vector_collection：为升级前入库的文档补写文档级记录。"""
+
+import types
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+from app.service import doc_metadata, index_service  # noqa: E402
+
+
+class _FakeCollection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def load(self):
+        pass
+
+    def query(self, expr, output_fields, offset=0, limit=16384):
+        rows = self.rows
+        if expr.startswith("doc_id in"):
+            wanted = {int(x) for x in expr[expr.index("[") + 1:expr.index("]")].split(",")}
+            rows = [r for r in rows if r["doc_id"] in wanted]
+        return [{k: r.get(k) for k in output_fields} for r in rows[offset:offset + limit]]
+
+
+def _chunk(doc_id, vec):
+    return {"doc_id": doc_id, "kb_id": 1, "security_level": 0, "vector_content": vec, "title": f"paper {doc_id}"}
+
+
+def test_backfill_writes_only_missing_docs(monkeypatch):
+    chunks = _FakeCollection(
+        [_chunk(1, [1.0, 0.0]), _chunk(1, [0.0, 1.0]), _chunk(2, [0.0, 0.0]), _chunk(3, [1.0, 1.0])]
+    )
+    docs = _FakeCollection([{"id": 3}])  # 只有升级后入库的文档
+    collections = {"papers": chunks, doc_metadata.docs_collection_name("papers"): docs}
+    inserted = []
+    monkeypatch.setenv("DOC_VECTOR_SOURCE", "centroid")
+    monkeypatch.setenv("EMBEDDING_DIM", "2")
+    monkeypatch.setattr(index_service, "_load_milvus_env", lambda: None)
+    monkeypatch.setattr(index_service, "_connect_milvus", lambda: None)
+    monkeypatch.setattr(index_service, "utility", types.SimpleNamespace(has_collection=lambda name, using=None: True))
+    monkeypatch.setattr(index_service, "_get_embedding_model", lambda: object())
+    monkeypatch.setattr(index_service, "ensure_parent_child_collection", lambda name, dim: None)
+    monkeypatch.setattr(index_service, "_get_milvus_collection", lambda name: collections[name])
+    monkeypatch.setattr(index_service, "_get_collection_field_names", lambda name: frozenset(_chunk(0, []).keys()))
+    monkeypatch.setattr(index_service, "_milvus_insert", lambda name, records: inserted.extend(records))
+    monkeypatch.setattr(index_service.milvus_writer, "flush_and_compact", lambda *a, **k: None)
+
+    summary = index_service.backfill_doc_vector_collection("papers", batch_docs=1)
+
+    # doc 2 只有零向量，默认布局下不写文档级记录
+    assert summary["missing_docs"] == 2 and summary["written_docs"] == 1 and summary["skipped_docs"] == 1
+    assert [r["id"] for r in inserted] == [1]
+    assert inserted[0]["title"] == "paper 1"
+    assert inserted[0]["vector_content"] == pytest.approx([2 ** -0.5, 2 ** -0.5])
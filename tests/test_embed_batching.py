@@ -0,0 +1,25 @@
+"""embed_batching：按长度排序、按 token 预算切批。"""
+
+from app.service.embed_batching import estimate_tokens, plan_batches
+
+
+def test_plan_batches_respects_budget_and_covers_all():
+    lengths = [10, 200, 30, 200, 5, 50, 120]
+    batches = plan_batches(lengths, budget=400, max_batch=3)
+
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) <= 3
+        assert len(batch) == 1 or max(lengths[i] for i in batch) * len(batch) <= 400
+    # 从长到短：第一批是两条最长的
+    assert sorted(batches[0]) == [1, 3]
+
+
+def test_plan_batches_oversized_item_gets_own_batch():
+    assert plan_batches([1000, 1], budget=100, max_batch=8) == [[0], [1]]
+    assert plan_batches([], budget=100, max_batch=8) == []
+
+
+def test_estimate_tokens_truncates_to_max_seq_length():
+    assert estimate_tokens("中文字符", None) == 4 + 2
+    assert estimate_tokens("x" * 4000, 512) == 512
@@ -0,0 +1,15 @@
+"""evidence_selector：按相关性下限、分数断层与文档覆盖选取证据。"""
+
+from app.service.rag.evidence_selector import select_evidence
+
+
+def test_score_gap_cut():
+    selected, stats = select_evidence([0.9, 0.88, 0.86, 0.3, 0.29], ["a", "a", "a", "a", "a"], max_k=5, min_k=1)
+    assert selected == [0, 1, 2]
+    assert stats["cut"] in ("score_gap", "relevance_floor")
+
+
+def test_non_positive_min_k_keeps_at_least_one():
+    for min_k in (0, -3):
+        selected, _ = select_evidence([0.9, 0.2, 0.19, 0.18], ["a", "a", "a", "a"], max_k=4, min_k=min_k)
+        assert selected and selected[0] == 0
@@ -0,0 +1,104 @@
+"""IndexJobManager：checkpoint 恢复、worker 容错与上传文件清理。"""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+from app.service import index_jobs  # noqa: E402
+
+
+class _FakeBuilder:
+    """按调用记录参数的入库函数：逐个回调 created / done，fail_at 指定在哪个文件处抛出。"""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.calls = []
+
+    async def __call__(self, kb_id, items, *, skip_base_db, on_document_done, cancelled, on_document_created, resume_doc_ids):
+        self.calls.append({"items": list(items), "resume_doc_ids": dict(resume_doc_ids)})
+        for pos, item in enumerate(items):
+            doc_id = resume_doc_ids.get(pos, 1000 + int(item[0]))
+            on_document_created(pos, doc_id)
+            if self.fail_at is not None and item[0] == self.fail_at:
+                raise RuntimeError("boom")
+            on_document_done(pos, {"filename": item[0], "doc_id": doc_id, "chunks": 2})
+        return {"skipped_files": []}
+
+
+async def _wait(job):
+    while job.status in (index_jobs.JOB_QUEUED, index_jobs.JOB_RUNNING):
+        await asyncio.sleep(0.01)
+
+
+def _items(n):
+    return [(str(i), "{}") for i in range(n)]
+
+
+def test_resume_reuses_created_doc_ids(tmp_path, monkeypatch):
+    builder = _FakeBuilder(fail_at="2")
+    monkeypatch.setitem(index_jobs._BUILDERS, "json", builder)
+
+    async def run():
+        manager = index_jobs.IndexJobManager(tmp_path, workers=1)
+        job = await manager.submit("json", 1, _items(4))
+        await _wait(job)
+        assert job.status == index_jobs.JOB_FAILED
+        assert sorted(job.checkpoints) == [0, 1]
+
+        builder.fail_at = None
+        manager.resume(job.job_id)
+        await _wait(job)
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == index_jobs.JOB_COMPLETED
+    # 第二轮只处理未完成的文件，文件 2 沿用上次创建的 doc_id
+    assert [item[0] for item in builder.calls[1]["items"]] == ["2", "3"]
+    assert builder.calls[1]["resume_doc_ids"] == {0: 1002}
+    reloaded = index_jobs.IndexJob(job.job_dir, {"job_id": job.job_id, "kind": "json", "kb_id": 1, "total_documents": 4})
+    assert sorted(reloaded.checkpoints) == [0, 1, 2, 3]
+    assert reloaded.resume_doc_ids() == {}
+
+
+def test_worker_survives_broken_job(tmp_path, monkeypatch):
+    monkeypatch.setitem(index_jobs._BUILDERS, "json", _FakeBuilder())
+
+    async def run():
+        manager = index_jobs.IndexJobManager(tmp_path, workers=1)
+        bad = await manager.submit("json", 1, _items(1))
+        bad.inputs_path.unlink()
+        good = await manager.submit("json", 1, _items(2))
+        await _wait(bad)
+        await _wait(good)
+        return bad, good
+
+    bad, good = asyncio.run(run())
+    assert bad.status == index_jobs.JOB_FAILED
+    assert good.status == index_jobs.JOB_COMPLETED
+
+
+def test_uploads_purged_after_completion_and_ttl(tmp_path, monkeypatch):
+    monkeypatch.setitem(index_jobs._BUILDERS, "json", _FakeBuilder(fail_at="0"))
+
+    async def run():
+        manager = index_jobs.IndexJobManager(tmp_path, workers=1)
+        job = await manager.submit("json", 1, _items(1))
+        job.uploads_dir.mkdir()
+        await _wait(job)
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == index_jobs.JOB_FAILED
+    assert job.uploads_dir.exists()
+
+    job.finished_at = time.time() - 10
+    job.save()
+    monkeypatch.setenv("INDEX_JOB_UPLOAD_TTL_S", "1")
+    manager = index_jobs.IndexJobManager(tmp_path, workers=1)
+    assert not job.uploads_dir.exists()
+    with pytest.raises(ValueError):
+        manager.resume(job.job_id)
@@ -0,0 +1,54 @@
+"""ingest_pipeline：文件级失败隔离、批处理与出错时的取消。"""
+
+import asyncio
+
+import pytest
+
+from app.service.ingest_pipeline import PipelineStage, SkipItem, run_pipeline
+
+
+def test_failures_isolated_per_item():
+    async def parse(x):
+        if x == 3:
+            raise SkipItem("empty")
+        if x == 5:
+            raise ValueError("bad")
+        return x * 10
+
+    async def double(batch):
+        return [ValueError("odd") if x == 70 else x * 2 for x in batch]
+
+    stages = [PipelineStage("parse", parse, 2), PipelineStage("double", double, batch_weight=4, max_wait_s=0.01)]
+    result = asyncio.run(run_pipeline(range(8), stages, queue_size=2))
+
+    assert sorted(result.completed) == [0, 20, 40, 80, 120]
+    assert sorted((item, stage) for item, stage, _ in result.failed) == [(3, "parse"), (5, "parse"), (70, "double")]
+
+
+def test_batch_output_length_mismatch_fails_batch():
+    async def drop_one(batch):
+        return batch[:-1]
+
+    stages = [PipelineStage("drop", drop_one, batch_weight=10, max_wait_s=0.05)]
+    result = asyncio.run(run_pipeline([1, 2, 3], stages))
+
+    assert result.completed == []
+    assert sorted(item for item, _, _ in result.failed) == [1, 2, 3]
+
+
+def test_error_cancels_other_workers():
+    def items():
+        yield 1
+        raise RuntimeError("input broken")
+
+    async def slow(x):
+        await asyncio.sleep(10)
+        return x
+
+    async def run():
+        with pytest.raises(RuntimeError, match="input broken"):
+            await asyncio.wait_for(run_pipeline(items(), [PipelineStage("slow", slow, 2)], queue_size=1), 5)
+        await asyncio.sleep(0)
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,71 @@
+"""延迟预算用尽时的回答：不把打包后的原始证据当作回答返回。"""
+
+from app.service.rag import RAG_flow
+
+
+PACKED_EVIDENCE = "[证据 1] score=0.91 doc=paper 1\ns = 5 in ACAttack"
+FUSED_ANSWER = "ACAttack 中 s = 5（融合结果）。"
+
+
+class _FakeDeepSeek:
+    def __init__(self, response="ACAttack 中 s = 5。"):
+        self.response = response
+        self.calls = []
+
+    def chat_completion(self, messages, stage="llm", max_tokens=None):
+        self.calls.append({"stage": stage, "max_tokens": max_tokens})
+        return self.response
+
+
+def _engine(monkeypatch, deepseek, fused):
+    engine = RAG_flow.RAGFlow.__new__(RAG_flow.RAGFlow)
+    engine.deepseek = deepseek
+    engine.max_iterations = 3
+    engine.max_rewrite_rounds = 2
+    engine.speculative_rewrite = False
+    engine.speculative_prefetch = False
+    monkeypatch.setattr(RAG_flow.retrieval_service, "resolve_query_titles", lambda q: {"mentions": [], "doc_ids": [], "fuzzy_doc_ids": []})
+    monkeypatch.setattr(engine, "decompose_query", lambda q: ([q], {}), raising=False)
+    monkeypatch.setattr(engine, "_lookup_anchor_facts", lambda *a, **k: {}, raising=False)
+    monkeypatch.setattr(engine, "retrieve_documents", lambda *a, **k: ([object()], {}), raising=False)
+
+    def summarize(query, results, ctx=None):
+        # fused=False 模拟预算紧张时跳过融合、返回打包后的证据；两种情况下期间截止时间都已过
+        ctx.budget.deadline_ms = 0
+        if fused:
+            ctx.evidence_store.fused_info = FUSED_ANSWER
+            return FUSED_ANSWER
+        return PACKED_EVIDENCE
+
+    monkeypatch.setattr(engine, "summarize_and_aggregate", summarize, raising=False)
+    return engine
+
+
+def test_expired_budget_generates_instead_of_returning_evidence(monkeypatch):
+    deepseek = _FakeDeepSeek()
+    engine = _engine(monkeypatch, deepseek, fused=False)
+
+    response, trace = engine.run("ACAttack 的 s 是多少？", return_trace=True, latency_tier="interactive")
+
+    assert response == "ACAttack 中 s = 5。"
+    assert deepseek.calls == [{"stage": "generation", "max_tokens": RAG_flow._BEST_EFFORT_MAX_TOKENS}]
+    assert "return_best_effort" in [d["action"] for d in trace["budget"]["decisions"]]
+
+
+def test_expired_budget_returns_real_fused_answer_without_llm(monkeypatch):
+    deepseek = _FakeDeepSeek()
+    engine = _engine(monkeypatch, deepseek, fused=True)
+
+    assert engine.run("ACAttack 的 s 是多少？", latency_tier="interactive") == FUSED_ANSWER
+    assert deepseek.calls == []
+
+
+def test_expired_budget_generation_failure_falls_back_to_last_fused(monkeypatch):
+    engine = _engine(monkeypatch, _FakeDeepSeek(response=None), fused=False)
+    ctx = RAG_flow.RunContext()
+    ctx.evidence_store.fused_info = "上一轮融合结果"
+
+    assert engine._best_effort_response("q", PACKED_EVIDENCE, ctx) == "上一轮融合结果"
+
+    ctx.evidence_store.fused_info = None
+    assert engine._best_effort_response("q", PACKED_EVIDENCE, ctx) == RAG_flow._GENERATION_FAILED_RESPONSE
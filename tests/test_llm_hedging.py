@@ -0,0 +1,44 @@
+"""LLM 对冲：主请求走共享连接池，只有对冲请求使用临时 Session。"""
+
+import threading
+import time
+
+import requests
+
+from app.service import llm_hedging, llm_scheduler
+from app.service.rag import RAG_flow
+
+
+class _Response:
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"choices": [{"message": {"content": "ok"}}], "usage": {}}
+
+
+def test_primary_uses_pooled_session_and_hedge_a_throwaway_one(monkeypatch):
+    policy = llm_hedging.HedgePolicy(enabled=True, budget_ratio=1.0, min_samples=1, min_delay_ms=10.0)
+    policy.observe("judge", 10.0)
+    policy.observe("judge", 10.0)
+    monkeypatch.setattr(llm_hedging, "get_hedge_policy", lambda: policy)
+    client = RAG_flow.DeepSeekClient("key", "http://llm.invalid", "model")
+    sessions = []
+    primary_done = threading.Event()
+
+    def post(session, *args, **kwargs):
+        sessions.append(session)
+        if session is client._session:
+            time.sleep(0.3)  # 慢主请求，触发对冲
+            primary_done.set()
+        return _Response()
+
+    monkeypatch.setattr(requests.Session, "post", post)
+
+    assert client.chat_completion([{"role": "user", "content": "x"}], stage="judge") == "ok"
+    assert sessions[0] is client._session
+    assert len(sessions) == 2 and sessions[1] is not client._session
+    # 落败的主请求结束后归还名额
+    assert primary_done.wait(2)
+    time.sleep(0.05)
+    assert llm_scheduler.get_scheduler().stats()["in_flight"] == 0
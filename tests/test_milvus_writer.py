@@ -0,0 +1,94 @@
+"""MilvusWriteBuffer：按文件切批与失败隔离；FlushPolicy：按变更条数 / 间隔决定 flush。"""
+
+import threading
+
+from app.service.milvus_writer import FlushPolicy, MilvusWriteBuffer, estimate_record_bytes
+
+
+def _records(owner, n):
+    return [{"id": f"{owner}-{i}", "text": "x"} for i in range(n)]
+
+
+def test_file_never_split_across_inserts():
+    batches = []
+    buffer = MilvusWriteBuffer("c", lambda _, recs: batches.append([r["id"] for r in recs]), max_records=5)
+    for owner, n in (("a", 3), ("b", 3), ("c", 4)):
+        buffer.add(_records(owner, n), owner=owner)
+    buffer.write_pending()
+
+    assert [len(b) for b in batches] == [3, 3, 4]
+    for batch in batches:
+        assert len({rid.split("-")[0] for rid in batch}) == 1
+    assert buffer.total_records == 10
+
+
+def test_oversized_file_written_as_one_batch():
+    batches = []
+    buffer = MilvusWriteBuffer("c", lambda _, recs: batches.append(len(recs)), max_records=2)
+    buffer.add(_records("a", 5), owner="a")
+    buffer.write_pending()
+    assert batches == [5]
+
+
+def test_failed_batch_marks_only_its_owners():
+    def insert(_, recs):
+        if any(r["id"].startswith("bad") for r in recs):
+            raise RuntimeError("boom")
+
+    buffer = MilvusWriteBuffer("c", insert, max_records=2)
+    buffer.add(_records("ok1", 2), owner="ok1")
+    buffer.add(_records("bad", 2), owner="bad")
+    buffer.add(_records("ok2", 2), owner="ok2")
+    buffer.write_pending()
+
+    assert set(buffer.failed()) == {"bad"}
+    assert buffer.total_records == 4
+
+
+def test_concurrent_buffers_isolate_failures():
+    """并发的写入方各用一个缓冲：一方失败不会波及另一方，也不会写出另一方的记录。"""
+    lock = threading.Lock()
+    written = []
+    barrier = threading.Barrier(2)
+
+    def insert(_, recs):
+        barrier.wait(timeout=5)
+        if any(r["id"].startswith("bad") for r in recs):
+            raise RuntimeError("boom")
+        with lock:
+            written.extend(r["id"] for r in recs)
+
+    results = {}
+
+    def worker(owner):
+        buffer = MilvusWriteBuffer("c", insert, max_records=100)
+        buffer.add(_records(owner, 3), owner=owner)
+        buffer.write_pending()
+        results[owner] = buffer.failed()
+
+    threads = [threading.Thread(target=worker, args=(owner,)) for owner in ("good", "bad")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results["good"] == {}
+    assert set(results["bad"]) == {"bad"}
+    assert sorted(written) == [f"good-{i}" for i in range(3)]
+
+
+def test_flush_policy_by_pending_count_and_interval(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.service.milvus_writer.time.monotonic", lambda: now[0])
+    policy = FlushPolicy(interval_s=60.0, max_pending=10)
+
+    assert policy.note("c", 6) is False
+    assert policy.note("c", 4) is True  # 累计达到 max_pending，计数清零
+    assert policy.note("c", 9) is False
+    now[0] += 61.0
+    assert policy.note("c", 1) is True  # 距上次 flush 超过间隔
+    assert policy.note("other", 9) is False  # 按集合分别计数
+
+
+def test_estimate_record_bytes():
+    assert estimate_record_bytes({"text": "中文", "vec": [0.0] * 4, "n": 1}) == 6 + 16 + 8
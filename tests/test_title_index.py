@@ -0,0 +1,94 @@
+"""title_index：标题匹配方式与后台重建。"""
+
+import threading
+import time
+
+from app.service import doc_metadata, retrieval_service, title_index
+
+TITLES = {
+    1: "3D-MVP: 3D Multiview Pretraining for Robotic Manipulation",
+    2: "ACAttack: Adaptive Cross Attacking RGB-T Tracker",
+}
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_fuzzy_matches_are_not_filters():
+    index = title_index.TitleIndex()
+    for doc_id, title in TITLES.items():
+        index.add(doc_id, title)
+
+    strict = index.resolve_query("论文《3D-MVP：…》中 s 是多少")
+    assert strict["doc_ids"] == [1] and strict["fuzzy_doc_ids"] == []
+
+    fuzzy = index.resolve_query("《Multiview Pretraining for Robotic》")
+    assert fuzzy["doc_ids"] == [] and fuzzy["fuzzy_doc_ids"] == [1]
+
+
+def test_rebuild_in_background_keeps_serving_old_index(monkeypatch):
+    collection = "test_title_index_rebuild"
+    gate = threading.Event()
+
+    def loader():
+        gate.wait(5)
+        return list(TITLES.items())
+
+    # 首次加载在后台进行，完成前返回 None；加载期间写入的文档会补到新索引
+    assert title_index.get_title_index(collection, loader) is None
+    title_index.note_document_written(collection, 9, "Written During Load")
+    gate.set()
+    _wait_for(lambda: title_index.get_title_index(collection, loader) is not None)
+    first = title_index.get_title_index(collection, loader)
+    assert first.lookup("Written During Load") == ([9], "exact")
+
+    # TTL 到期：立即返回旧索引，后台重建完成后替换
+    monkeypatch.setenv("RAG_TITLE_INDEX_TTL_S", "0")
+    gate.clear()
+    assert title_index.get_title_index(collection, loader) is first
+    title_index.note_document_deleted(collection, 2)
+    gate.set()
+    _wait_for(lambda: title_index._indexes[collection] is not first)
+    assert title_index._indexes[collection].lookup(TITLES[2]) == ([], None)
+
+
+class _FakeCollection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def query(self, expr, output_fields, offset=0, limit=16384):
+        return [{k: r[k] for k in output_fields} for r in self.rows[offset:offset + limit]]
+
+
+def test_loader_reads_chunk_collection_when_docs_collection_is_partial(monkeypatch):
+    # 文档级集合后建，只有升级后入库的文档 2；默认布局下标题仍从 chunk 集合读取
+    collections = {
+        "papers": _FakeCollection([{"doc_id": 1, "title": TITLES[1]}] * 3 + [{"doc_id": 2, "title": TITLES[2]}]),
+        doc_metadata.docs_collection_name("papers"): _FakeCollection([{"id": 2, "title": TITLES[2]}]),
+    }
+    monkeypatch.setattr("pymilvus.Collection", lambda name, using=None: collections[name])
+    monkeypatch.setattr(retrieval_service, "_get_milvus_connection_params", lambda: None)
+
+    monkeypatch.setenv("MILVUS_CHUNK_LAYOUT", "denormalized")
+    assert sorted(retrieval_service._load_title_entries("papers")) == sorted(TITLES.items())
+    monkeypatch.setenv("MILVUS_CHUNK_LAYOUT", "normalized")
+    assert list(retrieval_service._load_title_entries("papers")) == [(2, TITLES[2])]
+
+
+def test_fuzzy_paper_title_is_not_a_hard_filter(monkeypatch):
+    index = title_index.TitleIndex()
+    for doc_id, title in TITLES.items():
+        index.add(doc_id, title)
+    monkeypatch.setattr(retrieval_service, "_get_title_index", lambda: index)
+    monkeypatch.setenv("MILVUS_CHUNK_LAYOUT", "denormalized")
+
+    strict = retrieval_service._build_metadata_filter(paper_title=TITLES[2])
+    assert strict == "doc_id == 2"
+
+    fuzzy = retrieval_service._build_metadata_filter(paper_title="Multiview Pretraining for Robotic")
+    assert "doc_id" not in fuzzy
+    assert fuzzy == 'title like "%Multiview Pretraining for Robotic%"'